@@ -0,0 +1,146 @@
+import collections
+import sys
+import threading
+import time
+import traceback
+
+
+class EventStats:
+    __slots__ = ('count', 'total_time', 'max_time')
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def add(self, duration):
+        self.count += 1
+        self.total_time += duration
+        self.max_time = max(self.max_time, duration)
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total_time': self.total_time,
+            'max_time': self.max_time,
+            'avg_time': self.total_time / self.count if self.count else 0.0,
+        }
+
+
+class GameActor:
+    """
+    Serialises all events of one game: client messages, timer callbacks and disconnects.
+
+    An event is processed in the thread that submits it, after all events submitted before it are done. Threads
+    that submit events meanwhile wait in the mailbox. Events of different games do not wait for each other.
+    An event submitted while processing another event of the same game (e.g. a disconnect that stops the game)
+    is processed immediately.
+
+    Timer callbacks do not wait (see submit()): if the game is busy, they are queued and processed by the thread
+    that holds the game, so the single scheduler thread never blocks on one game while timers of other games are due.
+    """
+    def __init__(self, name=None):
+        self.name = name
+        self._lock = threading.Lock()
+        self._mailbox_lock = threading.Lock()
+        self._owner = None
+        self._queue_depth = 0
+        self.max_queue_depth = 0
+        self._event_stats = {}  # maps event names to EventStats
+        self._pending = collections.deque()  # submitted (event, func, args), that wait for the game
+
+    def run(self, event, func, *args):
+        """
+        Processes func(*args) as event of this game.
+
+        :param event: Name of the event for the statistics
+        :return: The return value of func
+        """
+        if self._owner == threading.get_ident():
+            return func(*args)
+
+        with self._mailbox_lock:
+            self._queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self._queue_depth)
+        self._lock.acquire()
+        with self._mailbox_lock:
+            self._queue_depth -= 1
+        self._owner = threading.get_ident()
+        try:
+            return self._process(event, func, args)
+        finally:
+            self._release()
+
+    def submit(self, event, func, *args):
+        """
+        Processes func(*args) as event of this game without waiting. If another thread processes an event of this
+        game, func runs in that thread after its event. Exceptions of func are printed.
+
+        :param event: Name of the event for the statistics
+        """
+        if self._owner == threading.get_ident():
+            self._process_submitted(event, func, args)
+            return
+        with self._mailbox_lock:
+            self._pending.append((event, func, args))
+            self._queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self._queue_depth)
+        if self._lock.acquire(blocking=False):
+            self._owner = threading.get_ident()
+            self._release()
+
+    def callback(self, event, func):
+        """
+        :return: A callable, that submits func(*args) as event of this game, e.g. for timers
+        """
+        def submit_event(*args):
+            self.submit(event, func, *args)
+        return submit_event
+
+    def _process(self, event, func, args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            duration = time.perf_counter() - start
+            stats = self._event_stats.get(event)
+            if stats is None:
+                stats = self._event_stats[event] = EventStats()
+            stats.add(duration)
+
+    def _process_submitted(self, event, func, args):
+        try:
+            self._process(event, func, args)
+        except Exception:
+            print('ERROR: event {} of game {} failed'.format(event, self.name), file=sys.stderr)
+            traceback.print_exc()
+
+    def _release(self):
+        """
+        Processes the submitted events and releases the game. Checks for events again after releasing, because a
+        submit, that did not get the game, relies on the owner to process its event.
+        """
+        while True:
+            while self._pending:
+                with self._mailbox_lock:
+                    event, func, args = self._pending.popleft()
+                    self._queue_depth -= 1
+                self._process_submitted(event, func, args)
+            self._owner = None
+            self._lock.release()
+            if not self._pending or not self._lock.acquire(blocking=False):
+                return
+            self._owner = threading.get_ident()
+
+    def queue_depth(self) -> int:
+        """
+        :return: The number of events waiting to be processed
+        """
+        return self._queue_depth
+
+    def stats(self):
+        return {
+            'queue_depth': self._queue_depth,
+            'max_queue_depth': self.max_queue_depth,
+            'events': {event: stats.to_dict() for event, stats in self._event_stats.items()},
+        }
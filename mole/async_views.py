@@ -0,0 +1,65 @@
+"""
+socket.io server for ASGI deployments (see mole_backend.asgi).
+
+It registers the same event handlers and runs the same game engine (mole.server) as the WSGI server in mole.views,
+but with a socketio.AsyncServer, a scheduler in the event loop and blocking database work in a thread pool.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .evidence_catalog import evidence_catalog
+from .scheduler import AsyncScheduler
+from .serializers import AsyncSerializingServer, get_json_module
+from .server import GameServer
+from .sharding import ShardConfig
+from .socket_events import SocketEvents
+from .transport import AsyncSocketIOTransport
+
+shard_config = ShardConfig.from_settings()
+asio = AsyncSerializingServer(
+    async_mode='asgi', cors_allowed_origins='*', json=get_json_module(settings.WIRE_JSON_SERIALIZER),
+    client_manager=shard_config.create_client_manager(async_mode=True)
+)
+transport = AsyncSocketIOTransport(asio)
+scheduler = AsyncScheduler(after_run=transport.drain)
+server = GameServer(transport, scheduler, shard_config)
+games = server.games
+keep_alive = server.keep_alive
+restore_games = server.restore_games
+events = server.events
+orm_executor = ThreadPoolExecutor(max_workers=settings.GAME_DB_POOL_SIZE, thread_name_prefix='orm')
+
+
+async def run_blocking(func, *args):
+    """
+    Runs func(*args) in the thread pool for database work.
+    """
+    return await asyncio.get_running_loop().run_in_executor(orm_executor, functools.partial(func, *args))
+
+
+# Database work an event needs, done in the thread pool before the handler runs in the event loop
+_BLOCKING_PREPARATION = {
+    'start_game': evidence_catalog.load,
+}
+
+
+def _async_handler(event):
+    handler = getattr(events, event)
+    preparation = _BLOCKING_PREPARATION.get(event)
+
+    @functools.wraps(handler)
+    async def async_handler(*args):
+        if preparation is not None:
+            await run_blocking(preparation)
+        with transport.batch():
+            result = handler(*args)
+        await transport.drain()
+        return result
+    return async_handler
+
+
+for _event in SocketEvents.EVENTS:
+    asio.on(_event, _async_handler(_event))
@@ -0,0 +1,293 @@
+"""
+Micro benchmarks for hot paths of the game engine. Run them with `python manage.py benchmark [suite ...]`.
+"""
+import contextlib
+import io
+import json
+import random
+import time
+import timeit
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from copy import deepcopy
+
+from . import game as game_module, serializers, snapshot
+from .journal import EventJournal
+from .clues import Clue, InventoryClue
+from .evidence_catalog import SOLUTION_CLUE_TYPES
+from .game import Game, InvalidMessageException, _pack_rng_state
+from .map import DEFAULT_MAP_ID
+from .models import ClueType, ClueSubtype
+from .replay import replay_journal
+from .scheduler import Scheduler
+from .sharding import ShardConfig
+from .transport import NullTransport
+
+
+def _measure(func, number):
+    """
+    :return: A tuple (microseconds per call, allocated memory blocks per call)
+    """
+    seconds = min(timeit.repeat(func, number=number, repeat=3))
+
+    tracemalloc.start()
+    try:
+        snapshot_before = tracemalloc.take_snapshot()
+        results = [func() for _ in range(100)]
+        snapshot_after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    del results
+    blocks = sum(stat.count_diff for stat in snapshot_after.compare_to(snapshot_before, 'filename'))
+
+    return seconds / number * 1e6, blocks / 100
+
+
+class _LegacyClue:
+    """
+    The clue representation before clues were split into Clue and InventoryClue. Used as benchmark baseline.
+    """
+    def __init__(self, name, main_type, subtype, received_from=-1):
+        self.name = name
+        self.main_type = main_type
+        self.subtype = subtype
+        self.received_from = received_from
+        self.sent_to = []
+
+    def to_dict(self):
+        d = deepcopy(self.__dict__)
+        d['type'] = d['main_type']
+        del d['main_type']
+        return d
+
+
+def bench_clue_serialisation(number=20000):
+    legacy_clue = _LegacyClue('Knife', ClueType.WEAPON, ClueSubtype.OBJECT, received_from=1)
+    legacy_clue.sent_to.extend([2, 3])
+
+    inventory_clue = InventoryClue(Clue('Knife', ClueType.WEAPON, ClueSubtype.OBJECT), received_from=1)
+    inventory_clue.sent_to.extend([2, 3])
+
+    assert legacy_clue.to_dict() == inventory_clue.to_dict()
+
+    results = {}
+    for name, func in (('deepcopy to_dict', legacy_clue.to_dict), ('slotted to_dict', inventory_clue.to_dict)):
+        results[name] = _measure(func, number)
+    return results
+
+
+def _wire_payloads():
+    """
+    :return: Payloads shaped like the real init, validation_result, pantomime_result and receive_clue messages
+    """
+    clues = [
+        InventoryClue(Clue(name, main_type, subtype), received_from=received_from).to_dict()
+        for name, main_type, subtype, received_from in (
+            ('Messer', ClueType.WEAPON, ClueSubtype.OBJECT, -1),
+            ('Rot', ClueType.WEAPON, ClueSubtype.COLOR_W, 2),
+            ('Bahnhof', ClueType.CRIME_SCENE, ClueSubtype.LOCATION, -1),
+            ('Montag', ClueType.TIME_OF_CRIME, ClueSubtype.WEEKDAY, 3),
+            ('Fahrrad', ClueType.MEANS_OF_ESCAPE, ClueSubtype.MODEL, -1),
+            ('Hut', ClueType.OFFENDER, ClueSubtype.CLOTHING, 1),
+        )
+    ]
+    proofed_types = [{'type': ClueType.WEAPON, 'from': 2}, {'type': ClueType.TIME_OF_CRIME, 'from': 0}]
+    return {
+        'init': {
+            'player_id': 1, 'is_mole': False, 'map': None, 'clue': clues[0], 'clues': clues, 'rejoin': True,
+            'proofed_types': proofed_types,
+        },
+        'validation_result': {
+            'successful_validation': True, 'validation_status': 'new_validation', 'player_id': 1,
+            'clues': clues[:3], 'proofed_types': proofed_types,
+        },
+        'pantomime_result': {
+            'success': True,
+            'player_results': [
+                {'player_id': player_id, 'success': player_id != 3, 'guess': 'Elefant', 'ignored': False}
+                for player_id in range(8)
+            ],
+            'solution_word': 'Elefant',
+        },
+        'receive_clue': {'clue': clues[1]},
+    }
+
+
+def bench_wire_serialisers(number=5000):
+    codecs = [('json', json.dumps, json.loads)]
+    if serializers.orjson is not None:
+        orjson_module = serializers.get_json_module(serializers.ORJSON)
+        codecs.append(('orjson', orjson_module.dumps, orjson_module.loads))
+    if serializers.msgpack_available():
+        codecs.append(('msgpack', serializers.msgpack.packb, serializers.msgpack.unpackb))
+
+    results = {}
+    for event, payload in _wire_payloads().items():
+        for codec_name, dumps, loads in codecs:
+            encoded = dumps(payload)
+            assert loads(encoded) == payload
+            results['{} {} encode'.format(event, codec_name)] = _measure(lambda: dumps(payload), number)
+            results['{} {} decode'.format(event, codec_name)] = _measure(lambda: loads(encoded), number)
+    return results
+
+
+def _late_game_state():
+    """
+    :return: A Game.snapshot_state() of an 8 player game, where every player holds most solution clues
+    """
+    solution = [
+        ('Clue{}'.format(i), str(main_type), str(subtype)) for i, (main_type, subtype) in enumerate(SOLUTION_CLUE_TYPES)
+    ]
+    players = tuple(
+        (
+            player_id, 'Player{}'.format(player_id), 'sid{}'.format(player_id), player_id == 0, False,
+            tuple(
+                (name, main_type, subtype, (player_id + i) % 8 if i % 3 else -1, (i % 8,) if i % 2 else ())
+                for i, (name, main_type, subtype) in enumerate(solution)
+                if (i + player_id) % 4
+            ),
+        )
+        for player_id in range(8)
+    )
+    occasion_choices = [{'type': 'clue'}, {'type': 'move', 'distance': 2}]
+    return (
+        '1234', 'host_sid', DEFAULT_MAP_ID, 0, True, None, 40, 12, 0, (3, 1, occasion_choices), None,
+        {'easy': {'danger': 1}}, tuple(solution), players, ((str(ClueType.WEAPON), 2),), (), 12.5, None,
+        42, _pack_rng_state(random.Random(42)),
+    )
+
+
+def bench_snapshots(number=5000):
+    game = Game.from_snapshot_state(_late_game_state(), NullTransport())
+    data = snapshot.encode_snapshot(game)
+    assert snapshot.decode_snapshot(data) == game.snapshot_state()
+
+    return {
+        'encode ({} bytes)'.format(len(data)): _measure(lambda: snapshot.encode_snapshot(game), number),
+        'decode': _measure(lambda: snapshot.decode_snapshot(data), number),
+        'decode and restore game': _measure(lambda: snapshot.restore_snapshot(data, NullTransport()), number),
+    }
+
+
+def _play_scripted_game(token='1234', num_events=500, seed=0, journal=None) -> int:
+    """
+    Plays a scripted 4 player game on the hard difficulty, with dice, searches and occasions.
+
+    :return: The number of events the game handled
+    """
+    policy = random.Random(seed)
+    clock = [0.0]
+    scheduler = Scheduler(clock=lambda: clock[0])
+    transport = NullTransport()
+    solution = [
+        Clue('Clue{}'.format(i), main_type, subtype) for i, (main_type, subtype) in enumerate(SOLUTION_CLUE_TYPES)
+    ]
+    player_infos = [{'player_id': i, 'name': 'Player{}'.format(i), 'sid': 'sid{}'.format(i)} for i in range(4)]
+    game = Game(
+        transport, token, 'host', player_infos, None, difficulty='hard', scheduler=scheduler,
+        solution_clues=solution, journal=journal, seed=seed
+    )
+
+    events = 0
+    for _ in range(num_events):
+        state = game.turn_state.player_turn_state.name
+        if state == 'GAME_OVER':
+            break
+        player = game.get_current_player()
+        sid = player.sid
+        try:
+            if state == 'PLAYER_CHOOSING_OCCASION':
+                choice = dict(game.turn_state.occasion_choices[0], success=True, player_id=(player.player_id + 1) % 4)
+                game.player_occasion_choice(transport, sid, choice)
+            elif policy.random() < 0.6:
+                game.player_choice(transport, sid, {'type': 'dice', 'value': policy.randint(1, 6)})
+            else:
+                game.player_choice(transport, sid, {'type': 'search-clue', 'success': True})
+        except InvalidMessageException:
+            pass
+        events += 1
+        clock[0] += policy.random() * 10
+        scheduler.run_due()
+    game.stop()
+    return events
+
+
+def _record_journal(num_events=500, seed=0):
+    """
+    :return: The journal of a scripted game, see _play_scripted_game
+    """
+    journal = EventJournal()
+    _play_scripted_game(num_events=num_events, seed=seed, journal=journal)
+    return journal.getvalue()
+
+
+@contextlib.contextmanager
+def _game_output_disabled():
+    """
+    Replaces print in mole.game with a function, that discards its arguments, so the measured code does no output.
+    """
+    game_module.print = lambda *_args, **_kwargs: None
+    try:
+        yield
+    finally:
+        del game_module.print
+
+
+def bench_journal_replay(number=20):
+    with _game_output_disabled():
+        data = _record_journal()
+        replay = replay_journal(data)
+        results = {
+            'replay ({} events, {} bytes)'.format(replay.num_events, len(data)): _measure(
+                lambda: replay_journal(data), number
+            ),
+        }
+    return results
+
+
+def _play_shard(index, count, num_games) -> int:
+    """
+    Plays num_games scripted games with tokens of worker index of count workers.
+
+    :return: The number of events the games handled
+    """
+    allocator = ShardConfig(index, count).token_allocator(1000, 10000)
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        return sum(_play_scripted_game(str(allocator.acquire()), seed=seed) for seed in range(num_games))
+
+
+def bench_shards(games_per_worker=200, worker_counts=(1, 2, 4)):
+    """
+    Throughput of a sharded deployment without the message queue: every worker process plays games_per_worker games
+    with its own tokens. The time per event shrinks with the workers as long as there is a free cpu core for each.
+    """
+    results = {}
+    for count in worker_counts:
+        with ProcessPoolExecutor(max_workers=count) as executor:
+            # start the processes before measuring
+            list(executor.map(_play_shard, range(count), [count] * count, [1] * count))
+            start = time.perf_counter()
+            events = sum(executor.map(_play_shard, range(count), [count] * count, [games_per_worker] * count))
+            seconds = time.perf_counter() - start
+        name = '{} workers, {:.0f} events/s'.format(count, events / seconds)
+        results[name] = (seconds / events * 1e6, None)
+    return results
+
+
+SUITES = {
+    'clues': bench_clue_serialisation,
+    'serializers': bench_wire_serialisers,
+    'snapshots': bench_snapshots,
+    'journal': bench_journal_replay,
+    'shards': bench_shards,
+}
+
+
+def run(suite_names=None, out=print):
+    for suite_name in suite_names or SUITES.keys():
+        out('{}:'.format(suite_name))
+        for name, (micro_seconds, blocks) in SUITES[suite_name]().items():
+            line = '  {:<36} {:>10.2f} us/call'.format(name, micro_seconds)
+            if blocks is not None:
+                line += ' {:>8.1f} memory blocks/call'.format(blocks)
+            out(line)
@@ -1,19 +1,23 @@
+import sys
 from typing import List, Dict
-from copy import deepcopy
 
 from mole.models import Evidence
 
 
 class Clue:
-    def __init__(self, name, main_type, subtype, received_from=-1, sent_to=None):
-        self.name = name
-        self.main_type = main_type
-        self.subtype = subtype
-        self.received_from = received_from
-        self.sent_to = []
+    """
+    The immutable catalog data of a clue. Clues of the evidence catalog are shared by all games.
+    Per player information is stored in InventoryClue.
+    """
+    __slots__ = ('name', 'main_type', 'subtype')
 
-        if sent_to is not None:
-            self.sent_to.append(sent_to)
+    def __init__(self, name, main_type, subtype):
+        object.__setattr__(self, 'name', name)
+        object.__setattr__(self, 'main_type', main_type)
+        object.__setattr__(self, 'subtype', subtype)
+
+    def __setattr__(self, key, value):
+        raise AttributeError('Clue is immutable')
 
     def __eq__(self, other):
         if not isinstance(other, Clue):
@@ -22,14 +26,65 @@ class Clue:
             return True
         return self.name == other.name and self.main_type == other.main_type and self.subtype == other.subtype
 
+    def __hash__(self):
+        return hash((self.name, self.main_type, self.subtype))
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'type': self.main_type,
+            'subtype': self.subtype,
+            'received_from': -1,
+            'sent_to': [],
+        }
+
+    def __repr__(self):
+        return 'Clue(name={}  type={}  subtype={})'.format(self.name, self.main_type, self.subtype)
+
+
+class InventoryClue:
+    """
+    A clue in the inventory of a player together with the information, from whom the player got it and with whom
+    the player shared it.
+    """
+    __slots__ = ('clue', 'received_from', 'sent_to')
+
+    def __init__(self, clue: Clue, received_from=-1):
+        self.clue = clue
+        self.received_from = received_from  # player_id or -1
+        self.sent_to = []  # type: List[int]
+
+    @property
+    def name(self):
+        return self.clue.name
+
+    @property
+    def main_type(self):
+        return self.clue.main_type
+
+    @property
+    def subtype(self):
+        return self.clue.subtype
+
     def to_dict(self):
-        d = deepcopy(self.__dict__)
-        d['type'] = d['main_type']
-        del d['main_type']
-        return d
+        clue = self.clue
+        return {
+            'name': clue.name,
+            'type': clue.main_type,
+            'subtype': clue.subtype,
+            'received_from': self.received_from,
+            'sent_to': self.sent_to.copy(),
+        }
+
+    def __repr__(self):
+        return 'InventoryClue(name={}  received_from={}  sent_to={})'.format(
+            self.clue.name, self.received_from, self.sent_to
+        )
 
 
 class Proof:
+    __slots__ = ('main_type', 'validation_player')
+
     def __init__(self, main_type, validation_player):
         self.main_type = main_type
         self.validation_player = validation_player
@@ -44,7 +99,7 @@ def evidence_2_clue(evidence: Evidence) -> Clue:
 
     :param evidence: The evidence to convert
     """
-    return Clue(name=evidence.name, main_type=evidence.type, subtype=evidence.subtype)
+    return Clue(name=sys.intern(evidence.name), main_type=evidence.type, subtype=evidence.subtype)
 
 
 def clues_dict_2_object(clues: List[Dict[str, str]]) -> List[Clue]:
@@ -0,0 +1,125 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+
+# Alias under which a pooled connection is visible to the ORM while it is checked out,
+# e.g. Evidence.objects.using(POOL_ALIAS)
+POOL_ALIAS = 'game_pool'
+
+# the connection installed as POOL_ALIAS in the current thread, None if there is none
+_installed = threading.local()
+
+
+class ConnectionPool:
+    """
+    A bounded pool of reusable database connections for the game engine.
+
+    At most `size` connections are opened to the database of `alias`. A checked out connection is
+    installed as `POOL_ALIAS` for the current thread, so the ORM can use it via `.using(alias)`.
+    Connections are kept open when they are returned and are only closed, if they are unusable or
+    exceed CONN_MAX_AGE.
+    """
+    def __init__(self, size=None, timeout=None, alias=DEFAULT_DB_ALIAS):
+        self.size = size if size is not None else getattr(settings, 'GAME_DB_POOL_SIZE', 2)
+        self.timeout = timeout if timeout is not None else getattr(settings, 'GAME_DB_POOL_TIMEOUT', 10.0)
+        self._alias = alias
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+
+        # metrics
+        self.num_acquired = 0
+        self.num_waited = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def _create_connection(self):
+        wrapper = connections.create_connection(self._alias)
+        # a pooled connection is used by one thread at a time, but not always by the same thread
+        wrapper.inc_thread_sharing()
+        return wrapper
+
+    def _checkout(self, timeout):
+        try:
+            return self._idle.get_nowait(), False
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return self._create_connection(), False
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=timeout), True
+        except queue.Empty:
+            raise ConnectionPoolTimeoutException(
+                'No database connection available after {:.1f} seconds (pool size: {})'.format(timeout, self.size)
+            )
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """
+        Checks out a connection for the duration of the with block. A nested checkout in the same thread gets
+        another connection and installs the outer connection as POOL_ALIAS again, when it ends.
+
+        :param timeout: Seconds to wait for a free connection. Defaults to the pool timeout.
+        :return: The database alias to use for queries inside the with block
+        """
+        start = time.monotonic()
+        wrapper, waited = self._checkout(self.timeout if timeout is None else timeout)
+        wait_time = time.monotonic() - start
+
+        with self._lock:
+            self.num_acquired += 1
+            if waited:
+                self.num_waited += 1
+            self.total_wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+        previous = getattr(_installed, 'wrapper', None)
+        connections[POOL_ALIAS] = _installed.wrapper = wrapper
+        try:
+            yield POOL_ALIAS
+        finally:
+            _installed.wrapper = previous
+            if previous is None:
+                del connections[POOL_ALIAS]
+            else:
+                connections[POOL_ALIAS] = previous
+            wrapper.close_if_unusable_or_obsolete()
+            self._idle.put(wrapper)
+
+    def stats(self):
+        idle = self._idle.qsize()
+        return {
+            'size': self.size,
+            'open': self._created,
+            'idle': idle,
+            'in_use': self._created - idle,
+            'acquired': self.num_acquired,
+            'waited': self.num_waited,
+            'total_wait_time': self.total_wait_time,
+            'max_wait_time': self.max_wait_time,
+            'avg_wait_time': self.total_wait_time / self.num_acquired if self.num_acquired else 0.0,
+        }
+
+
+class ConnectionPoolTimeoutException(Exception):
+    pass
+
+
+game_db_pool = ConnectionPool()
@@ -0,0 +1,92 @@
+import threading
+from typing import Dict, List, Tuple
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .clues import Clue, evidence_2_clue
+from .db_pool import game_db_pool
+from .models import Evidence, ClueType, ClueSubtype
+
+# The (type, subtype) groups a solution is drawn from, in the order the solution clues are generated
+SOLUTION_CLUE_TYPES = [
+    (ClueType.WEAPON, ClueSubtype.OBJECT),
+    (ClueType.WEAPON, ClueSubtype.COLOR_W),
+    (ClueType.WEAPON, ClueSubtype.CONDITION),
+    (ClueType.CRIME_SCENE, ClueSubtype.LOCATION),
+    (ClueType.CRIME_SCENE, ClueSubtype.TEMPERATURE),
+    (ClueType.CRIME_SCENE, ClueSubtype.DISTRICT),
+    (ClueType.OFFENDER, ClueSubtype.CLOTHING),
+    (ClueType.OFFENDER, ClueSubtype.SIZE),
+    (ClueType.OFFENDER, ClueSubtype.CHARACTERISTIC),
+    (ClueType.TIME_OF_CRIME, ClueSubtype.WEEKDAY),
+    (ClueType.TIME_OF_CRIME, ClueSubtype.DAYTIME),
+    (ClueType.TIME_OF_CRIME, ClueSubtype.TIME),
+    (ClueType.MEANS_OF_ESCAPE, ClueSubtype.MODEL),
+    (ClueType.MEANS_OF_ESCAPE, ClueSubtype.COLOR_ME),
+    (ClueType.MEANS_OF_ESCAPE, ClueSubtype.ESCAPE_ROUTE),
+]
+
+
+class EvidenceCatalog:
+    """
+    Process wide in-memory copy of the Evidence table as clues, grouped by (type, subtype).
+    The clues are shared by all games.
+
+    The table is loaded on first use and dropped whenever an Evidence row is saved or deleted,
+    so the next access reloads it. Between changes no database queries are made.
+    """
+    def __init__(self):
+        self._groups = None  # type: Dict[Tuple[str, str], List[Clue]] or None
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.load_count = 0
+
+    def _load(self) -> Dict[Tuple[str, str], List[Clue]]:
+        groups = {}
+        with game_db_pool.connection() as db_alias:
+            for evidence in Evidence.objects.using(db_alias).all():
+                groups.setdefault((evidence.type, evidence.subtype), []).append(evidence_2_clue(evidence))
+        self.load_count += 1
+        return groups
+
+    def _get_groups(self):
+        groups = self._groups
+        if groups is None:
+            with self._lock:
+                groups = self._groups
+                if groups is None:
+                    generation = self._generation
+                    groups = self._load()
+                    # do not keep the result, if the table changed while loading
+                    if generation == self._generation:
+                        self._groups = groups
+        return groups
+
+    def get(self, clue_type, clue_subtype) -> List[Clue]:
+        """
+        :return: The clues of all evidences with the given type and subtype. The returned list must not be modified.
+        """
+        return self._get_groups().get((clue_type, clue_subtype), [])
+
+    def load(self):
+        """
+        Loads the catalog, if it is not loaded yet. Lets async servers query the database outside the event loop.
+        """
+        self._get_groups()
+
+    def invalidate(self):
+        self._generation += 1
+        self._groups = None
+
+    def is_loaded(self):
+        return self._groups is not None
+
+
+evidence_catalog = EvidenceCatalog()
+
+
+@receiver(post_save, sender=Evidence)
+@receiver(post_delete, sender=Evidence)
+def _invalidate_evidence_catalog(**_kwargs):
+    evidence_catalog.invalidate()
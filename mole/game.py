@@ -1,27 +1,36 @@
 # -*- coding: utf-8 -*-
 import enum
 import itertools
+import struct
 import sys
 import time
-from copy import deepcopy
+from typing import Dict, FrozenSet, List
 import random
-import dj_database_url
-import requests
-from django.db import connections
 
 from .occasions import _random_occasion_choices
 from .turn_state import TurnState, GameOverReason, MoveModifier
-from .map import Field, FieldType, create_map, pyllist
-from .clues import Clue, clues_dict_2_object, evidence_2_clue, Proof
-from .models import Evidence, ClueType, ClueSubtype
+from .map import Field, FieldType, create_map, CompiledMap, DEFAULT_MAP_ID
+from .actor import GameActor
+from .clues import Clue, InventoryClue, clues_dict_2_object, Proof
+from .evidence_catalog import evidence_catalog, SOLUTION_CLUE_TYPES
 from .game_character import *
-from mole_backend.settings import DATABASES
-from .pantomime import PANTOMIME_WORDS, PantomimeState
+from .journal import journaled
+from .pantomime import PANTOMIME_WORDS, PANTOMIME_DURATION, PantomimeState
+from .sampler import ClueSampler
+from .scheduler import TimerHandle
+from .transport import as_transport
 
 DEFAULT_START_POSITION = 4
 MORIARTY_AUTO_MOVE_INTERVAL = (30, 40)
-
-random.seed(time.time())
+# fields moriarty moves after a turn and their weights
+MORIARTY_STEPS = (0, 1, 2)
+MORIARTY_STEP_WEIGHTS = (5, 4, 1)
+# fields moriarty moves with a timed auto move and their weights
+MORIARTY_AUTO_STEPS = (1, 2)
+MORIARTY_AUTO_STEP_WEIGHTS = (4, 1)
+# verified proofs needed to win at the end of the map
+MOLE_WIN_PROOFS = 2
+TEAM_WIN_PROOFS = 4
 
 
 class DifficultyLevel(enum.Enum):
@@ -30,6 +39,32 @@ class DifficultyLevel(enum.Enum):
     HARD = 2
 
 
+# factors of MORIARTY_AUTO_MOVE_INTERVAL per difficulty, None disables the timed auto moves
+MORIARTY_AUTO_MOVE_FACTORS = {DifficultyLevel.EASY: None, DifficultyLevel.MEDIUM: 2.0, DifficultyLevel.HARD: 1.0}
+
+
+_RNG_STATE = struct.Struct('<625I')  # internal state of the Mersenne Twister of random.Random
+
+
+def _new_seed() -> int:
+    return random.SystemRandom().getrandbits(63)
+
+
+def _pack_rng_state(rng: random.Random) -> tuple:
+    version, internal_state, gauss_next = rng.getstate()
+    return version, _RNG_STATE.pack(*internal_state), gauss_next
+
+
+def _unpack_rng_state(state: tuple, rng: random.Random = None) -> random.Random:
+    """
+    :param rng: The generator that gets the state. Defaults to a new random.Random.
+    """
+    version, internal_state, gauss_next = state
+    rng = rng if rng is not None else random.Random()
+    rng.setstate((version, _RNG_STATE.unpack(internal_state), gauss_next))
+    return rng
+
+
 def _parse_difficulty(difficulty):
     for level in DifficultyLevel:
         if level.name.lower() == difficulty.lower():
@@ -40,17 +75,45 @@ def _parse_difficulty(difficulty):
 class Game:
     def __init__(
             self, sio, token, host_sid, player_infos, start_position, test_choices=None, all_proofs=False,
-            enable_minigames=False, moriarty_position=0, difficulty='easy'
+            enable_minigames=False, moriarty_position=0, difficulty='easy', scheduler=None, map_id=DEFAULT_MAP_ID,
+            solution_clues=None, journal=None, rng=None, seed=None
     ):
+        """
+        :param map_id: The id of the map in the map registry
+        :param scheduler: The Scheduler used for moriarty auto moves and pantomime timeouts.
+                          If None, no timed events happen.
+        :type scheduler: Scheduler or None
+        :param solution_clues: The solution clues. If None, they are drawn from the evidence catalog.
+        :param journal: Records the events and random draws of this game for a replay (see mole.replay)
+        :type journal: EventJournal or None
+        :param rng: The random number generator for all draws of this game. Defaults to a generator seeded with
+                    seed, whose draws are recorded in the journal, if there is one.
+        :type rng: random.Random or None
+        :param seed: The seed of the random number generator. Defaults to a random seed.
+        """
         self.host_sid = host_sid
+        self.host_connected = True
         self.token = token
-        self.sio = sio
+        self._init_runtime(sio, scheduler, journal)
+        self.seed = seed if seed is not None else _new_seed()
+        if rng is None:
+            rng = journal.create_random(self.seed) if journal is not None else random.Random(self.seed)
+        self.rng = rng  # all random draws of this game, games do not share random state
         self.test_choices = test_choices
         self.enable_minigames = enable_minigames
         self.difficulty = _parse_difficulty(difficulty)
 
         # Create Evidence combination
-        self.solution_clues = self.generate_solution_clues()
+        self.solution_clues = self.generate_solution_clues() if solution_clues is None else list(solution_clues)
+        self._index_solution()
+
+        if journal is not None:
+            journal.start(self.scheduler.clock if self.scheduler is not None else time.monotonic, (
+                token, host_sid, player_infos, start_position, test_choices, all_proofs, enable_minigames,
+                moriarty_position, difficulty, map_id,
+                tuple((clue.name, str(clue.main_type), str(clue.subtype)) for clue in self.solution_clues), self.seed,
+                _pack_rng_state(self.rng),
+            ))
 
         # TODO: Delete later. Frontend needs this for testing
         clues_dict = []
@@ -58,18 +121,22 @@ class Game:
             clues_dict.append(clue.to_dict())
         self.send_to_all(sio, 'solution_clues', {'clues': clues_dict})
 
+        self.clue_sampler = ClueSampler(self.solution_clues, range(len(player_infos)), self.rng)
         self.team_proofs = []  # type: List[Proof]
         self.mole_proofs = []  # type: List[Proof]
+        # proof index, only updated in add_verified_clues_to_proofs
+        self._verified_types = set()
+        self._proofed_types = []  # serialised team proofs followed by mole proofs
         self.players = []
 
-        # Deep copy of the array so that the clue can be deleted when it is assigned to the players.
+        # Copy of the array so that the clue can be deleted when it is assigned to the players.
         # This guarantees that each player is assigned a different proof
-        solution_clues_copy = deepcopy(self.solution_clues)
+        solution_clues_copy = list(self.solution_clues)
 
         for player_id, player_info in enumerate(player_infos):
             if all_proofs is None or all_proofs is False:
                 # Assign random clue
-                clue = random.choice(solution_clues_copy)
+                clue = self.rng.choice(solution_clues_copy)
                 self.players.append(
                     Player(player_id, player_info['name'], player_info['sid'], self.get_clue_by_name(clue.name))
                 )
@@ -77,10 +144,15 @@ class Game:
             else:
                 # Assign all clues
                 player = Player(player_id, player_info['name'], player_info['sid'])
-                player.inventory = deepcopy(self.solution_clues)
+                for clue in self.solution_clues:
+                    player.add_clue(-1, clue)
                 self.players.append(player)
 
-        random.choice(self.players).is_mole = True
+        for player in self.players:
+            for inventory_clue in player.inventory:
+                self.clue_sampler.add_clue(player.player_id, inventory_clue.clue)
+
+        self.rng.choice(self.players).is_mole = True
 
         self.turn_state: TurnState = TurnState()
         self.move_modifier: MoveModifier = MoveModifier.NORMAL
@@ -92,16 +164,18 @@ class Game:
             for category in category_list:
                 self.pantomime_category_count[difficulty][category] = 0
 
-        self.map = create_map()
+        self.map_id = map_id
+        self.map: CompiledMap = create_map(map_id)
         got_start_position = True if start_position is not None else False
         start_position = DEFAULT_START_POSITION if start_position is None else start_position
-        self.team_pos: pyllist.dllistnode = self.map.nodeat(start_position)
-        self.moriarty_pos: pyllist.dllistnode = self.map.nodeat(moriarty_position)
+        for position in (start_position, moriarty_position):
+            if not 0 <= position < len(self.map):
+                raise IndexError('Position {} is not on the map'.format(position))
+        self.team_pos: int = start_position
+        self.moriarty_pos: int = moriarty_position
         moriarty_move_interval = self._get_moriarty_move_interval()
-        if moriarty_move_interval is not None:
-            self.next_moriarty_move_time = time.time() + moriarty_move_interval
-        else:
-            self.next_moriarty_move_time = None
+        if moriarty_move_interval is not None and self.scheduler is not None:
+            self._moriarty_timer = self.scheduler.call_later(moriarty_move_interval, self._moriarty_callback)
 
         if moriarty_position != 0:
             self._send_moriarty_move(sio)
@@ -126,20 +200,219 @@ class Game:
 
         self.send_players_turn(sio)
 
+    def _init_runtime(self, sio, scheduler, journal=None):
+        """
+        Sets up the state that is not part of a snapshot: transport, actor, scheduler, journal and timers.
+        """
+        self.sio = as_transport(sio)  # used by timer callbacks
+        self.actor = GameActor(self.token)  # serialises all events of this game
+        self.scheduler = scheduler
+        self.journal = journal
+        self.on_turn_end = None  # optional callable, that gets the game after every turn, e.g. to write a snapshot
+        self._moriarty_timer = None  # type: TimerHandle or None
+        self._pantomime_timer = None  # type: TimerHandle or None
+        self._moriarty_callback = self.actor.callback('moriarty_auto_move', self._moriarty_auto_move)
+        self._pantomime_callback = self.actor.callback('pantomime_timeout', self._pantomime_timeout)
+        # seconds until the timers of a restored game fire, they are paused until a player rejoins
+        self._paused_moriarty_delay = None
+        self._paused_pantomime_delay = None
+
+    def _index_solution(self):
+        self._solution_by_name = {clue.name: clue for clue in self.solution_clues}  # type: Dict[str, Clue]
+        self._solution_by_type = {
+            main_type: frozenset(clue.name for clue in group)
+            for main_type, group in itertools.groupby(
+                sorted(self.solution_clues, key=lambda c: c.main_type), key=lambda c: c.main_type
+            )
+        }  # type: Dict[str, FrozenSet[str]]
+
     def send_ping(self, sio):
         sio.emit('ping', '', room=self.host_sid)
 
-    def tick(self, sio):
-        # check minigame time over
-        if self.turn_state.player_turn_state == TurnState.PlayerTurnState.PLAYING_MINIGAME:
-            if self.pantomime_state.is_timeout():
-                self.evaluate_pantomime(sio)
+    def _moriarty_auto_move(self):
+        """
+        Timer callback. Moves moriarty, if no minigame is played, and schedules the next auto move.
+        """
+        if self._timer_is_due(self._moriarty_timer):
+            self._moriarty_timer_fired()
+
+    @journaled(with_transport=False)
+    def _moriarty_timer_fired(self):
+        if self.turn_state.player_turn_state == TurnState.PlayerTurnState.GAME_OVER:
+            self._moriarty_timer = None
+            return
+
+        if self.turn_state.player_turn_state != TurnState.PlayerTurnState.PLAYING_MINIGAME:
+            with self.sio.batch():
+                self.moriarty_move(self.sio, allow_zero_move=False)
 
-        if self.next_moriarty_move_time is not None and self.next_moriarty_move_time < time.time():
-            if self.turn_state.player_turn_state != TurnState.PlayerTurnState.PLAYING_MINIGAME:
-                self.moriarty_move(sio, allow_zero_move=False)
+        next_move_time = self._moriarty_timer.deadline + self._get_moriarty_move_interval()
+        self._moriarty_timer = self.scheduler.call_at(next_move_time, self._moriarty_callback)
 
-            self.next_moriarty_move_time += self._get_moriarty_move_interval()
+    def _pantomime_timeout(self):
+        """
+        Timer callback. Evaluates the pantomime with the guesses given so far.
+        """
+        if self._timer_is_due(self._pantomime_timer):
+            self._pantomime_timer_fired()
+
+    @journaled(with_transport=False)
+    def _pantomime_timer_fired(self):
+        self._pantomime_timer = None
+        if self.turn_state.player_turn_state == TurnState.PlayerTurnState.PLAYING_MINIGAME \
+                and self.pantomime_state is not None:
+            with self.sio.batch():
+                self.evaluate_pantomime(self.sio)
+
+    def _timer_is_due(self, handle: TimerHandle or None) -> bool:
+        """
+        A timer callback can wait for the game actor, while an event cancels or replaces its timer. Then the
+        callback must not run.
+        """
+        return handle is not None and handle.deadline <= self.scheduler.clock()
+
+    @journaled(with_transport=False)
+    def stop(self):
+        """
+        Cancels all pending timers of this game and closes its journal.
+        """
+        if self.scheduler is not None:
+            self.scheduler.cancel(self._moriarty_timer)
+            self.scheduler.cancel(self._pantomime_timer)
+        self._moriarty_timer = None
+        self._pantomime_timer = None
+        if self.journal is not None:
+            self.journal.close()
+
+    def _resume_timers(self):
+        """
+        Starts the paused timers of a restored game.
+        """
+        if self.scheduler is None:
+            return
+        if self._paused_moriarty_delay is not None:
+            self._moriarty_timer = self.scheduler.call_later(self._paused_moriarty_delay, self._moriarty_callback)
+            self._paused_moriarty_delay = None
+        if self._paused_pantomime_delay is not None:
+            if self.pantomime_state is not None and self.pantomime_state.timeout_started():
+                self.pantomime_state.start_timeout(max(0.0, PANTOMIME_DURATION - self._paused_pantomime_delay))
+            self._pantomime_timer = self.scheduler.call_later(self._paused_pantomime_delay, self._pantomime_callback)
+            self._paused_pantomime_delay = None
+
+    def snapshot_state(self) -> tuple:
+        """
+        :return: The state of this game as nested tuples of builtin types (see mole.snapshot)
+        """
+        now = self.scheduler.clock() if self.scheduler is not None else 0.0
+
+        def delay(handle, paused_delay):
+            if handle is not None:
+                return max(0.0, handle.deadline - now)
+            return paused_delay
+
+        pantomime = None
+        if self.pantomime_state is not None:
+            state = self.pantomime_state
+            pantomime = (
+                state.solution_word, state.words, state.category, state.guesses, state.elapsed_time(),
+                state.ignored_player
+            )
+
+        return (
+            self.token, self.host_sid, self.map_id, self.difficulty.value, self.enable_minigames, self.test_choices,
+            self.team_pos, self.moriarty_pos, self.move_modifier.value,
+            (self.turn_state.player_index, self.turn_state.player_turn_state.value, self.turn_state.occasion_choices),
+            pantomime,
+            self.pantomime_category_count,
+            tuple((clue.name, str(clue.main_type), str(clue.subtype)) for clue in self.solution_clues),
+            tuple(
+                (
+                    player.player_id, player.name, player.sid, player.is_mole, player.disabled,
+                    tuple(
+                        (c.name, str(c.main_type), str(c.subtype), c.received_from, tuple(c.sent_to))
+                        for c in player.inventory
+                    ),
+                )
+                for player in self.players
+            ),
+            tuple((str(proof.main_type), proof.validation_player) for proof in self.team_proofs),
+            tuple((str(proof.main_type), proof.validation_player) for proof in self.mole_proofs),
+            delay(self._moriarty_timer, self._paused_moriarty_delay),
+            delay(self._pantomime_timer, self._paused_pantomime_delay),
+            self.seed,
+            _pack_rng_state(self.rng),
+        )
+
+    @classmethod
+    def from_snapshot_state(cls, state: tuple, sio, scheduler=None) -> 'Game':
+        """
+        Restores a game from snapshot_state(). The host and all players are disconnected and the timers are paused
+        until a player rejoins.
+        """
+        (
+            token, host_sid, map_id, difficulty, enable_minigames, test_choices, team_pos, moriarty_pos,
+            move_modifier, turn_state, pantomime, pantomime_category_count, solution, players, team_proofs,
+            mole_proofs, moriarty_delay, pantomime_delay, seed, rng_state,
+        ) = state
+
+        game = cls.__new__(cls)
+        game.token = token
+        game.host_sid = host_sid
+        game.host_connected = False  # the host of the last run can rejoin with host_rejoin()
+        game._init_runtime(sio, scheduler)
+        game._paused_moriarty_delay = moriarty_delay
+        game._paused_pantomime_delay = pantomime_delay
+        game.seed = seed
+        game.rng = _unpack_rng_state(rng_state)  # continues the random sequence where the snapshot left it
+        game.test_choices = test_choices
+        game.enable_minigames = enable_minigames
+        game.difficulty = DifficultyLevel(difficulty)
+
+        game.solution_clues = [Clue(name, main_type, subtype) for name, main_type, subtype in solution]
+        game._index_solution()
+        game.clue_sampler = ClueSampler(game.solution_clues, range(len(players)), game.rng)
+
+        game.players = []
+        for player_id, name, sid, is_mole, disabled, inventory in players:
+            player = Player(player_id, name, sid, is_mole=is_mole)
+            player.disabled = disabled
+            player.connected = False
+            for clue_name, main_type, subtype, received_from, sent_to in inventory:
+                clue = game._solution_by_name.get(clue_name) or Clue(clue_name, main_type, subtype)
+                player.add_clue(received_from, clue).sent_to.extend(sent_to)
+                game.clue_sampler.add_clue(player_id, clue)
+            game.players.append(player)
+
+        game.team_proofs = [Proof(main_type, player_id) for main_type, player_id in team_proofs]
+        game.mole_proofs = [Proof(main_type, player_id) for main_type, player_id in mole_proofs]
+        game._verified_types = set()
+        for proof in itertools.chain(game.team_proofs, game.mole_proofs):
+            game._verified_types.add(proof.main_type)
+            game.clue_sampler.verify_type(proof.main_type)
+        game._proofed_types = [p.to_dict() for p in itertools.chain(game.team_proofs, game.mole_proofs)]
+
+        game.turn_state = TurnState()
+        player_index, player_turn_state, occasion_choices = turn_state
+        game.turn_state.player_index = player_index
+        game.turn_state.player_turn_state = TurnState.PlayerTurnState(player_turn_state)
+        game.turn_state.occasion_choices = occasion_choices
+        game.move_modifier = MoveModifier(move_modifier)
+
+        game.pantomime_state = None
+        if pantomime is not None:
+            solution_word, words, category, guesses, elapsed_time, ignored_player = pantomime
+            game.pantomime_state = PantomimeState(solution_word, words, category)
+            game.pantomime_state.guesses = guesses
+            game.pantomime_state.ignored_player = ignored_player
+            if elapsed_time is not None:
+                game.pantomime_state.start_timeout(elapsed_time)
+        game.pantomime_category_count = pantomime_category_count
+
+        game.map_id = map_id
+        game.map = create_map(map_id)
+        game.team_pos = team_pos
+        game.moriarty_pos = moriarty_pos
+        return game
 
     def _get_player_info(self):
         return list(map(lambda p: {'player_id': p.player_id, 'name': p.name}, self.players))
@@ -147,6 +420,7 @@ class Game:
     def has_connected_player(self):
         return any(map(lambda player: player.connected, self.players))
 
+    @journaled()
     def player_disconnect(self, sio, sid):
         player = self.get_player(sid)
         if player is None:
@@ -162,6 +436,7 @@ class Game:
         sio.emit('player_disconnected', player.player_id, room=self.host_sid)
         print('player {} disconnected'.format(player.name))
 
+    @journaled()
     def player_rejoin(self, sio, sid, name):
         player = self.get_player_by_name(name)
         if player is None:
@@ -170,12 +445,12 @@ class Game:
 
         player.sid = sid
         player.connected = True
+        self._resume_timers()
 
         sio.emit('player_rejoined', player.player_id, room=self.host_sid)
         player_info = list(map(lambda p: {'name': p.name, 'player_id': p.player_id}, self.players))
         sio.emit('player_infos', player_info, room=player.sid)
-        clues = list(map(Clue.to_dict, player.inventory))
-        proofed_types = list(map(Proof.to_dict, self._get_all_proofs()))
+        clues = list(map(InventoryClue.to_dict, player.inventory))
         sio.emit(
             'init',
             {
@@ -185,12 +460,22 @@ class Game:
                 'clue': clues[0],  # TODO: remove this
                 'clues': clues,
                 'rejoin': True,
-                'proofed_types': proofed_types,
+                'proofed_types': self._proofed_types,
             },
             room=player.sid
         )
         print('player {} rejoined'.format(player.name))
 
+    @journaled()
+    def host_rejoin(self, sio, sid):
+        """
+        Makes sid the host of this game, e.g. after the game was restored from a snapshot.
+        """
+        self.host_sid = sid
+        self.host_connected = True
+        sio.emit('player_infos', self._get_player_info(), room=sid)
+        print('host rejoined game {}'.format(self.token))
+
     def has_disconnected_player(self, name):
         for p in self.players:
             if p.name == name and not p.connected:
@@ -202,50 +487,45 @@ class Game:
         :rtype: Field
         :return: The Field the player is standing on
         """
-        return self.team_pos.value
+        return self.map.fields[self.team_pos]
 
     def get_moriarty_pos(self):
         """
         :rtype: Field
         :return: The Field moriarty is standing on
         """
-        return self.moriarty_pos.value
+        return self.map.fields[self.moriarty_pos]
 
     def move_player(self, distance: int) -> int or None:
         """
         Moves the player over the map. Does not handle occasions.
-        In case a minigame field is trespassed, the move is stopped and True is returned.
+        In case a minigame field is trespassed, the move is stopped on this field.
+        The player does not move further than the goal field.
 
         :param distance: the number of fields to move
-        :return: If a minigame field was reached, the number of remaining move distance is returned, otherwise None
         """
-        for i in range(distance):
-            self.team_pos = self.team_pos.next  # get next field
-            if self.team_pos is None:
-                self.game_over(GameOverReason.REACHED_END_OF_MAP)
-            else:
-                field = self.get_team_pos()
-                if field.type == FieldType.SHORTCUT and self.enable_minigames:
-                    self.turn_state.player_turn_state = TurnState.PlayerTurnState.PLAYING_MINIGAME
-                    return
+        target = self.team_pos + max(0, min(distance, self.map.distance_to_goal[self.team_pos]))
+        if self.enable_minigames:
+            shortcut = self.map.next_special_field[self.team_pos]
+            if shortcut <= target:
+                self.team_pos = shortcut
+                self.turn_state.player_turn_state = TurnState.PlayerTurnState.PLAYING_MINIGAME
+                return
+        self.team_pos = target
 
     def moriarty_move(self, sio, allow_zero_move=True):
-        # stop idling
-        requests.get("https://ab-backend.herokuapp.com/")
-
         if allow_zero_move:
-            num_fields = random.choices([0, 1, 2], weights=[5, 4, 1])[0]
+            num_fields = self.rng.choices(MORIARTY_STEPS, weights=MORIARTY_STEP_WEIGHTS)[0]
         else:
-            num_fields = random.choices([1, 2], weights=[4, 1])[0]
+            num_fields = self.rng.choices(MORIARTY_AUTO_STEPS, weights=MORIARTY_AUTO_STEP_WEIGHTS)[0]
 
         if num_fields != 0:
-            for i in range(num_fields):
-                if self.moriarty_pos.next is None:
-                    # TODO: Maybe allow the Team in the future to stall on the goal field to search for evidences
-                    self.game_over(GameOverReason.MORIARTY_CAUGHT)
-                self.moriarty_pos = self.moriarty_pos.next
-                if self.get_moriarty_pos().index == self.get_team_pos().index:
-                    self.game_over(GameOverReason.MORIARTY_CAUGHT)
+            old_position = self.moriarty_pos
+            self.moriarty_pos = old_position + min(num_fields, self.map.distance_to_goal[old_position])
+            # TODO: Maybe allow the Team in the future to stall on the goal field to search for evidences
+            if num_fields > self.map.distance_to_goal[old_position] \
+                    or old_position < self.team_pos <= self.moriarty_pos:
+                self.game_over(GameOverReason.MORIARTY_CAUGHT)
 
             self._send_moriarty_move(sio)
 
@@ -286,30 +566,24 @@ class Game:
                 break
         self.turn_state.player_turn_state = TurnState.PlayerTurnState.PLAYER_CHOOSING
 
+        if self.on_turn_end is not None:
+            self.on_turn_end(self)
+
     def debug_game_representation(self):
         result = ""
         print('-------------Game-Representation---------------------')
         print('-----------------------------------------------------')
         print('Player ' + str(self.get_current_player().name)+'s turn')
-        for node in self.map.iternodes():  # iterate over list nodes
-            field: Field = node.value
+        for index, field in enumerate(self.map.fields):
             result += ' - '+str(field.type.name)
-            if node == self.team_pos:
+            if index == self.team_pos:
                 result += '+Team'
-            if node == self.moriarty_pos:
+            if index == self.moriarty_pos:
                 result += '+ Devil'
         print(result)
         print('---------------------------------------------------')
         print('---------------------------------------------------')
 
-    def map_to_json(self):
-        json_map = list()
-        for node in self.map.iternodes():  # iterate over list nodes
-            field: Field = node.value
-            json_map.append(field)
-
-        return json_map
-
     def get_player(self, sid) -> Player or None:
         for player in self.players:
             if player.sid == sid:
@@ -322,6 +596,7 @@ class Game:
                 return player
         return None
 
+    @journaled()
     def player_choice(self, sio, sid, player_choice):
         """
         This event is called, if a player chose one of:
@@ -399,7 +674,7 @@ class Game:
                 )
 
             # Get clue which should be shared
-            clue = deepcopy(sharing_player.get_clue(player_choice.get('clue')))
+            clue = sharing_player.get_clue(player_choice.get('clue'))
             if clue is None:
                 raise InvalidMessageException(
                     'Got player_choice (share-clue), with clue name that player does not own'
@@ -412,7 +687,7 @@ class Game:
                 clue.sent_to.append(share_with_player.player_id)
 
             # Check if share_with player already has clue
-            share_clue = share_with_player.check_and_add_clue(sharing_player.player_id, clue)
+            share_clue = self._add_clue(share_with_player, sharing_player.player_id, clue.clue)
 
             # Share clue with share_with player
             sio.emit(
@@ -449,10 +724,6 @@ class Game:
                 validation_status = 'new_validation'
                 self.add_verified_clues_to_proofs(clues, player)
 
-            proofed_types = list(map(
-                lambda p: {'type': p.main_type, 'from': p.validation_player},
-                self._get_all_proofs()
-            ))
             self.send_to_all(
                 self.sio,
                 'validation_result',
@@ -461,7 +732,7 @@ class Game:
                     'validation_status': validation_status,
                     'player_id': player.player_id,
                     'clues': player_choice.get('clues'),
-                    'proofed_types': proofed_types,
+                    'proofed_types': self._proofed_types,
                 }
             )
 
@@ -473,21 +744,21 @@ class Game:
             clue2 = None
 
             if player_choice.get('doublesuccess'):
-                clue = self.get_random_missing_clue(player.inventory)
-                clue2 = self.get_random_missing_clue(player.inventory)
+                clue = self.get_random_missing_clue(player)
+                clue2 = self.get_random_missing_clue(player)
                 # clue can be None, if this player knows everything or every category was validated
                 if clue is not None:
-                    player.add_clue(-1, clue)
+                    self._add_clue(player, -1, clue)
                 if clue2 is not None:
-                    player.add_clue(-1, clue2)
+                    self._add_clue(player, -1, clue2)
                 else:
                     print('INFO: search-clue, but no clues left to find')
 
             if player_choice.get('success'):
-                clue = self.get_random_missing_clue(player.inventory)
+                clue = self.get_random_missing_clue(player)
                 # clue can be None, if this player knows everything or every category was validated
                 if clue is not None:
-                    player.add_clue(-1, clue)
+                    self._add_clue(player, -1, clue)
                 else:
                     print('INFO: search-clue, but no clues left to find')
 
@@ -535,20 +806,19 @@ class Game:
                 self.handle_movement(sio, move_distance)
         elif self.get_team_pos().type == FieldType.OCCASION:  # check occasion field
             print("stepped on occasion, index:" + str(self.get_team_pos().index))
-            occasion_choices = _random_occasion_choices(self.test_choices)
-            for player in self.players:
-                if self.get_current_player().sid == player.sid:
-                    sio.emit(
-                        'occasion',
-                        {'player_id:': self.get_current_player().player_id, 'choices': occasion_choices},
-                        room=player.sid
-                    )
-                else:
-                    sio.emit(
-                        'occasion',
-                        {'player_id:': self.get_current_player().player_id},
-                        room=player.sid
-                    )
+            occasion_choices = _random_occasion_choices(self.test_choices, self.rng)
+            current_player = self.get_current_player()
+            sio.emit(
+                'occasion',
+                {'player_id:': current_player.player_id, 'choices': occasion_choices},
+                room=current_player.sid
+            )
+            sio.emit(
+                'occasion',
+                {'player_id:': current_player.player_id},
+                room=self.token,
+                skip_sid=[self.host_sid, current_player.sid]
+            )
             self.turn_state.choosing_occasion(occasion_choices)
         elif self.get_team_pos().type == FieldType.Goal:
             print("stepped on goal field, index:" + str(self.get_team_pos().index))
@@ -559,6 +829,7 @@ class Game:
         else:
             raise AssertionError('Unknown Field Type: {}'.format(self.get_team_pos().type))
 
+    @journaled()
     def player_occasion_choice(self, sio, sid, chosen_occasion: dict):
         """
         This event is called, if a player chose an occasion.
@@ -633,9 +904,9 @@ class Game:
             player = self.get_player(sid)
 
             if chosen_occasion.get('success') is True:
-                clue = self.get_random_missing_clue(player.inventory)
+                clue = self.get_random_missing_clue(player)
                 if clue is not None:
-                    player.add_clue(-1, clue)
+                    self._add_clue(player, -1, clue)
                     clue = clue.to_dict()
 
                 sio.emit(
@@ -681,18 +952,19 @@ class Game:
         usages = sorted(usages.items(), key=lambda u: u[1])
         lowest_usage = usages[0][1]
         usages = filter(lambda u: u[1] == lowest_usage, usages)
-        category = random.choice(list(usages))[0]
+        category = self.rng.choice(list(usages))[0]
         return category
 
     def trigger_pantomime(self, sio, difficulty):
         category = self._get_pantomime_category(difficulty)
-        words = random.choice(PANTOMIME_WORDS[difficulty][category])
+        words = self.rng.choice(PANTOMIME_WORDS[difficulty][category])
         self.pantomime_category_count[difficulty][category] += 1
 
-        solution_word = random.choice(words)
+        solution_word = self.rng.choice(words)
         self.pantomime_state = PantomimeState(solution_word, words, category)
 
-        # inform host
+        # inform host and guessing players
+        current_player = self.get_current_player()
         sio.emit(
             'guess_pantomime',
             {
@@ -701,27 +973,16 @@ class Game:
                 'start': False,
                 'ignored': False,
             },
-            room=self.host_sid
+            room=self.token,
+            skip_sid=current_player.sid
+        )
+        sio.emit(
+            'host_pantomime',
+            {'solution_word': solution_word, 'words': words, 'category': category},
+            room=current_player.sid
         )
-        for player in self.players:
-            if player.sid == self.get_current_player().sid:
-                sio.emit(
-                    'host_pantomime',
-                    {'solution_word': solution_word, 'words': words, 'category': category},
-                    room=player.sid
-                )
-            else:
-                sio.emit(
-                    'guess_pantomime',
-                    {
-                        'words': words,
-                        'category': category,
-                        'start': False,
-                        'ignored': False,
-                    },
-                    room=player.sid
-                )
 
+    @journaled()
     def pantomime_start(self, sio, sid, ignored_player):
         # check if in pantomime
         if not self.turn_state.player_turn_state == TurnState.PlayerTurnState.PLAYING_MINIGAME:
@@ -737,6 +998,9 @@ class Game:
             raise InvalidMessageException('Got pantomime start from player that is not hosting.')
 
         self.pantomime_state.start_timeout()
+        if self.scheduler is not None:
+            self.scheduler.cancel(self._pantomime_timer)
+            self._pantomime_timer = self.scheduler.call_later(PANTOMIME_DURATION, self._pantomime_callback)
 
         # ignore player
         if hosting_player.player_id == ignored_player:  # hosting player can not ignore himself
@@ -748,19 +1012,24 @@ class Game:
                 else:
                     self.pantomime_state.ignored_player = ignored_player
 
-        for hosting_player in self.players:
-            if hosting_player.sid != self.get_current_player().sid:
-                sio.emit(
-                    'guess_pantomime',
-                    {
-                        'words': self.pantomime_state.words,
-                        'category': self.pantomime_state.category,
-                        'start': True,
-                        'ignored': hosting_player.player_id == ignored_player,
-                    },
-                    room=hosting_player.sid
-                )
+        # inform guessing players, the ignored player gets its own message
+        skip_sids = [self.host_sid, hosting_player.sid]
+        ignored = next(
+            (p for p in self.players if p.player_id == ignored_player and p is not hosting_player), None
+        )
+        if ignored is not None:
+            skip_sids.append(ignored.sid)
+        message = {
+            'words': self.pantomime_state.words,
+            'category': self.pantomime_state.category,
+            'start': True,
+            'ignored': False,
+        }
+        sio.emit('guess_pantomime', message, room=self.token, skip_sid=skip_sids)
+        if ignored is not None:
+            sio.emit('guess_pantomime', dict(message, ignored=True), room=ignored.sid)
 
+    @journaled()
     def pantomime_choice(self, sio, sid, message):
         # check if in pantomime
         if not self.turn_state.player_turn_state == TurnState.PlayerTurnState.PLAYING_MINIGAME:
@@ -803,6 +1072,10 @@ class Game:
             self.evaluate_pantomime(sio)
 
     def evaluate_pantomime(self, sio):
+        if self.scheduler is not None:
+            self.scheduler.cancel(self._pantomime_timer)
+        self._pantomime_timer = None
+
         player_results = []
         overall_success = True
         for player in self.players:
@@ -868,55 +1141,30 @@ class Game:
     def players_turn(self, sid):
         return self.get_current_player().sid == sid
 
-    def _player_has_clue(self, clue_name):
-        for player in self.players:
-            if player.get_clue(clue_name) is not None:
-                return True
-        return False
+    def _add_clue(self, player: Player, received_from: int, clue: Clue) -> InventoryClue:
+        """
+        Adds the clue to the inventory of the player, if the player does not have it yet.
+
+        :return: The inventory entry of the clue
+        """
+        inventory_clue = player.get_clue(clue.name)
+        if inventory_clue is None:
+            inventory_clue = player.add_clue(received_from, clue)
+            self.clue_sampler.add_clue(player.player_id, clue)
+        return inventory_clue
 
-    def get_random_missing_clue(self, player_clues: List[Clue]) -> Clue or None:
+    def get_random_missing_clue(self, player: Player) -> Clue or None:
         """
-        :param player_clues: The clues the player already has
+        A clue nobody has yet is more likely than a clue another player already has.
+
+        :param player: The player who searches the clue
         :return: Get a random clue, which the player does not have yet and whose main type was not validated yet.
                  None, if there is no such clue
         """
-        def _valid_found_clue(find_clue) -> bool:
-            """
-            Returns whether this clue should be findable.
-            It is not findable anymore, if it is already verified.
-            It is not findable anymore, if the player has this clue already.
-
-            :param find_clue: The clue to inspect
-            :type find_clue: Clue
-            :return: True or False
-            """
-            # already verified
-            if self.is_already_verified(find_clue.main_type):
-                return False
-
-            if find_clue.name in map(lambda pc: pc.name, player_clues):
-                return False
+        return self.clue_sampler.draw(player.player_id)
 
-            return True
-
-        possible_clues = list(filter(_valid_found_clue, self.solution_clues))
-
-        weighted_possible_clues = []
-        for clue in possible_clues:
-            weighted_possible_clues.append(clue)
-            if not self._player_has_clue(clue.name):
-                for _ in range(3):
-                    weighted_possible_clues.append(clue)
-
-        if len(weighted_possible_clues) == 0:
-            return None
-
-        return deepcopy(random.choice(weighted_possible_clues))
-
-    def get_clue_by_name(self, clue_name: str):
-        for c in self.solution_clues:
-            if c.name == clue_name:
-                return c
+    def get_clue_by_name(self, clue_name: str) -> Clue or None:
+        return self._solution_by_name.get(clue_name)
 
     def validation_allowed(self, player: Player, clues: List[Clue]) -> (bool, str):
         """
@@ -933,6 +1181,11 @@ class Game:
             if clue.main_type != clue_type:
                 raise InvalidMessageException('Got different clue main_types which is illegal')
 
+            # The main type must match the solution clue of the same name
+            solution_clue = self._solution_by_name.get(clue.name)
+            if solution_clue is not None and solution_clue.main_type != clue_type:
+                return False, 'wrong_main_type'
+
             # The clues must be in the players inventory
             if player.get_clue(clue.name) is None:
                 return False, 'not_in_inventory'
@@ -943,12 +1196,18 @@ class Game:
         else:
             return True, 'validation_allowed'
 
-    def _get_all_proofs(self) -> List[Proof]:
-        return list(itertools.chain(self.team_proofs, self.mole_proofs))
-
     def is_already_verified(self, main_type: str) -> bool:
         # Check if the verified clues have already been added to the other teams proofs or self proofs
-        return main_type in map(lambda p: p.main_type, self._get_all_proofs())
+        return main_type in self._verified_types
+
+    def get_unverified_solution(self) -> Dict[str, FrozenSet[str]]:
+        """
+        :return: The names of the solution clues of every main type, that has not been verified yet
+        """
+        return {
+            main_type: names for main_type, names in self._solution_by_type.items()
+            if main_type not in self._verified_types
+        }
 
     def validate_clues(self, clues):
         """
@@ -956,23 +1215,12 @@ class Game:
         :return: Bool whether the correct clues were found or not
         """
         clue_type = clues[0].main_type
-        clue_group = []
-
-        # Get all winner clues with requested clue type
-        for clue in self.solution_clues:
-            if clue.main_type == clue_type:
-                clue_group.append(clue)
-
-        # Check if player has all the clues needed
-        for clue in clues:
-            if clue.main_type != clue_type:
-                return False
-
-            result = next((e for e in clue_group if e.name == clue.name), None)
-            if result is not None:
-                clue_group.remove(result)
+        if any(clue.main_type != clue_type for clue in clues):
+            return False
 
-        return len(clue_group) == 0
+        # The main type must be part of the solution and all its solution clues must be among the given clues
+        solution_names = self._solution_by_type.get(clue_type)
+        return solution_names is not None and solution_names <= {clue.name for clue in clues}
 
     def add_verified_clues_to_proofs(self, clues, player: Player):
         main_type = clues[0].main_type
@@ -982,67 +1230,19 @@ class Game:
         else:
             self.team_proofs.append(proof)
 
+        self._verified_types.add(main_type)
+        self.clue_sampler.verify_type(main_type)
+        # a new list, so payloads that were already sent are not changed
+        self._proofed_types = [p.to_dict() for p in itertools.chain(self.team_proofs, self.mole_proofs)]
+
     def generate_solution_clues(self) -> List[Clue]:
         """
         :return: List of clues to win the game
         """
-        # Use new database connection
-        db_connection = 'game_init{}'.format(self.token)
-        DATABASES[db_connection] = dj_database_url.config(conn_max_age=600)
-
         clues = []
 
-        all_weapon_objects = Evidence.objects.using(db_connection).filter(type=ClueType.WEAPON,
-                                                                          subtype=ClueSubtype.OBJECT)
-        all_weapon_colors = Evidence.objects.using(db_connection).filter(type=ClueType.WEAPON,
-                                                                         subtype=ClueSubtype.COLOR_W)
-        all_weapon_conditions = Evidence.objects.using(db_connection).filter(type=ClueType.WEAPON,
-                                                                             subtype=ClueSubtype.CONDITION)
-        clues.append(evidence_2_clue(random.choice(all_weapon_objects)))
-        clues.append(evidence_2_clue(random.choice(all_weapon_colors)))
-        clues.append(evidence_2_clue(random.choice(all_weapon_conditions)))
-
-        all_crime_scene_locations = Evidence.objects.using(db_connection).filter(type=ClueType.CRIME_SCENE,
-                                                                                 subtype=ClueSubtype.LOCATION)
-        all_crime_scene_temperature = Evidence.objects.using(db_connection).filter(type=ClueType.CRIME_SCENE,
-                                                                                   subtype=ClueSubtype.TEMPERATURE)
-        all_crime_scene_districts = Evidence.objects.using(db_connection).filter(type=ClueType.CRIME_SCENE,
-                                                                                 subtype=ClueSubtype.DISTRICT)
-        clues.append(evidence_2_clue(random.choice(all_crime_scene_locations)))
-        clues.append(evidence_2_clue(random.choice(all_crime_scene_temperature)))
-        clues.append(evidence_2_clue(random.choice(all_crime_scene_districts)))
-
-        all_offender_escape_clothings = Evidence.objects.using(db_connection).filter(type=ClueType.OFFENDER,
-                                                                                     subtype=ClueSubtype.CLOTHING)
-        all_offender_escape_sizes = Evidence.objects.using(db_connection).filter(type=ClueType.OFFENDER,
-                                                                                 subtype=ClueSubtype.SIZE)
-        all_offender_escape_characteristics = Evidence.objects.using(db_connection)\
-            .filter(type=ClueType.OFFENDER, subtype=ClueSubtype.CHARACTERISTIC)
-        clues.append(evidence_2_clue(random.choice(all_offender_escape_clothings)))
-        clues.append(evidence_2_clue(random.choice(all_offender_escape_sizes)))
-        clues.append(evidence_2_clue(random.choice(all_offender_escape_characteristics)))
-
-        all_time_of_crime_weekdays = Evidence.objects.using(db_connection).filter(type=ClueType.TIME_OF_CRIME,
-                                                                                  subtype=ClueSubtype.WEEKDAY)
-        all_time_of_crime_daytimes = Evidence.objects.using(db_connection).filter(type=ClueType.TIME_OF_CRIME,
-                                                                                  subtype=ClueSubtype.DAYTIME)
-        all_time_of_crime_times = Evidence.objects.using(db_connection).filter(type=ClueType.TIME_OF_CRIME,
-                                                                               subtype=ClueSubtype.TIME)
-        clues.append(evidence_2_clue(random.choice(all_time_of_crime_weekdays)))
-        clues.append(evidence_2_clue(random.choice(all_time_of_crime_daytimes)))
-        clues.append(evidence_2_clue(random.choice(all_time_of_crime_times)))
-
-        all_mean_of_escape_conditions = Evidence.objects.using(db_connection).filter(type=ClueType.MEANS_OF_ESCAPE,
-                                                                                     subtype=ClueSubtype.MODEL)
-        all_mean_of_escape_daytime = Evidence.objects.using(db_connection).filter(type=ClueType.MEANS_OF_ESCAPE,
-                                                                                  subtype=ClueSubtype.COLOR_ME)
-        all_mean_of_escape_districts = Evidence.objects.using(db_connection).filter(type=ClueType.MEANS_OF_ESCAPE,
-                                                                                    subtype=ClueSubtype.ESCAPE_ROUTE)
-        clues.append(evidence_2_clue(random.choice(all_mean_of_escape_conditions)))
-        clues.append(evidence_2_clue(random.choice(all_mean_of_escape_daytime)))
-        clues.append(evidence_2_clue(random.choice(all_mean_of_escape_districts)))
-
-        connections[db_connection].close()
+        for clue_type, clue_subtype in SOLUTION_CLUE_TYPES:
+            clues.append(self.rng.choice(evidence_catalog.get(clue_type, clue_subtype)))
 
         return clues
 
@@ -1061,10 +1261,10 @@ class Game:
             # then subtract the moles proofs from the teams
 
             # Mole wins if he has verified at least two proofs (Reminder: proof is now single object)
-            if len(self.mole_proofs) >= 2:
+            if len(self.mole_proofs) >= MOLE_WIN_PROOFS:
                 message = "destroyed_enough_proofs"
             # Team wins if it has verified at least four proofs (Reminder: proof is now single object)
-            elif len(self.team_proofs) >= 4:
+            elif len(self.team_proofs) >= TEAM_WIN_PROOFS:
                 # story could be such that the remaining proofs can be found by an investigator at the court
                 winner = "team"
                 message = "validated_enough_proofs"
@@ -1081,14 +1281,10 @@ class Game:
         self.send_to_all(self.sio, 'gameover', {'winner': winner, 'reason': message, 'mole_id': mole_id})
 
     def _get_moriarty_move_interval(self):
-        value = random.random() * (MORIARTY_AUTO_MOVE_INTERVAL[1] - MORIARTY_AUTO_MOVE_INTERVAL[0]) + \
+        value = self.rng.random() * (MORIARTY_AUTO_MOVE_INTERVAL[1] - MORIARTY_AUTO_MOVE_INTERVAL[0]) + \
                MORIARTY_AUTO_MOVE_INTERVAL[0]
-        if self.difficulty == DifficultyLevel.EASY:
-            return None
-        elif self.difficulty == DifficultyLevel.MEDIUM:
-            return value * 2.0
-        elif self.difficulty == DifficultyLevel.HARD:
-            return value
+        factor = MORIARTY_AUTO_MOVE_FACTORS[self.difficulty]
+        return value * factor if factor is not None else None
 
 
 def _occasion_matches(left, right):
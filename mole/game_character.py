@@ -1,6 +1,35 @@
-from typing import List
+from typing import Dict
 
-from mole.clues import Clue
+from mole.clues import Clue, InventoryClue
+
+
+class Inventory:
+    """
+    The clues of a player in the order they were received, indexed by clue name.
+    Iterating over an inventory yields InventoryClue objects like iterating over a list.
+    """
+    __slots__ = ('_clues',)
+
+    def __init__(self):
+        self._clues: Dict[str, InventoryClue] = {}
+
+    def add(self, inventory_clue: InventoryClue):
+        self._clues[inventory_clue.name] = inventory_clue
+
+    def get(self, name) -> InventoryClue or None:
+        return self._clues.get(name)
+
+    def __contains__(self, name):
+        return name in self._clues
+
+    def __iter__(self):
+        return iter(self._clues.values())
+
+    def __len__(self):
+        return len(self._clues)
+
+    def __repr__(self):
+        return repr(list(self._clues.values()))
 
 
 class Player:
@@ -13,37 +42,21 @@ class Player:
         self._name = name
         self.is_mole = is_mole
 
-        self.inventory = []  # type: List[Clue]
+        self.inventory = Inventory()
         if clue is not None:
-            self.inventory.append(clue)
+            self.add_clue(-1, clue)
 
         self.sid = sid
         self.disabled = False
         self.connected = True
 
-    def add_clue(self, received_from: int, clue: Clue):
-        # Reset received_from and sent_to information
-        clue_copy = Clue(name=clue.name, main_type=clue.main_type, subtype=clue.subtype, received_from=received_from)
-
-        self.inventory.append(clue_copy)
-        return clue_copy
-
-    def check_and_add_clue(self, received_from, clue):
+    def add_clue(self, received_from: int, clue: Clue) -> InventoryClue:
         """
-        This does not add the given clue to the inventory, if the player already has this clue.
-
-        :param received_from:
-        :param clue:
-        :return:
+        Adds the clue to the inventory. If the player already has this clue, it is replaced.
         """
-        c = self.get_clue(clue.name)
-        if c is not None:
-            return c
-
-        return self.add_clue(received_from, clue)
+        inventory_clue = InventoryClue(clue, received_from)
+        self.inventory.add(inventory_clue)
+        return inventory_clue
 
-    def get_clue(self, name):
-        for c in self.inventory:
-            if c.name == name:
-                return c
-        return None
+    def get_clue(self, name) -> InventoryClue or None:
+        return self.inventory.get(name)
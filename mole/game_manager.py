@@ -1,9 +1,13 @@
 import enum
-import random
+import itertools
 import sys
 from typing import Dict
 
 from .game import Game, DifficultyLevel
+from .journal import EventJournal
+from .map import maps, DEFAULT_MAP_ID
+from .snapshot import encode_snapshot, restore_snapshot, InvalidSnapshotException
+from .tokens import TokenAllocator, AllTokensTakenException, TokenNotAvailableException
 
 
 class PendingGame:
@@ -53,31 +57,59 @@ class PendingGame:
 
 
 class GameManager:
-    def __init__(self):
-        self.games: Dict[str, Game] = {}  # maps sids to running games
-        self.pending_games = []
-        self.available_tokens = list(range(1000, 10000))
+    def __init__(self, scheduler=None, token_allocator=None, snapshot_writer=None, journal_dir=None):
+        """
+        :param scheduler: The Scheduler that is passed to every started game
+        :type scheduler: Scheduler or None
+        :param token_allocator: The allocator for game tokens. Defaults to tokens from 1000 to 9999.
+        :type token_allocator: TokenAllocator or None
+        :param snapshot_writer: Writes a snapshot of every running game after each turn. None disables snapshots.
+        :type snapshot_writer: SnapshotWriter or None
+        :param journal_dir: Directory for the event journals of started games (see mole.journal). None disables
+                            journals.
+        """
+        self.snapshot_writer = snapshot_writer
+        self.journal_dir = journal_dir
+        self.scheduler = scheduler
+        self.games: Dict[str, Game] = {}  # maps sids of connected players to running games
+        self._games_by_token: Dict[str, Game] = {}
+        self._games_by_host_sid: Dict[str, Game] = {}
+        self.pending_games: Dict[str, PendingGame] = {}  # maps tokens to pending games
+        self._pending_by_sid: Dict[str, PendingGame] = {}  # maps sids of hosts and players to their pending game
+        self.token_allocator = token_allocator if token_allocator is not None else TokenAllocator()
 
     def _create_new_token(self) -> str:
-        if not self.available_tokens:
-            raise AllTokensTakenException('Cant create any more games. No tokens are available')
-        token = random.choice(self.available_tokens)
-        self.available_tokens.remove(token)
-        return str(token)
+        return str(self.token_allocator.acquire())
 
     def is_game_running(self):
-        return bool(self.games)
+        return bool(self._games_by_token)
+
+    def running_games(self):
+        """
+        :return: An iterable over all running games. Every game is contained only once.
+        """
+        return self._games_by_token.values()
 
     def create_game(self, host_sid):
+        # a host can only have one pending game
+        previous_pending_game = self._pending_by_sid.get(host_sid)
+        if previous_pending_game is not None and previous_pending_game.host_sid == host_sid:
+            print('INFO: removing pending game "{}"'.format(previous_pending_game.token), file=sys.stderr)
+            self.remove_pending_game(previous_pending_game.token)
+
         token = self._create_new_token()
         pending_game = PendingGame(host_sid, token)
-        self.pending_games.append(pending_game)
+        self.pending_games[token] = pending_game
+        self._pending_by_sid[host_sid] = pending_game
         return pending_game.token
 
     def start_game(
             self, sio, sid, token, start_position=None, test_choices=None, all_proofs=False, enable_minigames=False,
-            moriarty_position=0, difficulty='easy'
+            moriarty_position=0, difficulty='easy', map_id=DEFAULT_MAP_ID, seed=None
     ):
+        """
+        :param seed: The seed of the random number generator of the game. Defaults to a random seed.
+        """
         pending_game = self.get_pending_by_token(token)
 
         if pending_game is None:
@@ -89,43 +121,80 @@ class GameManager:
         if not pending_game.host_sid == sid:
             raise StartGameException('Invalid token sid combination. Only the host can start the game.')
 
+        if map_id not in maps:
+            raise StartGameException('Unknown map: {}. Available maps: {}'.format(map_id, maps.ids()))
+
+        journal = EventJournal.open(self.journal_dir, token) if self.journal_dir else None
         game = Game(
             sio, pending_game.token, pending_game.host_sid, pending_game.players, start_position, test_choices,
-            all_proofs, enable_minigames, moriarty_position, difficulty=difficulty
+            all_proofs, enable_minigames, moriarty_position, difficulty=difficulty, scheduler=self.scheduler,
+            map_id=map_id, journal=journal, seed=seed
         )
         for player in pending_game.players:
             self.games[player['sid']] = game
+        self._add_running_game(game)
+
+        self._remove_pending_game(token)
+        self._write_snapshot(game)
 
-        self.remove_pending_game(token)
+    def _add_running_game(self, game: Game):
+        self._games_by_token[game.token] = game
+        self._games_by_host_sid[game.host_sid] = game
+        if self.snapshot_writer is not None:
+            game.on_turn_end = self._write_snapshot
+
+    def _write_snapshot(self, game: Game):
+        if self.snapshot_writer is not None:
+            self.snapshot_writer.submit(game.token, encode_snapshot(game))
+
+    def restore_games(self, snapshots, sio) -> int:
+        """
+        Restores running games from snapshots, e.g. after a crash. Their players can rejoin with their names.
+
+        :param snapshots: An iterable over (token, snapshot data), see SnapshotStore.load_all()
+        :return: The number of restored games
+        """
+        num_restored = 0
+        for token, data in snapshots:
+            try:
+                game = restore_snapshot(data, sio, self.scheduler)
+                self.token_allocator.reserve(int(game.token))
+            except (InvalidSnapshotException, TokenNotAvailableException, ValueError) as e:
+                print('WARN: could not restore game {}: {}'.format(token, e), file=sys.stderr)
+                continue
+            self._add_running_game(game)
+            num_restored += 1
+            print('INFO: restored game {}'.format(game.token), file=sys.stderr)
+        return num_restored
+
+    def _remove_pending_game(self, token):
+        """
+        Removes the pending game and its sid index entries without releasing its token.
+
+        :return: The removed pending game or None, if there is no pending game with this token
+        """
+        pending_game = self.pending_games.pop(token, None)
+        if pending_game is not None:
+            for sid in itertools.chain([pending_game.host_sid], map(lambda p: p['sid'], pending_game.players)):
+                if self._pending_by_sid.get(sid) is pending_game:
+                    del self._pending_by_sid[sid]
+        return pending_game
 
     def remove_pending_game(self, token):
-        len_before = len(self.pending_games)
-        self.pending_games = list(filter(lambda pg: pg.token != token, self.pending_games))
-        if len_before != len(self.pending_games):
-            self.available_tokens.append(int(token))
+        if self._remove_pending_game(token) is not None:
+            self.token_allocator.release(int(token))
 
     def get_pending_by_token(self, token):
-        for pending_game in self.pending_games:
-            if pending_game.token == token:
-                return pending_game
-
-        return None
+        return self.pending_games.get(token)
 
     def get(self, sid) -> Game:
         return self.games.get(sid)
 
     def _get_by_token(self, token) -> Game or None:
-        for game in self.games.values():
-            if game.token == token:
-                return game
-        return None
+        return self._games_by_token.get(token)
 
     def handle_rejoin(self, sio, sid, token, name):
-        game = None
-        for g in self.games.values():
-            if g.token == token:
-                game = g
-                break
+        game = self._get_by_token(token)
         if game is None:
             raise JoinGameException(
                 reason=JoinGameException.Reasons.GAME_NOT_FOUND,
@@ -140,9 +209,26 @@ class GameManager:
                 token=token,
                 name=name,
             )
-        game.player_rejoin(sio, sid, name)
+        game.actor.run('player_rejoin', game.player_rejoin, sio, sid, name)
         self.games[sid] = game
 
+    def handle_host_rejoin(self, sio, sid, token):
+        """
+        Makes sid the host of the running game with this token, if its host is not connected, e.g. because the game
+        was restored from a snapshot.
+        """
+        game = self._get_by_token(token)
+        if game is None:
+            raise JoinGameException(reason=JoinGameException.Reasons.GAME_NOT_FOUND, sid=sid, token=token)
+        if game.host_connected:
+            raise JoinGameException(reason=JoinGameException.Reasons.HOST_CONNECTED, sid=sid, token=token)
+
+        if self._games_by_host_sid.get(game.host_sid) is game:
+            del self._games_by_host_sid[game.host_sid]
+        game.actor.run('host_rejoin', game.host_rejoin, sio, sid)
+        self._games_by_host_sid[sid] = game
+        sio.enter_room(sid, token)
+
     def handle_join(self, sio, sid, token, name):
         pending_game = self.get_pending_by_token(token)
 
@@ -167,34 +253,46 @@ class GameManager:
                     name=name,
                 )
 
+            # a player can only be in one pending game
+            previous_pending_game = self._pending_by_sid.get(sid)
+            if previous_pending_game is not None and previous_pending_game.host_sid != sid:
+                previous_pending_game.remove_player(sio, sid)
+                sio.leave_room(sid, previous_pending_game.token)
+
             sio.enter_room(sid, pending_game.token)
 
             pending_game.add_player(sio, sid, name)
+            self._pending_by_sid[sid] = pending_game
 
             print('player "{}" added to game {}'.format(name, pending_game.token), file=sys.stderr)
 
     def _remove_game(self, token, sio):
         print('Removing game {}.'.format(token), file=sys.stderr)
 
+        game = self._games_by_token.pop(token, None)
+        if game is None:
+            return
+
+        game.stop()
+        self._games_by_host_sid.pop(game.host_sid, None)
+        for player in game.players:
+            if self.games.get(player.sid) is game:
+                del self.games[player.sid]
+
         # disconnect players
-        game = self._get_by_token(token)
-        if game is not None:
-            for player in game.players:
-                sio.disconnect(sid=player.sid)
+        for player in game.players:
+            sio.disconnect(sid=player.sid)
 
-        # remove game
-        len_before = len(self.games)
-        self.games = {sid: game for sid, game in self.games.items() if game.token != token}
-        if len_before != len(self.games):
-            self.available_tokens.append(int(token))
+        if self.snapshot_writer is not None:
+            self.snapshot_writer.remove(token)
+        self.token_allocator.release(int(token))
 
     def handle_disconnect(self, sio, sid):
         # remove from pending games
-        for pending_game in self.pending_games:
-            for player_index, player in enumerate(pending_game.players):
-                if player['sid'] == sid:
-                    pending_game.remove_player(sio, sid)
-                    break
+        pending_game = self._pending_by_sid.pop(sid, None)
+        if pending_game is not None:
+            if any(map(lambda p: p['sid'] == sid, pending_game.players)):
+                pending_game.remove_player(sio, sid)
             if pending_game.host_sid == sid:
                 self.remove_pending_game(pending_game.token)
                 print('INFO: removing pending game "{}"'.format(pending_game.token), file=sys.stderr)
@@ -204,22 +302,22 @@ class GameManager:
         if game is not None:
             assert game.host_sid == sid
             print('Host disconnected from game {}.'.format(game.token), file=sys.stderr)
-            self._remove_game(game.token, sio)
+            game.actor.run('host_disconnect', self._remove_game, game.token, sio)
             return
 
         # remove player from running games
-        game = self.games.get(sid)
+        game = self.games.pop(sid, None)
         if game is not None:
-            game.player_disconnect(sio, sid)
-            if not game.has_connected_player():
-                print('All players disconnected from game {}.'.format(game.token), file=sys.stderr)
-                self._remove_game(game.token, sio)
+            game.actor.run('player_disconnect', self._player_disconnect, game, sio, sid)
+
+    def _player_disconnect(self, game: Game, sio, sid):
+        game.player_disconnect(sio, sid)
+        if not game.has_connected_player():
+            print('All players disconnected from game {}.'.format(game.token), file=sys.stderr)
+            self._remove_game(game.token, sio)
 
     def get_game_by_host_sid(self, sid):
-        for game in self.games.values():
-            if game.host_sid == sid:
-                return game
-        return None
+        return self._games_by_host_sid.get(sid)
 
 
 class JoinGameException(Exception):
@@ -228,6 +326,7 @@ class JoinGameException(Exception):
         GAME_FULL = 1
         NAME_NOT_FOUND = 2
         NAME_DUPLICATION = 3
+        HOST_CONNECTED = 4
 
     def __init__(self, reason, sid=None, token=None, name=None):
         self.reason = reason
@@ -237,9 +336,5 @@ class JoinGameException(Exception):
         super().__init__('Join game failed: {}'.format(reason.name.lower()))
 
 
-class AllTokensTakenException(Exception):
-    pass
-
-
 class StartGameException(Exception):
     pass
@@ -0,0 +1,201 @@
+"""
+Append-only journal of a game, for deterministic replay (see mole.replay).
+
+A journal starts with a header (magic, format version), followed by frames. A frame is its kind and body length
+followed by the body:
+ - START: the arguments the game was created with, including the solution clues, the seed, the state of the random
+   number generator and the clock time
+ - EVENT: an inbound event (client message, disconnect, rejoin, due timer) with its clock time and arguments
+ - RANDOM, BITS: one draw of the random number generator of the game
+
+Events and draws are recorded in the order they happen, so a replay consumes the draws of each event while
+processing it. The transport argument of an event is not recorded.
+"""
+import functools
+import marshal
+import os
+import random
+import struct
+import sys
+import time
+
+MAGIC = b'MOLJ'
+VERSION = 3
+SUFFIX = '.journal'
+
+START = 1
+EVENT = 2
+RANDOM = 3
+BITS = 4
+
+_HEADER = struct.Struct('<4sH')  # magic, version
+_FRAME = struct.Struct('<BI')  # kind, body length
+_DOUBLE = struct.Struct('<d')
+
+# maps names of journaled Game methods to True, if they take the transport as first argument
+JOURNALED_EVENTS = {}
+
+
+class RecordingRandom(random.Random):
+    """
+    A random number generator, that records every draw in a journal. All methods of random.Random are based on
+    random() and getrandbits(), so recording those two is enough to replay every draw.
+    """
+    def __init__(self, journal, seed=None):
+        super().__init__(seed)
+        self.journal = journal
+
+    def random(self):
+        value = super().random()
+        self.journal.record_random(value)
+        return value
+
+    def getrandbits(self, k):
+        value = super().getrandbits(k)
+        self.journal.record_bits(value)
+        return value
+
+
+class EventJournal:
+    """
+    Records the events and random draws of one game. Frames are collected in memory and appended to a file, if the
+    journal has one, after every event.
+    """
+    def __init__(self, path=None):
+        """
+        :param path: The file to append to or None, to keep the journal only in memory
+        """
+        self.path = path
+        self.clock = time.monotonic
+        self._buffer = bytearray(_HEADER.pack(MAGIC, VERSION))
+        self._recording = False
+        self._file = None
+        self.size = 0
+        if path is not None:
+            self._file = open(path, 'ab')
+
+    @staticmethod
+    def open(directory, token) -> 'EventJournal':
+        """
+        :return: A journal for the game in a new file in directory
+        """
+        os.makedirs(directory, exist_ok=True)
+        filename = '{}-{}{}'.format(token, int(time.time() * 1000), SUFFIX)
+        return EventJournal(os.path.join(directory, filename))
+
+    def _append(self, kind, body):
+        if self._buffer is None:
+            return
+        self._buffer += _FRAME.pack(kind, len(body))
+        self._buffer += body
+
+    def create_random(self, seed) -> RecordingRandom:
+        """
+        :return: A random number generator seeded with seed, whose draws are recorded in this journal
+        """
+        return RecordingRandom(self, seed)
+
+    def start(self, clock, arguments: tuple):
+        """
+        Records the START frame. Random draws are recorded from now on.
+
+        :param clock: The clock of the game, e.g. the clock of its scheduler
+        :param arguments: The arguments the game was created with, see mole.replay
+        """
+        self.clock = clock
+        self._append(START, marshal.dumps((clock(), arguments)))
+        self._recording = True
+        self.flush()
+
+    def record_event(self, event, args: tuple):
+        self._append(EVENT, marshal.dumps((self.clock(), event, args)))
+
+    def record_random(self, value: float):
+        if self._recording:
+            self._append(RANDOM, _DOUBLE.pack(value))
+
+    def record_bits(self, value: int):
+        if self._recording:
+            self._append(BITS, marshal.dumps(value))
+
+    def flush(self):
+        if self._file is None or not self._buffer:
+            return
+        try:
+            self._file.write(self._buffer)
+            self._file.flush()
+        except OSError as e:
+            print('ERROR: could not write journal {}: {}'.format(self.path, e), file=sys.stderr)
+        self.size += len(self._buffer)
+        self._buffer = bytearray()
+
+    def getvalue(self) -> bytes:
+        """
+        :return: The journal of an in-memory journal
+        """
+        return bytes(self._buffer)
+
+    def close(self):
+        self.flush()
+        self._recording = False
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._buffer = None
+
+
+def read_frames(data: bytes):
+    """
+    :return: An iterator over the (kind, body) frames of a journal
+    """
+    if len(data) < _HEADER.size:
+        raise InvalidJournalException('Journal is truncated')
+    magic, version = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise InvalidJournalException('Not a game journal')
+    if version != VERSION:
+        raise InvalidJournalException('Unsupported journal version {}, expected {}'.format(version, VERSION))
+
+    offset = _HEADER.size
+    while offset < len(data):
+        if offset + _FRAME.size > len(data):
+            raise InvalidJournalException('Journal is truncated at byte {}'.format(offset))
+        kind, length = _FRAME.unpack_from(data, offset)
+        offset += _FRAME.size
+        if offset + length > len(data):
+            raise InvalidJournalException('Journal is truncated at byte {}'.format(offset))
+        yield kind, data[offset:offset + length]
+        offset += length
+
+
+def decode_random(body) -> float:
+    return _DOUBLE.unpack(body)[0]
+
+
+def journaled(with_transport=True):
+    """
+    Decorator for Game methods, that are inbound events. Records every call in the journal of the game, before
+    the method runs.
+
+    :param with_transport: True, if the first argument is the transport, which is not recorded
+    """
+    def decorator(method):
+        event = method.__name__
+        JOURNALED_EVENTS[event] = with_transport
+
+        @functools.wraps(method)
+        def wrapper(game, *args):
+            journal = game.journal
+            if journal is None:
+                return method(game, *args)
+            journal.record_event(event, args[1:] if with_transport else args)
+            try:
+                return method(game, *args)
+            finally:
+                journal.flush()
+        return wrapper
+    return decorator
+
+
+class InvalidJournalException(Exception):
+    pass
@@ -0,0 +1,56 @@
+import sys
+import threading
+
+import requests
+
+
+class KeepAliveService:
+    """
+    Periodically requests `target` in a background thread, so the dyno does not go idle while games are running.
+
+    The service is disabled, if no target is given.
+    """
+    def __init__(self, target, interval, should_ping=None, timeout=10.0):
+        """
+        :param target: The url to request or None to disable the service
+        :param interval: Seconds between two requests
+        :param should_ping: Optional callable. If it returns False, the request is skipped for this interval.
+        :param timeout: Request timeout in seconds
+        """
+        self.target = target
+        self.interval = interval
+        self.should_ping = should_ping
+        self.timeout = timeout
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def is_enabled(self):
+        return bool(self.target)
+
+    def start(self):
+        if not self.is_enabled() or self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='keep-alive', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the service and waits until a running request is finished.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            if self.should_ping is not None and not self.should_ping():
+                continue
+            self.ping()
+
+    def ping(self):
+        try:
+            requests.get(self.target, timeout=self.timeout)
+        except requests.RequestException as e:
+            print('WARN: keep alive request to {} failed: {}'.format(self.target, e), file=sys.stderr)
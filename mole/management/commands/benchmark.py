@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from mole import benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Runs micro benchmarks of the game engine'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'suites', nargs='*', help='Suites to run. Available: {}'.format(', '.join(benchmarks.SUITES.keys()))
+        )
+
+    def handle(self, *args, **options):
+        unknown_suites = set(options['suites']) - set(benchmarks.SUITES.keys())
+        if unknown_suites:
+            raise CommandError('Unknown benchmark suites: {}'.format(', '.join(sorted(unknown_suites))))
+        benchmarks.run(options['suites'], out=self.stdout.write)
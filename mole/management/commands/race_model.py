@@ -0,0 +1,63 @@
+import ast
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mole import race_model
+from mole.game import DEFAULT_START_POSITION
+from mole.map import maps, DEFAULT_MAP_ID
+
+
+class Command(BaseCommand):
+    help = 'Models the race between the team and Moriarty with numpy and reports catch probabilities and finish times'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--races', type=int, default=race_model.DEFAULT_RACES,
+                            help='Races per start position and difficulty')
+        parser.add_argument('--start', nargs='+', type=int, default=[DEFAULT_START_POSITION], dest='start_positions',
+                            help='Start positions of the team')
+        parser.add_argument('--difficulty', nargs='+', default=['easy', 'medium', 'hard'])
+        parser.add_argument('--map', default=DEFAULT_MAP_ID, dest='map_id')
+        parser.add_argument('--no-minigames', action='store_false', dest='enable_minigames',
+                            help='Shortcuts are always taken')
+        parser.add_argument('--dice-rate', type=float, default=0.5, help='Probability of a dice roll in a turn')
+        parser.add_argument('--pantomime-success', type=float, default=0.7,
+                            help='Probability, that the pantomime of a shortcut succeeds')
+        parser.add_argument('--turn-time', nargs=2, type=float, default=[5.0, 30.0], metavar=('MIN', 'MAX'),
+                            help='Range of the seconds a turn takes')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--set', action='append', default=[], metavar='NAME=VALUE', dest='overrides',
+            help='Overrides a tuning constant of mole.game, e.g. MORIARTY_STEP_WEIGHTS=(6,3,1). '
+                 'Available: {}'.format(', '.join(race_model.RACE_TUNABLES))
+        )
+
+    def handle(self, *args, **options):
+        if options['map_id'] not in maps:
+            raise CommandError('Unknown map: {}'.format(options['map_id']))
+
+        overrides = {}
+        for override in options['overrides']:
+            name, _, value = override.partition('=')
+            try:
+                overrides[name] = ast.literal_eval(value)
+            except (ValueError, SyntaxError):
+                raise CommandError('Invalid value of {}: {}'.format(name, value))
+
+        start = time.perf_counter()
+        try:
+            distributions = race_model.simulate_races(
+                options['races'], options['start_positions'], options['difficulty'], map_id=options['map_id'],
+                enable_minigames=options['enable_minigames'], dice_rate=options['dice_rate'],
+                pantomime_success=options['pantomime_success'], turn_time=tuple(options['turn_time']),
+                seed=options['seed'], overrides=overrides
+            )
+        except race_model.RaceModelException as e:
+            raise CommandError(str(e))
+        seconds = time.perf_counter() - start
+
+        for distribution in distributions:
+            self.stdout.write(json.dumps(distribution.to_dict(), indent=2))
+        num_races = sum(distribution.races for distribution in distributions)
+        self.stdout.write('modelled {} races in {:.2f} s'.format(num_races, seconds))
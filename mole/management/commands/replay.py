@@ -0,0 +1,41 @@
+import contextlib
+import io
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mole.journal import InvalidJournalException
+from mole.replay import replay_journal, ReplayDivergedException
+
+
+class Command(BaseCommand):
+    help = 'Replays the event journal of a game'
+
+    def add_arguments(self, parser):
+        parser.add_argument('journal', help='Journal file, see GAME_JOURNAL_DIR')
+        parser.add_argument('--repeat', type=int, default=1, help='Number of replays, e.g. to profile the engine')
+
+    def handle(self, *args, **options):
+        with open(options['journal'], 'rb') as f:
+            data = f.read()
+
+        start = time.perf_counter()
+        try:
+            # the engine prints a lot of debug output
+            with contextlib.redirect_stdout(io.StringIO()):
+                for _ in range(options['repeat']):
+                    replay = replay_journal(data)
+        except (InvalidJournalException, ReplayDivergedException) as e:
+            raise CommandError('Replay failed: {}'.format(e))
+        seconds = (time.perf_counter() - start) / options['repeat']
+
+        game = replay.game
+        self.stdout.write('game {}: {} events in {:.1f} s of game time'.format(
+            game.token, replay.num_events, replay.duration
+        ))
+        self.stdout.write('replayed in {:.2f} ms ({:.0f}x real time)'.format(
+            seconds * 1000, replay.duration / seconds if seconds > 0 else float('inf')
+        ))
+        self.stdout.write('final state: {}, team at {}, moriarty at {}'.format(
+            game.turn_state.player_turn_state.name.lower(), game.team_pos, game.moriarty_pos
+        ))
@@ -0,0 +1,59 @@
+import ast
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mole import simulation
+from mole.map import maps, DEFAULT_MAP_ID
+
+
+class Command(BaseCommand):
+    help = 'Simulates games with scripted or random players and reports win rates, game lengths and catch rates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--games', type=int, default=1000, help='Games per difficulty and map')
+        parser.add_argument('--difficulty', nargs='+', default=['easy', 'medium', 'hard'])
+        parser.add_argument('--map', nargs='+', default=[DEFAULT_MAP_ID], dest='maps')
+        parser.add_argument(
+            '--policy', default='random', choices=sorted(simulation.POLICIES), help='Policy of the players'
+        )
+        parser.add_argument('--players', type=int, default=4)
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the first game')
+        parser.add_argument('--workers', type=int, default=None, help='Processes, 0 runs in this process')
+        parser.add_argument(
+            '--set', action='append', default=[], metavar='NAME=VALUE', dest='overrides',
+            help='Overrides a tuning constant of mole.game, e.g. MORIARTY_AUTO_MOVE_INTERVAL=(20,30). '
+                 'Available: {}'.format(', '.join(simulation.TUNABLES))
+        )
+
+    def handle(self, *args, **options):
+        unknown_maps = set(options['maps']) - set(maps.ids())
+        if unknown_maps:
+            raise CommandError('Unknown maps: {}'.format(', '.join(sorted(unknown_maps))))
+
+        overrides = {}
+        for override in options['overrides']:
+            name, _, value = override.partition('=')
+            try:
+                overrides[name] = ast.literal_eval(value)
+            except (ValueError, SyntaxError):
+                raise CommandError('Invalid value of {}: {}'.format(name, value))
+
+        start = time.perf_counter()
+        try:
+            reports = simulation.simulate(
+                options['games'], options['difficulty'], options['maps'], policy=options['policy'],
+                seed=options['seed'], workers=options['workers'], overrides=overrides,
+                num_players=options['players']
+            )
+        except simulation.SimulationException as e:
+            raise CommandError(str(e))
+        seconds = time.perf_counter() - start
+
+        for report in reports:
+            self.stdout.write(json.dumps(report.to_dict(), indent=2))
+        num_games = sum(report.games for report in reports)
+        self.stdout.write('simulated {} games in {:.1f} s ({:.0f} games per hour)'.format(
+            num_games, seconds, num_games / seconds * 3600 if seconds > 0 else float('inf')
+        ))
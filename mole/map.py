@@ -1,5 +1,14 @@
+import glob
+import hashlib
+import json
+import os
 from enum import Enum
-import pyllist
+from typing import Dict, List
+
+from .pantomime import PANTOMIME_WORDS
+
+MAP_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'static')
+DEFAULT_MAP_ID = 'default'
 
 
 class FieldType(str, Enum):
@@ -10,116 +19,190 @@ class FieldType(str, Enum):
     Goal = 'goal'
 
 
-class Field(dict):
-    counter = 0
+class Field:
+    """
+    A single field of a map. Fields are immutable and shared by all games.
+    """
+    __slots__ = ('index', 'type', 'shortcut_field', 'difficulty')
 
-    def __init__(self, field_type=FieldType.WALKABLE, shortcut_field=None, difficulty=None):
+    def __init__(self, index, field_type=FieldType.WALKABLE, shortcut_field=None, difficulty=None):
         if field_type == FieldType.SHORTCUT and difficulty is None:
             raise AssertionError('cant create SHORTCUT without difficulty level')
-        dict.__init__(self, index=Field.counter)
-        self.index = Field.counter
-        Field.counter = Field.counter + 1
-        self.shortcut_field = shortcut_field    # int
-        self.difficulty = difficulty
-        self.type = field_type                  # type: FieldType
-        dict.__setitem__(self, "shortcut", self.shortcut_field)
-        dict.__setitem__(self, "field_type", self.type)
-
-
-def create_map():
-    # reset counter
-    Field.counter = 0
-
-    map_dll = pyllist.dllist()  # double linked List
-
-    for i in range(4):
-        map_dll.append(Field(FieldType.DEVIL_FIELD))
-
-    map_dll.append(Field(FieldType.WALKABLE))  # team - id=4
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.OCCASION))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.OCCASION))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))  # was Minigame
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.OCCASION))
-    map_dll.append(Field(FieldType.OCCASION))
-    map_dll.append(Field(FieldType.SHORTCUT, 18, 'easy'))  # id == 14
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.OCCASION))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    # Second Section
-    map_dll.append(Field(FieldType.WALKABLE))  # id == 23
-    map_dll.append(Field(FieldType.OCCASION))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.SHORTCUT, 33, 'easy'))
-    map_dll.append(Field(FieldType.OCCASION))
-    map_dll.append(Field(FieldType.OCCASION))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.OCCASION))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.OCCASION))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.SHORTCUT, 42, 'medium'))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.OCCASION))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.OCCASION))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.SHORTCUT, 57, 'medium'))
-    map_dll.append(Field(FieldType.OCCASION))
-    map_dll.append(Field(FieldType.OCCASION))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.OCCASION))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.OCCASION))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.OCCASION))
-    map_dll.append(Field(FieldType.OCCASION))
-    map_dll.append(Field(FieldType.OCCASION))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.OCCASION))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.SHORTCUT, 83, 'hard'))
-    map_dll.append(Field(FieldType.OCCASION))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.OCCASION))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.WALKABLE))
-    map_dll.append(Field(FieldType.OCCASION))
-    map_dll.append(Field(FieldType.OCCASION))
-    map_dll.append(Field(FieldType.OCCASION))
-    map_dll.append(Field(FieldType.Goal))
-
-    return map_dll
+        object.__setattr__(self, 'index', index)
+        object.__setattr__(self, 'shortcut_field', shortcut_field)  # int
+        object.__setattr__(self, 'difficulty', difficulty)
+        object.__setattr__(self, 'type', field_type)  # type: FieldType
+
+    def __setattr__(self, key, value):
+        raise AttributeError('Field is immutable')
+
+    def to_dict(self):
+        return {
+            'index': self.index,
+            'type': self.type.value,
+            'shortcut': self.shortcut_field,
+            'difficulty': self.difficulty,
+        }
+
+    def __repr__(self):
+        return 'Field(index={}  type={})'.format(self.index, self.type.name)
+
+
+class CompiledMap:
+    """
+    Immutable array representation of a map. Positions on the map are indexes into `fields`.
+    A CompiledMap is built once and shared read-only by all games.
+
+    next_special_field[i] is the index of the first shortcut field after position i or len(fields), if there is none.
+    distance_to_goal[i] is the number of fields between position i and the goal field.
+    """
+    __slots__ = ('fields', 'goal_index', 'next_special_field', 'distance_to_goal')
+
+    def __init__(self, fields: List[Field]):
+        fields = tuple(fields)
+        for index, field in enumerate(fields):
+            if field.index != index:
+                raise AssertionError('Field at position {} has index {}'.format(index, field.index))
+
+        next_special_field = [len(fields)] * len(fields)
+        for index in range(len(fields) - 2, -1, -1):
+            if fields[index + 1].type == FieldType.SHORTCUT:
+                next_special_field[index] = index + 1
+            else:
+                next_special_field[index] = next_special_field[index + 1]
+
+        object.__setattr__(self, 'fields', fields)
+        object.__setattr__(self, 'goal_index', len(fields) - 1)
+        object.__setattr__(self, 'next_special_field', tuple(next_special_field))
+        object.__setattr__(self, 'distance_to_goal', tuple(len(fields) - 1 - index for index in range(len(fields))))
+
+    def __setattr__(self, key, value):
+        raise AttributeError('CompiledMap is immutable')
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __getitem__(self, index) -> Field:
+        return self.fields[index]
+
+
+def parse_map(field_dicts: List[dict]) -> CompiledMap:
+    """
+    Validates and compiles a map definition. A map definition is a list of fields in the form:
+    {
+        'index': 14,
+        'type': 'shortcut',
+        'shortcut': 18,         # target of shortcut fields, otherwise null
+        'difficulty': 'easy',   # pantomime difficulty of shortcut fields, otherwise null
+    }
+
+    :raise InvalidMapException: If the definition is invalid
+    """
+    if not isinstance(field_dicts, list) or not field_dicts:
+        raise InvalidMapException('Map definition must be a non empty list of fields')
+
+    fields = []
+    for position, field_dict in enumerate(field_dicts):
+        try:
+            index = field_dict['index']
+            field_type = FieldType(field_dict['type'])
+        except (KeyError, TypeError, ValueError) as e:
+            raise InvalidMapException('Invalid field at position {}: {}'.format(position, e))
+        if index != position:
+            raise InvalidMapException('Field at position {} has index {}'.format(position, index))
+
+        shortcut_field = field_dict.get('shortcut')
+        difficulty = field_dict.get('difficulty')
+        if field_type == FieldType.SHORTCUT:
+            if not isinstance(shortcut_field, int) or not position < shortcut_field < len(field_dicts):
+                raise InvalidMapException(
+                    'Shortcut at position {} has invalid target: {}'.format(position, shortcut_field)
+                )
+            if difficulty not in PANTOMIME_WORDS:
+                raise InvalidMapException(
+                    'Shortcut at position {} has invalid difficulty: {}'.format(position, difficulty)
+                )
+        elif shortcut_field is not None or difficulty is not None:
+            raise InvalidMapException('Field at position {} is no shortcut, but has a target'.format(position))
+
+        fields.append(Field(index, field_type, shortcut_field, difficulty))
+
+    goal_indices = [field.index for field in fields if field.type == FieldType.Goal]
+    if goal_indices != [len(fields) - 1]:
+        raise InvalidMapException('The last field and only the last field must be the goal field')
+
+    return CompiledMap(fields)
+
+
+class MapRegistry:
+    """
+    Compiled maps by id. Every map is compiled once, when it is registered.
+    """
+    def __init__(self):
+        self._maps: Dict[str, CompiledMap] = {}
+        self._json: Dict[str, bytes] = {}
+        self._etags: Dict[str, str] = {}
+
+    def register(self, map_id, compiled_map: CompiledMap):
+        map_json = json.dumps([field.to_dict() for field in compiled_map.fields], separators=(',', ':')).encode()
+        self._maps[map_id] = compiled_map
+        self._json[map_id] = map_json
+        self._etags[map_id] = '"{}"'.format(hashlib.sha1(map_json).hexdigest())
+
+    def load_file(self, map_id, path):
+        with open(path, encoding='utf-8') as f:
+            try:
+                compiled_map = parse_map(json.load(f))
+            except InvalidMapException as e:
+                raise InvalidMapException('Invalid map "{}" ({}): {}'.format(map_id, path, e))
+        self.register(map_id, compiled_map)
+
+    def load_directory(self, directory):
+        """
+        Registers every <map_id>.json file in the given directory.
+        """
+        for path in sorted(glob.glob(os.path.join(directory, '*.json'))):
+            self.load_file(os.path.splitext(os.path.basename(path))[0], path)
+
+    def __contains__(self, map_id):
+        return map_id in self._maps
+
+    def ids(self):
+        return list(self._maps.keys())
+
+    def get(self, map_id) -> CompiledMap:
+        try:
+            return self._maps[map_id]
+        except KeyError:
+            raise UnknownMapException('Unknown map: {}'.format(map_id))
+
+    def get_json(self, map_id) -> bytes:
+        """
+        :return: The compiled map encoded as json
+        """
+        self.get(map_id)
+        return self._json[map_id]
+
+    def get_etag(self, map_id) -> str:
+        self.get(map_id)
+        return self._etags[map_id]
+
+
+class InvalidMapException(Exception):
+    pass
+
+
+class UnknownMapException(KeyError):
+    pass
+
+
+maps = MapRegistry()
+# mole/static/map.json is the old 12 field layout, which is left unchanged for clients that still load it
+maps.load_directory(os.path.join(MAP_DIR, 'maps'))
+
+
+def create_map(map_id=DEFAULT_MAP_ID) -> CompiledMap:
+    """
+    :return: The shared compiled map with the given id
+    """
+    return maps.get(map_id)
@@ -64,8 +64,17 @@ class PantomimeState:
         self.start_time = None
         self.ignored_player = None
 
-    def start_timeout(self):
-        self.start_time = _get_time()
+    def start_timeout(self, elapsed_time=0.0):
+        """
+        :param elapsed_time: Seconds of the timeout that already passed, e.g. before the game was restored
+        """
+        self.start_time = _get_time() - elapsed_time
+
+    def elapsed_time(self):
+        """
+        :return: Seconds since the timeout started or None, if it did not start yet
+        """
+        return None if self.start_time is None else _get_time() - self.start_time
 
     def is_timeout(self):
         return self.timeout_started() and _get_time() > self.start_time + PANTOMIME_DURATION
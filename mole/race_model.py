@@ -0,0 +1,273 @@
+"""
+Vectorised Monte Carlo model of the race between the team and Moriarty on the board.
+
+The model only plays the movement rules of mole.game: a turn is a dice roll with probability dice_rate (searching,
+sharing and validating clues do not move the team), a shortcut is taken, if its pantomime succeeds, and Moriarty moves
+MORIARTY_STEPS after every turn and MORIARTY_AUTO_STEPS with the timed auto moves of the difficulty. Occasions,
+proofs and disconnects are not modelled and timed auto moves also happen during pantomimes.
+
+All races of a call are simulated together as numpy arrays with one iteration per turn, so hundreds of thousands of
+races take a second or two. The board is taken from the map registry and the tuning constants from mole.game on every
+call, so changes of a map or of the difficulty parameters show up immediately.
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from . import game as game_module
+from .game import DEFAULT_START_POSITION, _parse_difficulty
+from .map import create_map, CompiledMap, FieldType, DEFAULT_MAP_ID
+
+RACE_TUNABLES = (
+    'MORIARTY_AUTO_MOVE_INTERVAL', 'MORIARTY_AUTO_MOVE_FACTORS', 'MORIARTY_STEPS', 'MORIARTY_STEP_WEIGHTS',
+    'MORIARTY_AUTO_STEPS', 'MORIARTY_AUTO_STEP_WEIGHTS',
+)
+DEFAULT_RACES = 100000
+# a race, that is not over after this many turns, is counted as unfinished
+MAX_TURNS = 1000
+
+UNFINISHED = 0
+CAUGHT = 1
+REACHED_GOAL = 2
+
+
+def numpy_available():
+    return np is not None
+
+
+class BoardArrays:
+    """
+    The fields of a CompiledMap the race depends on, as numpy arrays indexed by position.
+    """
+    def __init__(self, compiled_map: CompiledMap):
+        self.goal_index = compiled_map.goal_index
+        self.next_shortcut = np.array(compiled_map.next_special_field, dtype=np.int64)
+        # the position after taking the shortcut of a field, the position itself for other fields
+        self.shortcut_target = np.array([
+            field.shortcut_field if field.type == FieldType.SHORTCUT else field.index for field in compiled_map.fields
+        ], dtype=np.int64)
+
+
+class RaceDistribution:
+    """
+    Outcomes of the races with the same start position and difficulty.
+    """
+    def __init__(self, start_position, difficulty, outcomes, turns, seconds):
+        self.start_position = start_position
+        self.difficulty = difficulty  # type: game_module.DifficultyLevel
+        self.outcomes = outcomes  # UNFINISHED, CAUGHT or REACHED_GOAL per race
+        self.turns = turns  # turns until the race was over
+        self.seconds = seconds  # seconds of game time until the race was over
+
+    @property
+    def races(self) -> int:
+        return len(self.outcomes)
+
+    def rate(self, outcome) -> float:
+        return float(np.count_nonzero(self.outcomes == outcome)) / self.races if self.races else 0.0
+
+    @property
+    def catch_probability(self) -> float:
+        return self.rate(CAUGHT)
+
+    def turn_histogram(self, outcome=REACHED_GOAL):
+        """
+        :return: An array, whose element i is the number of races with the outcome, that were over after i turns
+        """
+        return np.bincount(self.turns[self.outcomes == outcome])
+
+    def to_dict(self):
+        def quartiles(values):
+            return np.percentile(values, [25, 50, 75]).tolist() if len(values) else None
+
+        caught = self.outcomes == CAUGHT
+        reached_goal = self.outcomes == REACHED_GOAL
+        return {
+            'start_position': self.start_position,
+            'difficulty': self.difficulty.name.lower(),
+            'races': self.races,
+            'catch_probability': self.catch_probability,
+            'reach_goal_probability': self.rate(REACHED_GOAL),
+            'unfinished_rate': self.rate(UNFINISHED),
+            'catch_turn_quartiles': quartiles(self.turns[caught]),
+            'catch_seconds_quartiles': quartiles(self.seconds[caught]),
+            'goal_turn_quartiles': quartiles(self.turns[reached_goal]),
+            'goal_seconds_quartiles': quartiles(self.seconds[reached_goal]),
+        }
+
+
+class _Races:
+    """
+    State of the running races. Races that are over are removed by compact(), their results stay in the result
+    arrays, which are indexed by race id.
+    """
+    def __init__(self, team, moriarty, deadline, interval_factor):
+        num_races = len(team)
+        self.ids = np.arange(num_races)
+        self.team = team
+        self.moriarty = moriarty
+        self.clock = np.zeros(num_races)
+        self.deadline = deadline  # time of the next timed auto move, inf without timed auto moves
+        self.interval_factor = interval_factor
+        self.running = np.ones(num_races, dtype=bool)
+
+        self.outcomes = np.full(num_races, UNFINISHED, dtype=np.int8)
+        self.turns = np.zeros(num_races, dtype=np.int64)
+        self.seconds = np.zeros(num_races)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def over(self, indexes, outcome, turn, seconds):
+        race_ids = self.ids[indexes]
+        self.outcomes[race_ids] = outcome
+        self.turns[race_ids] = turn
+        self.seconds[race_ids] = seconds
+        self.running[indexes] = False
+
+    def compact(self):
+        keep = np.flatnonzero(self.running)
+        self.ids = self.ids[keep]
+        self.team = self.team[keep]
+        self.moriarty = self.moriarty[keep]
+        self.clock = self.clock[keep]
+        self.deadline = self.deadline[keep]
+        self.interval_factor = self.interval_factor[keep]
+        self.running = self.running[keep]
+
+
+def _move_moriarty(team, moriarty, steps, goal_index):
+    """
+    Vectorised Game.moriarty_move().
+
+    :return: The new positions of moriarty and a mask of the races, in which moriarty caught the team
+    """
+    target = moriarty + steps
+    caught = (target > goal_index) | ((moriarty < team) & (team <= target))
+    return np.minimum(target, goal_index), caught
+
+
+def _auto_move_factor(factors, level) -> float:
+    """
+    :param factors: MORIARTY_AUTO_MOVE_FACTORS, whose keys may also be difficulty names like 'hard'
+    :return: The factor of the auto move interval of the difficulty, inf without timed auto moves
+    """
+    factor = factors[level] if level in factors else factors[level.name.lower()]
+    return np.inf if factor is None else factor
+
+
+def simulate_races(num_races=DEFAULT_RACES, start_positions=(DEFAULT_START_POSITION,),
+                   difficulties=('easy', 'medium', 'hard'), map_id=DEFAULT_MAP_ID, moriarty_position=0,
+                   enable_minigames=True, dice_rate=0.5, pantomime_success=0.7, turn_time=(5.0, 30.0), seed=0,
+                   overrides=None):
+    """
+    Simulates num_races races for every combination of start position and difficulty.
+
+    :param start_positions: Start positions of the team
+    :param dice_rate: Probability, that a player rolls the dice in a turn
+    :param pantomime_success: Probability, that the pantomime of a shortcut succeeds
+    :param turn_time: Range of the seconds a turn takes
+    :param overrides: Maps names in RACE_TUNABLES to the values used instead of the ones of mole.game
+    :return: A list of RaceDistributions, one for every combination of start position and difficulty
+    """
+    if np is None:
+        raise RaceModelException('The race model needs numpy, install it with: pip install numpy')
+    overrides = dict(overrides or {})
+    unknown = set(overrides) - set(RACE_TUNABLES)
+    if unknown:
+        raise RaceModelException('Unknown tunables: {}'.format(', '.join(sorted(unknown))))
+    constants = {name: overrides.get(name, getattr(game_module, name)) for name in RACE_TUNABLES}
+
+    board = BoardArrays(create_map(map_id))
+    goal_index = board.goal_index
+    for start_position in start_positions:
+        if not moriarty_position < start_position < goal_index:
+            raise RaceModelException('Start position {} is not between moriarty at {} and the goal at {}'.format(
+                start_position, moriarty_position, goal_index
+            ))
+    try:
+        levels = [_parse_difficulty(difficulty) for difficulty in difficulties]
+    except ValueError as e:
+        raise RaceModelException(str(e))
+
+    turn_steps = np.array(constants['MORIARTY_STEPS'])
+    turn_weights = np.array(constants['MORIARTY_STEP_WEIGHTS'], dtype=float)
+    auto_steps = np.array(constants['MORIARTY_AUTO_STEPS'])
+    auto_weights = np.array(constants['MORIARTY_AUTO_STEP_WEIGHTS'], dtype=float)
+    min_interval, max_interval = constants['MORIARTY_AUTO_MOVE_INTERVAL']
+    factors = constants['MORIARTY_AUTO_MOVE_FACTORS']
+
+    # the races of a combination are consecutive
+    combinations = [(start_position, level) for start_position in start_positions for level in levels]
+    combination = np.repeat(np.arange(len(combinations)), num_races)
+    team = np.array([start_position for start_position, _ in combinations], dtype=np.int64)[combination]
+    interval_factor = np.array([
+        _auto_move_factor(factors, level) for _, level in combinations
+    ])[combination]
+
+    rng = np.random.default_rng(seed)
+    races = _Races(
+        team,
+        np.full(len(team), moriarty_position, dtype=np.int64),
+        rng.uniform(min_interval, max_interval, len(team)) * interval_factor,
+        interval_factor,
+    )
+
+    for turn in range(1, MAX_TURNS + 1):
+        if not len(races):
+            break
+        races.clock += rng.uniform(turn_time[0], turn_time[1], len(races))
+
+        # timed auto moves during the turn
+        due = np.flatnonzero(races.deadline <= races.clock)
+        while len(due):
+            steps = rng.choice(auto_steps, size=len(due), p=auto_weights / auto_weights.sum())
+            races.moriarty[due], caught = _move_moriarty(races.team[due], races.moriarty[due], steps, goal_index)
+            races.over(due[caught], CAUGHT, turn, races.deadline[due[caught]])
+            races.deadline[due] += rng.uniform(min_interval, max_interval, len(due)) * races.interval_factor[due]
+            due = np.flatnonzero(races.running & (races.deadline <= races.clock))
+
+        # the team moves, like Game.handle_movement() without occasions
+        moving = np.flatnonzero(races.running)
+        rolls = rng.integers(1, 7, len(moving)) * (rng.random(len(moving)) < dice_rate)
+        position = races.team[moving]
+        target = np.minimum(position + rolls, goal_index)
+        if enable_minigames:
+            shortcut = board.next_shortcut[position]
+            on_shortcut = (rolls > 0) & (shortcut <= target)
+            target = np.where(on_shortcut, shortcut, target)
+            taken = on_shortcut & (rng.random(len(moving)) < pantomime_success)
+            target = np.where(taken, board.shortcut_target[target], target)
+        else:
+            target = board.shortcut_target[target]
+        races.team[moving] = target
+        reached_goal = moving[target == goal_index]
+        races.over(reached_goal, REACHED_GOAL, turn, races.clock[reached_goal])
+
+        # moriarty moves at the end of the turn
+        moving = np.flatnonzero(races.running)
+        steps = rng.choice(turn_steps, size=len(moving), p=turn_weights / turn_weights.sum())
+        races.moriarty[moving], caught = _move_moriarty(
+            races.team[moving], races.moriarty[moving], steps, goal_index
+        )
+        races.over(moving[caught], CAUGHT, turn, races.clock[moving[caught]])
+
+        races.compact()
+
+    races.turns[races.ids] = MAX_TURNS
+    races.seconds[races.ids] = races.clock
+
+    return [
+        RaceDistribution(
+            start_position, level,
+            races.outcomes[index * num_races:(index + 1) * num_races],
+            races.turns[index * num_races:(index + 1) * num_races],
+            races.seconds[index * num_races:(index + 1) * num_races],
+        )
+        for index, (start_position, level) in enumerate(combinations)
+    ]
+
+
+class RaceModelException(Exception):
+    pass
@@ -0,0 +1,114 @@
+"""
+Deterministic replay of game journals (see mole.journal).
+
+A replay creates the game with the recorded arguments and processes the recorded events in order. The random number
+generator starts in the recorded state and every draw is checked against the journal, so after a replay it is in
+the state of the recorded game. The scheduler runs on a virtual clock, which is set to the recorded time of each
+event, so a replay runs as fast as the engine processes the events. Events that were rejected with an
+InvalidMessageException are rejected again.
+"""
+import marshal
+import random
+
+from .clues import Clue
+from .game import Game, InvalidMessageException, _unpack_rng_state
+from .journal import read_frames, decode_random, JOURNALED_EVENTS, START, EVENT, RANDOM, BITS, \
+    InvalidJournalException
+from .scheduler import Scheduler, VirtualClock
+from .transport import NullTransport
+
+
+class ReplayRandom(random.Random):
+    """
+    Draws like the random number generator of the recorded game and checks every draw against the journal.
+    """
+    def __init__(self, frames, rng_state):
+        """
+        :param frames: The iterator over the journal frames, that the replay reads events from as well
+        :param rng_state: The state of the generator, when the journal was started
+        """
+        super().__init__()
+        _unpack_rng_state(rng_state, self)
+        self._frames = frames
+
+    def _next(self, expected_kind):
+        kind, body = next(self._frames, (None, None))
+        if kind != expected_kind:
+            raise ReplayDivergedException(
+                'The game drew a random number, but the journal has {} frame'.format(kind or 'no')
+            )
+        return body
+
+    def random(self):
+        value = super().random()
+        recorded = decode_random(self._next(RANDOM))
+        if value != recorded:
+            raise ReplayDivergedException('The game drew {}, but the journal has {}'.format(value, recorded))
+        return value
+
+    def getrandbits(self, k):
+        value = super().getrandbits(k)
+        recorded = marshal.loads(self._next(BITS))
+        if value != recorded:
+            raise ReplayDivergedException('The game drew {}, but the journal has {}'.format(value, recorded))
+        return value
+
+
+class Replay:
+    def __init__(self, game: Game, num_events: int, duration: float):
+        """
+        :param duration: Seconds between the start of the recorded game and its last event
+        """
+        self.game = game
+        self.num_events = num_events
+        self.duration = duration
+
+
+def replay_journal(data: bytes, transport=None) -> Replay:
+    """
+    :param transport: Gets the messages of the replayed game. Defaults to a NullTransport.
+    """
+    frames = read_frames(data)
+    kind, body = next(frames, (None, None))
+    if kind != START:
+        raise InvalidJournalException('Journal does not start with a START frame')
+    start_time, arguments = marshal.loads(body)
+    (
+        token, host_sid, player_infos, start_position, test_choices, all_proofs, enable_minigames,
+        moriarty_position, difficulty, map_id, solution, seed, rng_state,
+    ) = arguments
+
+    transport = transport if transport is not None else NullTransport()
+    clock = VirtualClock(start_time)
+    game = Game(
+        transport, token, host_sid, player_infos, start_position, test_choices, all_proofs, enable_minigames,
+        moriarty_position, difficulty, scheduler=Scheduler(clock), map_id=map_id,
+        solution_clues=[Clue(name, main_type, subtype) for name, main_type, subtype in solution],
+        rng=ReplayRandom(frames, rng_state), seed=seed
+    )
+
+    num_events = 0
+    for kind, body in frames:
+        if kind != EVENT:
+            raise ReplayDivergedException('Expected an event, but the journal has {} frame'.format(kind))
+        clock.now, event, args = marshal.loads(body)
+        with_transport = JOURNALED_EVENTS.get(event)
+        if with_transport is None:
+            raise InvalidJournalException('Unknown event: {}'.format(event))
+
+        method = getattr(game, event)
+        try:
+            with transport.batch():
+                if with_transport:
+                    method(transport, *args)
+                else:
+                    method(*args)
+        except InvalidMessageException:
+            pass
+        num_events += 1
+
+    return Replay(game, num_events, clock.now - start_time)
+
+
+class ReplayDivergedException(Exception):
+    pass
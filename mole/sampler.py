@@ -0,0 +1,115 @@
+import random
+from typing import Dict, List
+
+from .clues import Clue
+
+# A clue nobody has yet is this many times more likely to be found than a clue another player already has
+UNOWNED_WEIGHT = 4
+OWNED_WEIGHT = 1
+
+
+class IndexedSet:
+    """
+    A set that supports adding, removing and picking an item by position in O(1).
+    The order of the items changes when items are removed.
+    """
+    __slots__ = ('_items', '_positions')
+
+    def __init__(self, items=()):
+        self._items = []
+        self._positions = {}
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        if item in self._positions:
+            return
+        self._positions[item] = len(self._items)
+        self._items.append(item)
+
+    def discard(self, item):
+        position = self._positions.pop(item, None)
+        if position is None:
+            return
+        last = self._items.pop()
+        if position < len(self._items):
+            self._items[position] = last
+            self._positions[last] = position
+
+    def __getitem__(self, position):
+        return self._items[position]
+
+    def __contains__(self, item):
+        return item in self._positions
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class ClueSampler:
+    """
+    Draws the clue a player finds with a search.
+
+    Findable are the solution clues the player does not have and whose main type is not verified yet. A clue that
+    no player has is UNOWNED_WEIGHT times more likely than a clue another player already has.
+    The candidate sets are updated when a clue is added or a main type is verified, so a draw is O(1).
+    """
+    def __init__(self, solution_clues: List[Clue], player_ids, rng=random):
+        self.rng = rng
+        self._clues_by_type = {}  # type: Dict[str, List[Clue]]
+        for clue in solution_clues:
+            self._clues_by_type.setdefault(clue.main_type, []).append(clue)
+        self._verified_types = set()
+        self._holders = {clue.name: set() for clue in solution_clues}
+
+        self._unowned = IndexedSet(solution_clues)
+        self._owned_by_others = {player_id: IndexedSet() for player_id in player_ids}  # type: Dict[int, IndexedSet]
+
+    def add_clue(self, player_id: int, clue: Clue):
+        """
+        Records that the player now has the clue.
+        """
+        holders = self._holders.get(clue.name)
+        if holders is None or player_id in holders:
+            return
+        holders.add(player_id)
+
+        if clue.main_type in self._verified_types:
+            return
+        if len(holders) == 1:
+            self._unowned.discard(clue)
+            for other_id, candidates in self._owned_by_others.items():
+                if other_id != player_id:
+                    candidates.add(clue)
+        else:
+            self._owned_by_others[player_id].discard(clue)
+
+    def verify_type(self, main_type: str):
+        """
+        Records that the main type is verified. Its clues can not be found anymore.
+        """
+        if main_type in self._verified_types:
+            return
+        self._verified_types.add(main_type)
+        for clue in self._clues_by_type.get(main_type, []):
+            self._unowned.discard(clue)
+            for candidates in self._owned_by_others.values():
+                candidates.discard(clue)
+
+    def draw(self, player_id: int) -> Clue or None:
+        """
+        :return: A random findable clue for the player or None, if there is none
+        """
+        owned = self._owned_by_others[player_id]
+        unowned_weight = len(self._unowned) * UNOWNED_WEIGHT
+        total = unowned_weight + len(owned) * OWNED_WEIGHT
+        if total == 0:
+            return None
+
+        r = self.rng.randrange(total)
+        if r < unowned_weight:
+            return self._unowned[r // UNOWNED_WEIGHT]
+        return owned[(r - unowned_weight) // OWNED_WEIGHT]
@@ -0,0 +1,224 @@
+import asyncio
+import heapq
+import itertools
+import sys
+import threading
+import time
+import traceback
+
+
+class TimerHandle:
+    __slots__ = ('deadline', 'callback', 'args', 'cancelled', 'queued')
+
+    def __init__(self, deadline, callback, args):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        self.queued = True
+
+    def __repr__(self):
+        return 'TimerHandle(deadline={:.3f}  callback={}  cancelled={})'.format(
+            self.deadline, getattr(self.callback, '__name__', self.callback), self.cancelled
+        )
+
+
+class VirtualClock:
+    """
+    A clock, that only advances when it is set, e.g. for replays and simulations.
+    """
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    def __call__(self):
+        return self.now
+
+
+class Scheduler:
+    """
+    Runs callbacks at deadlines of a monotonic clock.
+
+    Deadlines are kept in a priority queue, so the run loop only wakes up, if a callback is due.
+    Cancelled timers stay in the queue until they would be due or until more than half of the queue is cancelled.
+    """
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._queue = []  # heap of (deadline, sequence number, TimerHandle)
+        self._sequence = itertools.count()
+        self._num_cancelled = 0
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+
+    def call_at(self, deadline, callback, *args) -> TimerHandle:
+        """
+        Schedules callback(*args) to be called at the given clock time.
+        """
+        handle = TimerHandle(deadline, callback, args)
+        with self._condition:
+            heapq.heappush(self._queue, (deadline, next(self._sequence), handle))
+            # wake up the run loop, if the new timer is the next one due
+            if self._queue[0][2] is handle:
+                self._condition.notify()
+        return handle
+
+    def call_later(self, delay, callback, *args) -> TimerHandle:
+        """
+        Schedules callback(*args) to be called in `delay` seconds.
+        """
+        return self.call_at(self.clock() + delay, callback, *args)
+
+    def cancel(self, handle: TimerHandle or None):
+        if handle is None or handle.cancelled:
+            return
+        with self._condition:
+            handle.cancelled = True
+            if not handle.queued:
+                return
+            self._num_cancelled += 1
+            if self._num_cancelled * 2 > len(self._queue):
+                for entry in self._queue:
+                    if entry[2].cancelled:
+                        entry[2].queued = False
+                self._queue = [entry for entry in self._queue if not entry[2].cancelled]
+                heapq.heapify(self._queue)
+                self._num_cancelled = 0
+
+    def __len__(self):
+        return len(self._queue) - self._num_cancelled
+
+    def _drop_cancelled(self):
+        while self._queue and self._queue[0][2].cancelled:
+            heapq.heappop(self._queue)[2].queued = False
+            self._num_cancelled -= 1
+
+    def next_deadline(self):
+        """
+        :return: The clock time of the next pending timer or None, if there is none
+        """
+        with self._condition:
+            self._drop_cancelled()
+            return self._queue[0][0] if self._queue else None
+
+    def _pop_due(self, now):
+        due = []
+        self._drop_cancelled()
+        while self._queue and self._queue[0][0] <= now:
+            handle = heapq.heappop(self._queue)[2]
+            handle.queued = False
+            if handle.cancelled:
+                self._num_cancelled -= 1
+            else:
+                due.append(handle)
+        return due
+
+    @staticmethod
+    def _run_handles(handles):
+        for handle in handles:
+            if handle.cancelled:
+                continue
+            try:
+                handle.callback(*handle.args)
+            except Exception:
+                print('ERROR: timer callback {} failed'.format(handle), file=sys.stderr)
+                traceback.print_exc()
+
+    def run_due(self, now=None) -> int:
+        """
+        Runs all callbacks that are due at `now` (defaults to the current clock time) in the calling thread.
+
+        :return: The number of callbacks that were due
+        """
+        with self._condition:
+            handles = self._pop_due(self.clock() if now is None else now)
+        self._run_handles(handles)
+        return len(handles)
+
+    def is_running(self):
+        return self._running
+
+    def start(self):
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name='scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._thread = None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._running:
+                    return
+                self._drop_cancelled()
+                if not self._queue:
+                    self._condition.wait()
+                    continue
+                timeout = self._queue[0][0] - self.clock()
+                if timeout > 0:
+                    self._condition.wait(timeout)
+                    continue
+                handles = self._pop_due(self.clock())
+            self._run_handles(handles)
+
+
+class AsyncScheduler(Scheduler):
+    """
+    Runs callbacks in an asyncio event loop instead of a thread.
+
+    The callbacks are called synchronously in the loop. After the due callbacks ran, the optional coroutine function
+    `after_run` is awaited, e.g. to send the messages the callbacks emitted.
+    start() must be called from a coroutine running in the loop.
+    """
+    def __init__(self, clock=time.monotonic, after_run=None):
+        super().__init__(clock)
+        self.after_run = after_run
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+
+    def call_at(self, deadline, callback, *args) -> TimerHandle:
+        handle = super().call_at(deadline, callback, *args)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return handle
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = self._loop.create_task(self._run_async())
+
+    def stop(self):
+        self._running = False
+        if self._task is not None:
+            self._task.cancel()
+        self._task = None
+        self._loop = None
+
+    async def _run_async(self):
+        while self._running:
+            next_deadline = self.next_deadline()
+            timeout = None if next_deadline is None else next_deadline - self.clock()
+            if timeout is None or timeout > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self.run_due()
+            if self.after_run is not None:
+                await self.after_run()
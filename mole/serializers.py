@@ -0,0 +1,161 @@
+"""
+Wire serialisers for socket.io messages.
+
+Text frames are encoded with a json module, that is passed to socketio.Server. orjson is used, if it is installed.
+Clients can ask for binary MessagePack frames by connecting with the query parameter `serializer=msgpack`. This
+needs the optional msgpack package. A binary frame is the msgpack encoded packet {'type', 'nsp', 'data', 'id'} like
+socket.io-msgpack-parser sends it. With a SerializingServer every packet from the server is sent as MessagePack to
+such a client: the connect packet, events, acks and messages of other workers. Binary frames from such a client are
+decoded as MessagePack packets, text frames as json. orjson and msgpack are both optional.
+"""
+import json
+import sys
+from urllib.parse import parse_qs
+
+import socketio
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = 'json'
+ORJSON = 'orjson'
+MSGPACK = 'msgpack'
+
+
+class OrjsonModule:
+    """
+    Offers dumps and loads of the json module for orjson. socketio passes json arguments like `separators`, which
+    are ignored, because orjson always produces compact output.
+    """
+    @staticmethod
+    def dumps(obj, **_kwargs) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+
+    @staticmethod
+    def loads(s, **_kwargs):
+        return orjson.loads(s)
+
+
+def get_json_module(name=ORJSON):
+    """
+    :param name: JSON or ORJSON. Falls back to the stdlib json module, if orjson is not installed.
+    :return: A module like object with dumps and loads
+    """
+    if name == JSON:
+        return json
+    if name == ORJSON:
+        if orjson is None:
+            print('WARN: orjson is not installed, using json', file=sys.stderr)
+            return json
+        return OrjsonModule
+    raise UnknownSerializerException('Unknown json serializer: {}'.format(name))
+
+
+def msgpack_available():
+    return msgpack is not None
+
+
+def encode_msgpack_packet(packet_type, namespace, data, packet_id=None) -> bytes:
+    packet = {'type': packet_type, 'nsp': namespace, 'data': data}
+    if packet_id is not None:
+        packet['id'] = packet_id
+    return msgpack.packb(packet, use_bin_type=True)
+
+
+def decode_msgpack_packet(frame: bytes):
+    return msgpack.unpackb(frame, raw=False)
+
+
+def requested_serializer(environ) -> str:
+    """
+    :param environ: The WSGI environ of the connect request
+    :return: MSGPACK, if the client asked for msgpack and it is available, else JSON
+    """
+    query = parse_qs(environ.get('QUERY_STRING', ''))
+    if query.get('serializer', [JSON])[0] != MSGPACK:
+        return JSON
+    if not msgpack_available():
+        print('WARN: client asked for msgpack, but msgpack is not installed', file=sys.stderr)
+        return JSON
+    return MSGPACK
+
+
+def _encode_packet(pkt: socketio.packet.Packet) -> bytes:
+    return encode_msgpack_packet(pkt.packet_type, pkt.namespace or '/', pkt.data, pkt.id)
+
+
+def _client_packet_handler(frame: bytes):
+    """
+    :param frame: A binary frame of a msgpack client
+    :return: The name of the socketio.Server method, that handles the packet in the frame, and its arguments after
+             the sid
+    """
+    pkt = decode_msgpack_packet(frame)
+    namespace = pkt.get('nsp') or '/'
+    packet_type = pkt.get('type')
+    if packet_type == socketio.packet.CONNECT:
+        return '_handle_connect', (namespace,)
+    if packet_type == socketio.packet.DISCONNECT:
+        return '_handle_disconnect', (namespace,)
+    if packet_type == socketio.packet.EVENT:
+        return '_handle_event', (namespace, pkt.get('id'), pkt.get('data'))
+    if packet_type == socketio.packet.ACK:
+        return '_handle_ack', (namespace, pkt.get('id'), pkt.get('data'))
+    raise ValueError('Unexpected msgpack packet type: {}'.format(packet_type))
+
+
+class SerializingServer(socketio.Server):
+    """
+    A socketio.Server, that sends all packets to the sids in msgpack_sids as MessagePack frames and decodes their
+    binary frames as MessagePack packets.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.msgpack_sids = set()  # shared with the SocketIOTransport of this server
+
+    def _send_packet(self, sid, pkt):
+        if sid in self.msgpack_sids:
+            self.eio.send(sid, _encode_packet(pkt), binary=True)
+        else:
+            super()._send_packet(sid, pkt)
+
+    def _handle_eio_message(self, sid, data):
+        if sid in self.msgpack_sids and isinstance(data, bytes) and sid not in self._binary_packet:
+            handler, args = _client_packet_handler(data)
+            getattr(self, handler)(sid, *args)
+        else:
+            super()._handle_eio_message(sid, data)
+
+
+class AsyncSerializingServer(socketio.AsyncServer):
+    """
+    A socketio.AsyncServer, that sends all packets to the sids in msgpack_sids as MessagePack frames and decodes
+    their binary frames as MessagePack packets.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.msgpack_sids = set()  # shared with the AsyncSocketIOTransport of this server
+
+    async def _send_packet(self, sid, pkt):
+        if sid in self.msgpack_sids:
+            await self.eio.send(sid, _encode_packet(pkt), binary=True)
+        else:
+            await super()._send_packet(sid, pkt)
+
+    async def _handle_eio_message(self, sid, data):
+        if sid in self.msgpack_sids and isinstance(data, bytes) and sid not in self._binary_packet:
+            handler, args = _client_packet_handler(data)
+            await getattr(self, handler)(sid, *args)
+        else:
+            await super()._handle_eio_message(sid, data)
+
+
+class UnknownSerializerException(Exception):
+    pass
@@ -0,0 +1,58 @@
+"""
+Wiring of the game engine, that the WSGI server in mole.views and the ASGI server in mole.async_views share.
+"""
+from django.conf import settings
+
+from .game_manager import GameManager
+from .keep_alive import KeepAliveService
+from .sharding import ShardConfig
+from .snapshot import SnapshotStore, SnapshotWriter
+from .socket_events import SocketEvents, PING_INTERVAL
+from .transport import Transport
+
+
+class GameServer:
+    """
+    The game manager, snapshot writer, keep alive service and socket event handlers of a socket.io server, built from
+    the settings. The server registers the handlers in events with its socket.io server.
+    """
+    def __init__(self, transport: Transport, scheduler, shard_config: ShardConfig):
+        """
+        :param scheduler: A Scheduler or AsyncScheduler, which is started with the first game
+        """
+        self.transport = transport
+        self.scheduler = scheduler
+        self.snapshot_writer = (
+            SnapshotWriter(SnapshotStore(settings.GAME_SNAPSHOT_DIR)) if settings.GAME_SNAPSHOT_DIR else None
+        )
+        self.games = GameManager(
+            scheduler, shard_config.token_allocator(settings.GAME_TOKEN_RANGE_START, settings.GAME_TOKEN_RANGE_END),
+            snapshot_writer=self.snapshot_writer, journal_dir=settings.GAME_JOURNAL_DIR or None
+        )
+        self.keep_alive = KeepAliveService(
+            settings.KEEP_ALIVE_URL, settings.KEEP_ALIVE_INTERVAL, should_ping=self.games.is_game_running
+        )
+        self.events = SocketEvents(
+            self.games, transport, on_game_started=self.start_scheduler, shard_config=shard_config
+        )
+
+    def send_ping(self):
+        # ping the host of one running game
+        for game in self.games.running_games():
+            game.send_ping(self.transport)
+            break
+        self.scheduler.call_later(PING_INTERVAL, self.send_ping)
+
+    def start_scheduler(self):
+        if not self.scheduler.is_running():
+            self.scheduler.start()
+            self.scheduler.call_later(PING_INTERVAL, self.send_ping)
+
+    def restore_games(self):
+        """
+        Restores the games of the last run from their snapshots and starts writing snapshots. Called once on startup.
+        """
+        if self.snapshot_writer is None:
+            return
+        self.games.restore_games(self.snapshot_writer.store.load_all(), self.transport)
+        self.snapshot_writer.start()
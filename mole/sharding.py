@@ -0,0 +1,142 @@
+"""
+Sharded deployment: several worker processes, each owning the games of a subset of the tokens.
+
+A worker with index i of n creates only games with tokens t where t % n == i, so the owner of a game follows from its
+token. socket.io messages cross workers through a message queue (SOCKETIO_MESSAGE_QUEUE). A client that joins a game
+owned by another worker is told the url of that worker (SHARD_URLS) and reconnects there.
+"""
+import pickle
+import queue
+import threading
+
+import socketio
+from django.conf import settings
+
+from .tokens import TokenAllocator
+
+
+class ShardConfig:
+    def __init__(self, index=0, count=1, message_queue=None, worker_urls=()):
+        """
+        :param index: Index of this worker
+        :param count: Number of workers
+        :param message_queue: Url of the message queue, e.g. redis://localhost:6379/0. Only needed with two or more
+                              workers.
+        :param worker_urls: Public urls of all workers, ordered by index
+        """
+        if not 0 <= index < count:
+            raise ShardConfigException('Invalid shard index {} for {} shards'.format(index, count))
+        if worker_urls and len(worker_urls) != count:
+            raise ShardConfigException('Got {} worker urls for {} shards'.format(len(worker_urls), count))
+        self.index = index
+        self.count = count
+        self.message_queue = message_queue
+        self.worker_urls = list(worker_urls)
+
+    @staticmethod
+    def from_settings():
+        return ShardConfig(
+            index=settings.SHARD_INDEX,
+            count=settings.SHARD_COUNT,
+            message_queue=settings.SOCKETIO_MESSAGE_QUEUE,
+            worker_urls=settings.SHARD_URLS,
+        )
+
+    def is_sharded(self):
+        return self.count > 1
+
+    def owner_of(self, token) -> int or None:
+        """
+        :return: The index of the worker owning the game with this token or None, if the token is invalid
+        """
+        try:
+            return int(token) % self.count
+        except (TypeError, ValueError):
+            return None
+
+    def owns(self, token) -> bool:
+        owner = self.owner_of(token)
+        return owner is None or owner == self.index
+
+    def worker_url(self, index) -> str or None:
+        return self.worker_urls[index] if self.worker_urls else None
+
+    def token_allocator(self, start, end) -> TokenAllocator:
+        """
+        :return: An allocator for the tokens in [start, end) owned by this worker
+        """
+        first = start + (self.index - start) % self.count
+        return TokenAllocator(first, end, step=self.count)
+
+    def create_client_manager(self, async_mode=False):
+        """
+        :return: A socket.io client manager that sends messages through the message queue or None, if the server
+                 can keep its clients in memory
+        """
+        if not self.message_queue:
+            if self.is_sharded():
+                raise ShardConfigException('A sharded deployment needs SOCKETIO_MESSAGE_QUEUE')
+            return None
+        if self.message_queue.startswith('redis://'):
+            return socketio.AsyncRedisManager(self.message_queue) if async_mode \
+                else socketio.RedisManager(self.message_queue)
+        if async_mode:
+            return socketio.AsyncAioPikaManager(self.message_queue)
+        return socketio.KombuManager(self.message_queue)
+
+
+class LocalBroker:
+    """
+    Stand-in for a message queue, that connects servers in the same process, e.g. to test a sharded deployment.
+    Every published message is delivered to all subscribers, including the publisher.
+    """
+    def __init__(self):
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self) -> queue.Queue:
+        subscriber = queue.Queue()
+        with self._lock:
+            self._subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: queue.Queue):
+        with self._lock:
+            self._subscribers.remove(subscriber)
+        subscriber.put(None)
+
+    def publish(self, message: bytes):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.put(message)
+
+
+class LocalManager(socketio.PubSubManager):
+    """
+    socket.io client manager for a LocalBroker. Messages are pickled like with a real message queue, so a server
+    never shares payload objects with another server.
+    """
+    name = 'local'
+
+    def __init__(self, broker: LocalBroker, channel='socketio', write_only=False):
+        super().__init__(channel=channel, write_only=write_only)
+        self.broker = broker
+        self._subscription = broker.subscribe()
+
+    def _publish(self, data):
+        self.broker.publish(pickle.dumps(data))
+
+    def _listen(self):
+        while True:
+            message = self._subscription.get()
+            if message is None:
+                return
+            yield message
+
+    def close(self):
+        self.broker.unsubscribe(self._subscription)
+
+
+class ShardConfigException(Exception):
+    pass
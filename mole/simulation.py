@@ -0,0 +1,341 @@
+"""
+Headless simulation of games for balancing and benchmarking.
+
+A simulated game runs the real Game rules without a socket server: player policies choose the messages, messages go
+to a transport that drops them, and timers run on a virtual clock, which advances by a random think time after
+every action. Games are simulated in chunks in a process pool and the results are aggregated per difficulty and
+map. The tuning constants of mole.game (see TUNABLES) can be overridden for a simulation.
+"""
+import contextlib
+import random
+import statistics
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from . import game as game_module
+from .clues import Clue
+from .evidence_catalog import SOLUTION_CLUE_TYPES
+from .game import Game, DifficultyLevel, InvalidMessageException, _parse_difficulty
+from .map import DEFAULT_MAP_ID
+from .scheduler import Scheduler, VirtualClock
+from .transport import NullTransport
+from .turn_state import TurnState
+
+TUNABLES = (
+    'MORIARTY_AUTO_MOVE_INTERVAL', 'MORIARTY_AUTO_MOVE_FACTORS', 'MORIARTY_STEPS', 'MORIARTY_STEP_WEIGHTS',
+    'MORIARTY_AUTO_STEPS', 'MORIARTY_AUTO_STEP_WEIGHTS', 'MOLE_WIN_PROOFS', 'TEAM_WIN_PROOFS',
+)
+
+# a game, that is not over after this many actions, is counted as unfinished
+MAX_ACTIONS = 2000
+DEFAULT_CHUNK_SIZE = 200
+
+_PlayerTurnState = TurnState.PlayerTurnState
+
+
+class RandomPolicy:
+    """
+    Chooses the action of a player at random with fixed weights. Guesses in pantomimes are right with the given
+    probability.
+    """
+    name = 'random'
+
+    def __init__(self, dice=0.5, search=0.2, share=0.15, validate=0.15, guess_right=0.7):
+        self.weights = (dice, search, share, validate)
+        self.guess_right = guess_right
+
+    def player_choice(self, game: Game, player, rng: random.Random) -> dict:
+        action = rng.choices(('dice', 'search', 'share', 'validate'), weights=self.weights)[0]
+        if action == 'dice':
+            return {'type': 'dice', 'value': rng.randint(1, 6)}
+        if action == 'search':
+            return {'type': 'search-clue', 'success': True, 'doublesuccess': rng.random() < 0.3}
+        if action == 'share':
+            other = rng.choice([p for p in game.players if p is not player])
+            clue = rng.choice(list(player.inventory))
+            return {'type': 'share-clue', 'with': other.player_id, 'clue': clue.name}
+        main_type = rng.choice(list(player.inventory)).main_type
+        return {
+            'type': 'validate-clues',
+            'clues': [
+                {'name': clue.name, 'type': clue.main_type, 'subtype': clue.subtype}
+                for clue in player.inventory if clue.main_type == main_type
+            ],
+        }
+
+    def occasion_choice(self, game: Game, player, rng: random.Random) -> dict:
+        choice = dict(rng.choice(game.turn_state.occasion_choices), success=True)
+        if choice['type'] == 'skip_player':
+            choice['player_id'] = rng.choice([p for p in game.players if p is not player]).player_id
+        return choice
+
+    def pantomime_guess(self, game: Game, player, rng: random.Random) -> str:
+        pantomime = game.pantomime_state
+        if rng.random() < self.guess_right:
+            return pantomime.solution_word
+        return rng.choice(pantomime.words)
+
+
+class RushPolicy(RandomPolicy):
+    """
+    Scripted policy, that only rolls the dice. Shows how fast the team reaches the goal at best.
+    """
+    name = 'rush'
+
+    def __init__(self):
+        super().__init__(dice=1, search=0, share=0, validate=0, guess_right=1.0)
+
+
+class InvestigatePolicy(RandomPolicy):
+    """
+    Scripted policy, that rolls the dice and validates a main type as soon as the player has all its clues.
+    """
+    name = 'investigate'
+
+    def player_choice(self, game: Game, player, rng: random.Random) -> dict:
+        for main_type, names in game.get_unverified_solution().items():
+            if all(name in player.inventory for name in names):
+                return {
+                    'type': 'validate-clues',
+                    'clues': [{'name': name, 'type': main_type, 'subtype': None} for name in names],
+                }
+        if rng.random() < 0.5:
+            return {'type': 'dice', 'value': rng.randint(1, 6)}
+        return {'type': 'search-clue', 'success': True}
+
+
+POLICIES = {policy.name: policy for policy in (RandomPolicy, RushPolicy, InvestigatePolicy)}
+
+
+class _ResultTransport(NullTransport):
+    """
+    Drops all messages, but keeps the game over message.
+    """
+    def __init__(self):
+        super().__init__()
+        self.game_over = None
+
+    def _send(self, event, data, room, skip_sid):
+        if event == 'gameover':
+            self.game_over = data
+
+
+class _NullWriter:
+    @staticmethod
+    def write(_text):
+        return 0
+
+    @staticmethod
+    def flush():
+        pass
+
+
+def solution_clues():
+    """
+    :return: Solution clues with one clue of every solution clue type, so a simulation needs no database
+    """
+    return [
+        Clue('{}_{}'.format(main_type, subtype), str(main_type), str(subtype))
+        for main_type, subtype in SOLUTION_CLUE_TYPES
+    ]
+
+
+class GameResult:
+    __slots__ = ('difficulty', 'map_id', 'winner', 'reason', 'actions', 'duration', 'finished')
+
+    def __init__(self, difficulty, map_id, winner, reason, actions, duration, finished):
+        self.difficulty = difficulty
+        self.map_id = map_id
+        self.winner = winner
+        self.reason = reason
+        self.actions = actions  # actions of the players
+        self.duration = duration  # seconds of game time
+        self.finished = finished
+
+
+def simulate_game(seed, difficulty='medium', map_id=DEFAULT_MAP_ID, num_players=4, policy=None,
+                  think_time=(3.0, 15.0), enable_minigames=True) -> GameResult:
+    """
+    Simulates one game. The same arguments always give the same result.
+
+    :param think_time: Range of the seconds the virtual clock advances after every action
+    """
+    policy = policy if policy is not None else RandomPolicy()
+    rng = random.Random(seed)  # draws of the players, the game has its own generator
+    clock = VirtualClock()
+    scheduler = Scheduler(clock)
+    transport = _ResultTransport()
+    player_infos = [
+        {'player_id': i, 'name': 'player{}'.format(i), 'sid': 'sid{}'.format(i)} for i in range(num_players)
+    ]
+    game = Game(
+        transport, 'simulation', 'host', player_infos, None, enable_minigames=enable_minigames,
+        difficulty=difficulty, scheduler=scheduler, map_id=map_id, solution_clues=solution_clues(), seed=seed
+    )
+
+    actions = 0
+    while actions < MAX_ACTIONS and game.turn_state.player_turn_state != _PlayerTurnState.GAME_OVER:
+        actions += 1
+        player = game.get_current_player()
+        state = game.turn_state.player_turn_state
+        try:
+            if state == _PlayerTurnState.PLAYER_CHOOSING:
+                game.player_choice(transport, player.sid, policy.player_choice(game, player, rng))
+            elif state == _PlayerTurnState.PLAYER_CHOOSING_OCCASION:
+                game.player_occasion_choice(transport, player.sid, policy.occasion_choice(game, player, rng))
+            elif state == _PlayerTurnState.PLAYING_MINIGAME:
+                if not game.pantomime_state.timeout_started():
+                    game.pantomime_start(transport, player.sid, None)
+                for guesser in game.players:
+                    if guesser is not player and guesser.player_id not in game.pantomime_state.guesses:
+                        guess = policy.pantomime_guess(game, guesser, rng)
+                        game.pantomime_choice(transport, guesser.sid, {'guess': guess})
+                        break
+        except InvalidMessageException:
+            pass
+        clock.advance(rng.uniform(*think_time))
+        scheduler.run_due()
+    game.stop()
+
+    game_over = transport.game_over
+    return GameResult(
+        difficulty, map_id,
+        winner=game_over['winner'] if game_over else None,
+        reason=game_over['reason'] if game_over else None,
+        actions=actions,
+        duration=clock.now,
+        finished=game_over is not None,
+    )
+
+
+class SimulationReport:
+    """
+    Aggregated results of simulated games with the same difficulty and map.
+    """
+    def __init__(self, difficulty, map_id):
+        self.difficulty = difficulty
+        self.map_id = map_id
+        self.games = 0
+        self.unfinished = 0
+        self.wins = {}  # maps winners to numbers of games
+        self.reasons = {}  # maps game over reasons to numbers of games
+        self.actions = []
+        self.durations = []
+
+    def add(self, result: GameResult):
+        self.games += 1
+        if not result.finished:
+            self.unfinished += 1
+            return
+        self.wins[result.winner] = self.wins.get(result.winner, 0) + 1
+        self.reasons[result.reason] = self.reasons.get(result.reason, 0) + 1
+        self.actions.append(result.actions)
+        self.durations.append(result.duration)
+
+    def merge(self, other: 'SimulationReport'):
+        self.games += other.games
+        self.unfinished += other.unfinished
+        for winner, count in other.wins.items():
+            self.wins[winner] = self.wins.get(winner, 0) + count
+        for reason, count in other.reasons.items():
+            self.reasons[reason] = self.reasons.get(reason, 0) + count
+        self.actions.extend(other.actions)
+        self.durations.extend(other.durations)
+
+    def rate(self, count) -> float:
+        return count / self.games if self.games else 0.0
+
+    def to_dict(self):
+        def quartiles(values):
+            if len(values) < 2:
+                return values * 3 if values else None
+            return statistics.quantiles(values, n=4)
+
+        return {
+            'difficulty': self.difficulty,
+            'map': self.map_id,
+            'games': self.games,
+            'team_win_rate': self.rate(self.wins.get('team', 0)),
+            'mole_win_rate': self.rate(self.wins.get('mole', 0)),
+            'moriarty_catch_rate': self.rate(self.reasons.get('moriarty_caught_team', 0)),
+            'unfinished_rate': self.rate(self.unfinished),
+            'reasons': {reason: self.rate(count) for reason, count in sorted(self.reasons.items())},
+            'actions_quartiles': quartiles(self.actions),
+            'duration_quartiles': quartiles(self.durations),
+        }
+
+
+def _by_difficulty_level(factors):
+    """
+    :param factors: MORIARTY_AUTO_MOVE_FACTORS, whose keys may also be difficulty names like 'hard'
+    :return: The factors with DifficultyLevel keys, like mole.game uses them
+    """
+    try:
+        return {
+            level if isinstance(level, DifficultyLevel) else _parse_difficulty(level): factor
+            for level, factor in factors.items()
+        }
+    except ValueError as e:
+        raise SimulationException(str(e))
+
+
+def _simulate_chunk(seeds, difficulty, map_id, policy_name, overrides, kwargs):
+    for name, value in overrides.items():
+        setattr(game_module, name, value)
+    report = SimulationReport(difficulty, map_id)
+    policy = POLICIES[policy_name]()
+    # the engine prints a lot of debug output
+    with contextlib.redirect_stdout(_NullWriter), contextlib.redirect_stderr(_NullWriter):
+        for seed in seeds:
+            report.add(simulate_game(seed, difficulty, map_id, policy=policy, **kwargs))
+    return report
+
+
+def simulate(num_games, difficulties=('easy', 'medium', 'hard'), map_ids=(DEFAULT_MAP_ID,), policy='random',
+             seed=0, workers=None, overrides=None, chunk_size=DEFAULT_CHUNK_SIZE, **kwargs):
+    """
+    Simulates num_games games for every combination of difficulty and map.
+
+    :param policy: Name of the player policy, see POLICIES
+    :param seed: Seed of the first game, the games use consecutive seeds
+    :param workers: Number of processes. 0 simulates in this process. None uses one process per cpu.
+    :param overrides: Maps names in TUNABLES to the values used instead of the ones of mole.game
+    :param kwargs: Further arguments of simulate_game
+    :return: A list of SimulationReports, one for every combination of difficulty and map
+    """
+    overrides = dict(overrides or {})
+    unknown = set(overrides) - set(TUNABLES)
+    if unknown:
+        raise SimulationException('Unknown tunables: {}'.format(', '.join(sorted(unknown))))
+    if 'MORIARTY_AUTO_MOVE_FACTORS' in overrides:
+        overrides['MORIARTY_AUTO_MOVE_FACTORS'] = _by_difficulty_level(overrides['MORIARTY_AUTO_MOVE_FACTORS'])
+    if policy not in POLICIES:
+        raise SimulationException('Unknown policy: {}. Available: {}'.format(policy, ', '.join(POLICIES)))
+
+    tasks = []
+    for difficulty in difficulties:
+        for map_id in map_ids:
+            for start in range(seed, seed + num_games, chunk_size):
+                seeds = range(start, min(start + chunk_size, seed + num_games))
+                tasks.append((seeds, difficulty, map_id, policy, overrides, kwargs))
+
+    reports = {(difficulty, map_id): SimulationReport(difficulty, map_id)
+               for difficulty in difficulties for map_id in map_ids}
+    if workers == 0:
+        original = {name: getattr(game_module, name) for name in overrides}
+        try:
+            partial_reports = [_simulate_chunk(*task) for task in tasks]
+        finally:
+            for name, value in original.items():
+                setattr(game_module, name, value)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            partial_reports = list(executor.map(_simulate_chunk, *zip(*tasks)))
+
+    for partial_report in partial_reports:
+        reports[(partial_report.difficulty, partial_report.map_id)].merge(partial_report)
+    return list(reports.values())
+
+
+class SimulationException(Exception):
+    pass
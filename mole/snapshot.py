@@ -0,0 +1,170 @@
+"""
+Binary snapshots of running games for crash recovery.
+
+A snapshot is a fixed header (magic, format version, body length) followed by the marshal encoded
+Game.snapshot_state(). The state only contains builtin types, no sockets, schedulers or other runtime objects.
+Snapshots are written at turn boundaries by a background thread and restored when the server starts. Players of a
+restored game rejoin with their name, like after a lost connection.
+"""
+import marshal
+import os
+import queue
+import struct
+import sys
+import threading
+
+from .game import Game
+
+MAGIC = b'MOLE'
+VERSION = 2
+SUFFIX = '.snap'
+
+_HEADER = struct.Struct('<4sHI')  # magic, version, body length
+
+
+def encode_snapshot(game: Game) -> bytes:
+    body = marshal.dumps(game.snapshot_state())
+    return _HEADER.pack(MAGIC, VERSION, len(body)) + body
+
+
+def decode_snapshot(data: bytes) -> tuple:
+    """
+    :return: The game state of the snapshot, see Game.snapshot_state()
+    """
+    if len(data) < _HEADER.size:
+        raise InvalidSnapshotException('Snapshot is truncated')
+    magic, version, length = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise InvalidSnapshotException('Not a game snapshot')
+    if version != VERSION:
+        raise InvalidSnapshotException('Unsupported snapshot version {}, expected {}'.format(version, VERSION))
+    if len(data) != _HEADER.size + length:
+        raise InvalidSnapshotException('Snapshot is truncated')
+    try:
+        return marshal.loads(data[_HEADER.size:])
+    except (EOFError, ValueError, TypeError) as e:
+        raise InvalidSnapshotException('Corrupt snapshot: {}'.format(e))
+
+
+def restore_snapshot(data: bytes, sio, scheduler=None) -> Game:
+    return Game.from_snapshot_state(decode_snapshot(data), sio, scheduler)
+
+
+class SnapshotStore:
+    """
+    Keeps one snapshot file per game token in a directory.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, token) -> str:
+        return os.path.join(self.directory, '{}{}'.format(token, SUFFIX))
+
+    def write(self, token, data: bytes):
+        """
+        Replaces the snapshot of the game atomically, so a crash while writing keeps the previous snapshot.
+        """
+        path = self.path(token)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def remove(self, token):
+        try:
+            os.remove(self.path(token))
+        except FileNotFoundError:
+            pass
+
+    def load_all(self):
+        """
+        :return: An iterator over (token, data) of all snapshots
+        """
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.endswith(SUFFIX):
+                continue
+            with open(os.path.join(self.directory, filename), 'rb') as f:
+                yield filename[:-len(SUFFIX)], f.read()
+
+
+class SnapshotWriter:
+    """
+    Writes snapshots to a SnapshotStore in a background thread, so game events do not wait for the disk.
+
+    Snapshots of the same game that are submitted faster than they are written are coalesced, only the newest one
+    is written.
+    """
+    _STOP = object()
+
+    def __init__(self, store: SnapshotStore):
+        self.store = store
+        self._lock = threading.Lock()
+        self._pending = {}  # maps tokens to snapshots or None, if the snapshot should be removed
+        self._wakeup = queue.Queue()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._thread = None
+        self.num_written = 0
+        self.num_coalesced = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='snapshot-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._wakeup.put(self._STOP)
+        self._thread.join()
+        self._thread = None
+
+    def submit(self, token, data: bytes):
+        self._put(token, data)
+
+    def remove(self, token):
+        self._put(token, None)
+
+    def _put(self, token, data):
+        with self._lock:
+            if token in self._pending:
+                self.num_coalesced += 1
+            self._pending[token] = data
+            self._idle.clear()
+        self._wakeup.put(token)
+
+    def flush(self, timeout=None) -> bool:
+        """
+        Waits until all submitted snapshots are written.
+
+        :return: False, if the timeout passed before
+        """
+        if self._thread is None:
+            self._write_pending()
+        return self._idle.wait(timeout)
+
+    def _run(self):
+        while self._wakeup.get() is not self._STOP:
+            self._write_pending()
+
+    def _write_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for token, data in pending.items():
+            try:
+                if data is None:
+                    self.store.remove(token)
+                else:
+                    self.store.write(token, data)
+                    self.num_written += 1
+            except OSError as e:
+                print('ERROR: could not write snapshot of game {}: {}'.format(token, e), file=sys.stderr)
+        with self._lock:
+            if not self._pending:
+                self._idle.set()
+
+
+class InvalidSnapshotException(Exception):
+    pass
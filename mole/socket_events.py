@@ -0,0 +1,210 @@
+import sys
+
+from .game import InvalidMessageException
+from .game_manager import GameManager, JoinGameException, AllTokensTakenException, StartGameException
+from .map import DEFAULT_MAP_ID
+from .serializers import requested_serializer
+from .sharding import ShardConfig
+from .transport import Transport
+
+# Seconds between two pings to a game host
+PING_INTERVAL = 30.0
+
+
+class SocketEvents:
+    """
+    The socket.io event handlers. They are independent of the server, so the WSGI server (mole.views) and the
+    ASGI server (mole.async_views) register the same handlers.
+    """
+    EVENTS = (
+        'connect', 'create_game', 'start_game', 'join_game', 'disconnect', 'player_choice', 'player_occasion_choice',
+        'pantomime_choice', 'pantomime_start', 'rejoin_host',
+    )
+
+    def __init__(self, games: GameManager, transport: Transport, on_game_started=None, shard_config=None):
+        """
+        :param on_game_started: Optional callable, that is called after a start_game message and after a rejoin
+        :param shard_config: The ShardConfig of this worker. Defaults to a single worker.
+        """
+        self.games = games
+        self.transport = transport
+        self.on_game_started = on_game_started if on_game_started is not None else lambda: None
+        self.shard_config = shard_config if shard_config is not None else ShardConfig()
+
+    def connect(self, sid, environ):
+        self.transport.set_serializer(sid, requested_serializer(environ))
+
+    def create_game(self, sid, _message):
+        try:
+            token = self.games.create_game(sid)
+        except AllTokensTakenException as e:
+            print(str(e), file=sys.stderr)
+            return False
+
+        # game host also joins room for debugging
+        self.transport.enter_room(sid, token)
+
+        print('Created game "{}"'.format(token), file=sys.stderr)
+
+        return token
+
+    def start_game(self, sid, message):
+        token = None
+        start_position = None
+        test_choices = None
+        all_proofs = False
+        enable_minigames = True
+        moriarty_position = 0
+        difficulty = 'easy'
+        map_id = DEFAULT_MAP_ID
+        seed = None
+
+        if isinstance(message, str):
+            token = message
+        elif isinstance(message, dict):
+            token = message.get('token')
+            start_position = message.get('startposition')
+            test_choices = message.get('test_choices')
+            all_proofs = message.get('all_proofs')
+            enable_minigames = message.get('enable_minigames', True)
+            moriarty_position = message.get('moriarty_position', moriarty_position)
+            difficulty = message.get('difficulty', 'medium')
+            map_id = message.get('map', map_id)
+            seed = message.get('seed')
+            if seed is not None and (not isinstance(seed, int) or isinstance(seed, bool)):
+                print('ERROR: ignoring invalid seed: {}'.format(seed), file=sys.stderr)
+                seed = None
+
+        print('starting game {}'.format(token))
+        try:
+            self.games.start_game(
+                self.transport, sid, token=token, start_position=start_position, test_choices=test_choices,
+                all_proofs=all_proofs, enable_minigames=enable_minigames, moriarty_position=moriarty_position,
+                difficulty=difficulty, map_id=map_id, seed=seed
+            )
+        except StartGameException as e:
+            print(str(e), file=sys.stderr)
+
+        self.on_game_started()
+
+    def join_game(self, sid, message):
+        try:
+            token = message['token']
+            name = message['name']
+        except KeyError as e:
+            print('ERROR: invalid login message: {}'.format(str(e)), file=sys.stderr)
+            return {'success': False, 'reason': 'invalid_message'}
+        except TypeError:
+            print('ERROR: message is not an object. Got {} instead'.format(message), file=sys.stderr)
+            return {'success': False, 'reason': 'invalid_message'}
+
+        if not name:
+            print('ERROR: Cant join with empty name.', file=sys.stderr)
+            return {'success': False, 'reason': 'empty_name'}
+
+        if not self.shard_config.owns(token):
+            # the game is on another worker, the client has to reconnect there
+            owner = self.shard_config.owner_of(token)
+            print('INFO: game {} is owned by worker {}'.format(token, owner), file=sys.stderr)
+            return {'success': False, 'reason': 'wrong_worker', 'worker': owner,
+                    'worker_url': self.shard_config.worker_url(owner)}
+
+        try:
+            self.games.handle_join(self.transport, sid, token, name)
+        except JoinGameException as e:
+            print(
+                'INFO: player join failed:\n\treason: {}\n\ttoken: {}\n\tname: {}\n\tsid: {}'
+                .format(e.reason.name.lower(), e.token, e.name, e.player_sid)
+            )
+            return {'success': False, 'reason': e.reason.name.lower()}
+
+        if self.games.get(sid) is not None:
+            # rejoined a running game, which might be restored from a snapshot and needs the scheduler
+            self.on_game_started()
+        return {'success': True, 'reason': None}
+
+    def rejoin_host(self, sid, message):
+        """
+        Lets a host display reconnect to its running game, e.g. after the game was restored from a snapshot.
+
+        :param message: The token of the game
+        """
+        token = message.get('token') if isinstance(message, dict) else message
+        if not self.shard_config.owns(token):
+            owner = self.shard_config.owner_of(token)
+            return {'success': False, 'reason': 'wrong_worker', 'worker': owner,
+                    'worker_url': self.shard_config.worker_url(owner)}
+
+        try:
+            self.games.handle_host_rejoin(self.transport, sid, token)
+        except JoinGameException as e:
+            print('INFO: host rejoin failed:\n\treason: {}\n\ttoken: {}\n\tsid: {}'.format(
+                e.reason.name.lower(), e.token, e.player_sid
+            ))
+            return {'success': False, 'reason': e.reason.name.lower()}
+
+        self.on_game_started()
+        return {'success': True, 'reason': None}
+
+    def disconnect(self, sid):
+        self.games.handle_disconnect(self.transport, sid)
+        self.transport.client_disconnected(sid)
+
+    def player_choice(self, sid, message):
+        game = self.games.get(sid)
+
+        if game is None:
+            print('ERROR(player_choice): no game found for sid {}'.format(sid), file=sys.stderr)
+            return False
+
+        try:
+            game.actor.run('player_choice', game.player_choice, self.transport, sid, message)
+        except InvalidMessageException as e:
+            print(str(e), file=sys.stderr)
+
+        return True
+
+    def player_occasion_choice(self, sid, message):
+        game = self.games.get(sid)
+
+        if game is None:
+            print('ERROR(player_occasion_choice): no game found for sid {}'.format(sid), file=sys.stderr)
+            return False
+
+        try:
+            game.actor.run('player_occasion_choice', game.player_occasion_choice, self.transport, sid, message)
+        except InvalidMessageException as e:
+            print(str(e), file=sys.stderr)
+
+    def pantomime_choice(self, sid, message):
+        game = self.games.get(sid)
+
+        if game is None:
+            print('ERROR(pantomime_choice): no game found for sid {}'.format(sid), file=sys.stderr)
+            return False
+
+        try:
+            game.actor.run('pantomime_choice', game.pantomime_choice, self.transport, sid, message)
+        except InvalidMessageException as e:
+            print(str(e), file=sys.stderr)
+
+    def pantomime_start(self, sid, message):
+        game = self.games.get(sid)
+        if game is None:
+            print('ERROR(pantomime_choice): no game found for sid {}'.format(sid), file=sys.stderr)
+            return False
+
+        if message != '' and not isinstance(message, dict):
+            print('ERROR(pantomime_start): invalid message: {}'.format(message), file=sys.stderr)
+            return False
+
+        ignored_player = None
+        if isinstance(message, dict):
+            ignored_player = message.get('ignored_player')
+            if ignored_player == -1:
+                ignored_player = None
+
+        try:
+            game.actor.run('pantomime_start', game.pantomime_start, self.transport, sid, ignored_player)
+        except InvalidMessageException as e:
+            print(str(e), file=sys.stderr)
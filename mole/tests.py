@@ -1,7 +1,39 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from unittest import mock, skipUnless
+
+import socketio
 from django.contrib.auth.models import AnonymousUser, User
-from django.test import TestCase, RequestFactory
+from django.db import connections
+from django.test import TestCase, TransactionTestCase, RequestFactory
 
-from .views import index
+from . import async_views, game as game_module, keep_alive, race_model, serializers, simulation
+from .actor import GameActor
+from .clues import Clue, InventoryClue
+from .db_init import create_clues
+from .db_pool import ConnectionPool, ConnectionPoolTimeoutException
+from .evidence_catalog import evidence_catalog, SOLUTION_CLUE_TYPES
+from .game_character import Player
+from .game import Game, DifficultyLevel, InvalidMessageException
+from .game_manager import GameManager
+from .journal import SUFFIX
+from .keep_alive import KeepAliveService
+from .map import create_map, parse_map, FieldType, InvalidMapException
+from .models import Evidence, ClueType, ClueSubtype
+from .replay import replay_journal
+from .sampler import ClueSampler
+from .scheduler import Scheduler
+from .sharding import ShardConfig, LocalBroker, LocalManager
+from .snapshot import SnapshotStore, SnapshotWriter, decode_snapshot, InvalidSnapshotException
+from .socket_events import SocketEvents
+from .tokens import TokenAllocator, AllTokensTakenException, DoubleTokenReleaseException, TokenNotAvailableException
+from .transport import InMemoryTransport, SocketIOTransport
+from .turn_state import TurnState
+from .views import index, map_json
 
 
 class SimpleTest(TestCase):
@@ -17,3 +49,713 @@ class SimpleTest(TestCase):
         # Test my_view() as if it were deployed at /customer/details
         response = index(request)
         self.assertEqual(response.status_code, 200)
+
+
+class EvidenceCatalogTest(TransactionTestCase):
+    def setUp(self):
+        create_clues()
+        evidence_catalog.invalidate()
+
+    def test_groups_are_loaded_once(self):
+        for clue_type, clue_subtype in SOLUTION_CLUE_TYPES:
+            self.assertTrue(evidence_catalog.get(clue_type, clue_subtype))
+
+        with self.assertNumQueries(0):
+            for clue_type, clue_subtype in SOLUTION_CLUE_TYPES:
+                evidence_catalog.get(clue_type, clue_subtype)
+
+    def test_clues_are_shared(self):
+        first = evidence_catalog.get(ClueType.WEAPON, ClueSubtype.OBJECT)[0]
+        self.assertIs(first, evidence_catalog.get(ClueType.WEAPON, ClueSubtype.OBJECT)[0])
+        self.assertIsInstance(first, Clue)
+
+    def test_invalidated_on_change(self):
+        num_objects = len(evidence_catalog.get(ClueType.WEAPON, ClueSubtype.OBJECT))
+        Evidence(name='Rope', type=ClueType.WEAPON, subtype=ClueSubtype.OBJECT).save()
+        self.assertFalse(evidence_catalog.is_loaded())
+        self.assertEqual(len(evidence_catalog.get(ClueType.WEAPON, ClueSubtype.OBJECT)), num_objects + 1)
+
+        Evidence.objects.filter(name='Rope').delete()
+        self.assertEqual(len(evidence_catalog.get(ClueType.WEAPON, ClueSubtype.OBJECT)), num_objects)
+
+
+class ConnectionPoolTest(TransactionTestCase):
+    def test_connections_are_reused(self):
+        pool = ConnectionPool(size=1, timeout=0.01)
+        for _ in range(5):
+            with pool.connection() as db_alias:
+                self.assertEqual(Evidence.objects.using(db_alias).count(), 0)
+
+        stats = pool.stats()
+        self.assertEqual(stats['open'], 1)
+        self.assertEqual(stats['acquired'], 5)
+        self.assertEqual(stats['in_use'], 0)
+
+    def test_nested_checkouts_return_both_connections(self):
+        pool = ConnectionPool(size=2, timeout=0.01)
+        with pool.connection() as db_alias:
+            outer = connections[db_alias]
+            with pool.connection():
+                self.assertIsNot(connections[db_alias], outer)
+            self.assertIs(connections[db_alias], outer)
+            self.assertEqual(Evidence.objects.using(db_alias).count(), 0)
+
+        self.assertEqual(pool.stats()['in_use'], 0)
+        self.assertEqual(pool.stats()['idle'], 2)
+
+    def test_size_is_bounded(self):
+        pool = ConnectionPool(size=1, timeout=0.01)
+        with pool.connection():
+            with self.assertRaises(ConnectionPoolTimeoutException):
+                with pool.connection():
+                    pass
+
+
+class KeepAliveServiceTest(TestCase):
+    def test_disabled_without_target(self):
+        service = KeepAliveService(None, 0.01)
+        service.start()
+        self.assertFalse(service.is_enabled())
+        self.assertIsNone(service._thread)
+
+    def test_pings_target_until_stopped(self):
+        pinged = threading.Event()
+        service = KeepAliveService('https://mole.example/', 0.01, should_ping=lambda: True)
+        with mock.patch.object(keep_alive.requests, 'get', side_effect=lambda *args, **kwargs: pinged.set()) as get:
+            service.start()
+            self.assertTrue(pinged.wait(5))
+            thread = service._thread
+            service.stop()
+
+        get.assert_called_with('https://mole.example/', timeout=service.timeout)
+        self.assertFalse(thread.is_alive())
+        self.assertIsNone(service._thread)
+
+
+class SchedulerTest(TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.scheduler = Scheduler(clock=lambda: self.now)
+        self.calls = []
+
+    def test_runs_due_callbacks_in_deadline_order(self):
+        self.scheduler.call_later(2.0, self.calls.append, 'b')
+        self.scheduler.call_later(1.0, self.calls.append, 'a')
+        self.scheduler.call_later(5.0, self.calls.append, 'c')
+
+        self.now = 2.0
+        self.assertEqual(self.scheduler.run_due(), 2)
+        self.assertEqual(self.calls, ['a', 'b'])
+        self.assertEqual(self.scheduler.next_deadline(), 5.0)
+
+    def test_cancel(self):
+        handle = self.scheduler.call_later(1.0, self.calls.append, 'a')
+        self.scheduler.call_later(2.0, self.calls.append, 'b')
+        self.scheduler.cancel(handle)
+
+        self.now = 3.0
+        self.scheduler.run_due()
+        self.assertEqual(self.calls, ['b'])
+        self.assertEqual(len(self.scheduler), 0)
+
+
+class GameManagerPendingTest(TestCase):
+    def setUp(self):
+        self.sio = InMemoryTransport()
+        self.games = GameManager()
+        self.token = self.games.create_game('host')
+        for i in range(3):
+            self.games.handle_join(self.sio, 'sid{}'.format(i), self.token, 'player{}'.format(i))
+
+    def test_player_disconnect(self):
+        self.games.handle_disconnect(self.sio, 'sid1')
+        pending_game = self.games.get_pending_by_token(self.token)
+        self.assertEqual([p['name'] for p in pending_game.players], ['player0', 'player2'])
+        self.assertNotIn('sid1', self.games._pending_by_sid)
+
+    def test_host_disconnect(self):
+        self.games.handle_disconnect(self.sio, 'host')
+        self.assertIsNone(self.games.get_pending_by_token(self.token))
+        self.assertEqual(self.games._pending_by_sid, {})
+        self.assertFalse(self.games.token_allocator.is_in_use(int(self.token)))
+
+
+class TokenAllocatorTest(TestCase):
+    def test_acquire_all_tokens(self):
+        allocator = TokenAllocator(10, 20)
+        tokens = [allocator.acquire() for _ in range(10)]
+        self.assertEqual(sorted(tokens), list(range(10, 20)))
+        self.assertEqual(allocator.stats()['utilisation'], 1.0)
+        with self.assertRaises(AllTokensTakenException):
+            allocator.acquire()
+
+        allocator.release(15)
+        self.assertEqual(allocator.acquire(), 15)
+
+    def test_double_release(self):
+        allocator = TokenAllocator(10, 20)
+        token = allocator.acquire()
+        allocator.release(token)
+        with self.assertRaises(DoubleTokenReleaseException):
+            allocator.release(token)
+
+    def test_reserve(self):
+        allocator = TokenAllocator(10, 20)
+        allocator.reserve(13)
+        with self.assertRaises(TokenNotAvailableException):
+            allocator.reserve(13)
+        tokens = [allocator.acquire() for _ in range(9)]
+        self.assertNotIn(13, tokens)
+        with self.assertRaises(AllTokensTakenException):
+            allocator.acquire()
+
+
+class CompiledMapTest(TestCase):
+    def test_lookup_tables(self):
+        game_map = create_map()
+        for index in range(len(game_map)):
+            self.assertEqual(index + game_map.distance_to_goal[index], game_map.goal_index)
+
+            shortcut = game_map.next_special_field[index]
+            following_fields = game_map.fields[index + 1:shortcut]
+            self.assertFalse(any(f.type == FieldType.SHORTCUT for f in following_fields))
+            if shortcut < len(game_map):
+                self.assertEqual(game_map[shortcut].type, FieldType.SHORTCUT)
+
+    def test_map_is_shared_and_immutable(self):
+        self.assertIs(create_map(), create_map())
+        with self.assertRaises(AttributeError):
+            create_map()[0].type = FieldType.Goal
+
+
+class MapLoadingTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_invalid_shortcut(self):
+        field_dicts = [
+            {'index': 0, 'type': 'walkable'},
+            {'index': 1, 'type': 'shortcut', 'shortcut': 1, 'difficulty': 'easy'},
+            {'index': 2, 'type': 'goal'},
+        ]
+        with self.assertRaises(InvalidMapException):
+            parse_map(field_dicts)
+
+        field_dicts[1]['shortcut'] = 2
+        field_dicts[1]['difficulty'] = 'impossible'
+        with self.assertRaises(InvalidMapException):
+            parse_map(field_dicts)
+
+        field_dicts[1]['difficulty'] = 'hard'
+        self.assertEqual(parse_map(field_dicts).next_special_field[0], 1)
+
+    def test_map_json_is_cacheable(self):
+        response = map_json(self.factory.get('/maps/default.json'), 'default')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('max-age', response['Cache-Control'])
+
+        request = self.factory.get('/maps/default.json', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(map_json(request, 'default').status_code, 304)
+
+
+class GameSeedTest(TestCase):
+    def create_game(self, seed):
+        solution = [
+            Clue('clue{}'.format(i), main_type, subtype) for i, (main_type, subtype) in enumerate(SOLUTION_CLUE_TYPES)
+        ]
+        player_infos = [{'player_id': i, 'name': 'player{}'.format(i), 'sid': 'sid{}'.format(i)} for i in range(4)]
+        return Game(InMemoryTransport(), '1000', 'host', player_infos, None, solution_clues=solution, seed=seed)
+
+    def test_same_seed_same_game(self):
+        first = self.create_game(7)
+        second = self.create_game(7)
+        self.assertEqual(first.snapshot_state(), second.snapshot_state())
+
+        # games do not share random state
+        first.rng.random()
+        self.assertNotEqual(first.rng.getstate(), second.rng.getstate())
+
+    def test_random_seed(self):
+        self.assertNotEqual(self.create_game(None).seed, self.create_game(None).seed)
+
+
+class InventoryClueTest(TestCase):
+    def test_to_dict(self):
+        inventory_clue = InventoryClue(Clue('Knife', ClueType.WEAPON, ClueSubtype.OBJECT), received_from=2)
+        inventory_clue.sent_to.append(1)
+        self.assertEqual(
+            inventory_clue.to_dict(),
+            {'name': 'Knife', 'type': 'W', 'subtype': 'O', 'received_from': 2, 'sent_to': [1]}
+        )
+
+
+class PlayerInventoryTest(TestCase):
+    def test_shared_clues_are_added_once(self):
+        transport = InMemoryTransport()
+        player_infos = [{'player_id': i, 'name': 'player{}'.format(i), 'sid': 'sid{}'.format(i)} for i in range(3)]
+        game = Game(transport, '1000', 'host', player_infos, None, solution_clues=simulation.solution_clues(), seed=1)
+        sharing = game.get_current_player()
+        receiver = game.players[(game.players.index(sharing) + 2) % len(game.players)]
+        clue = next(clue for clue in sharing.inventory if clue.name not in receiver.inventory)
+
+        share = {'type': 'share-clue', 'with': receiver.player_id, 'clue': clue.name}
+        game.player_choice(transport, sharing.sid, share)
+        game.player_choice(transport, game.get_current_player().sid, {'type': 'dice', 'value': 1})
+        self.assertIs(game.get_current_player(), receiver)
+        self.assertEqual(receiver.get_clue(clue.name).received_from, sharing.player_id)
+        self.assertEqual([c.name for c in receiver.inventory][-1], clue.name)
+
+        num_clues = len(sharing.inventory)
+        share_back = {'type': 'share-clue', 'with': sharing.player_id, 'clue': clue.name}
+        game.player_choice(transport, receiver.sid, share_back)
+        self.assertEqual(len(sharing.inventory), num_clues)
+        self.assertEqual(sharing.get_clue(clue.name).received_from, -1)
+
+
+class ClueValidationTest(TestCase):
+    player_infos = [{'player_id': i, 'name': 'player{}'.format(i), 'sid': 'sid{}'.format(i)} for i in range(3)]
+
+    def test_clue_with_wrong_main_type_fails_validation(self):
+        transport = InMemoryTransport()
+        game = Game(transport, '1000', 'host', self.player_infos, None, solution_clues=simulation.solution_clues(),
+                    seed=1)
+        player = game.get_current_player()
+        clue = next(iter(player.inventory))
+        wrong_type = next(c.main_type for c in game.solution_clues if c.main_type != clue.main_type)
+
+        game.player_choice(transport, player.sid, {
+            'type': 'validate-clues', 'clues': [{'name': clue.name, 'type': wrong_type, 'subtype': clue.subtype}],
+        })
+
+        results = [data for event, data, _room, _skip_sid in transport.sent if event == 'validation_result']
+        self.assertEqual(len(results), 1)
+        self.assertFalse(results[0]['successful_validation'])
+        self.assertEqual(results[0]['validation_status'], 'wrong_main_type')
+        self.assertIsNot(game.get_current_player(), player)
+
+    def test_made_up_main_type_fails_validation(self):
+        game = Game(InMemoryTransport(), '1000', 'host', self.player_infos, None,
+                    solution_clues=simulation.solution_clues(), seed=1)
+        clue = next(iter(game.get_current_player().inventory))
+
+        clues = [Clue(clue.name, 'foo', clue.subtype)]
+        self.assertFalse(game.validate_clues(clues))
+        self.assertFalse(game.validate_clues([Clue('not a clue', 'bar', clue.subtype)]))
+        self.assertEqual(game.validation_allowed(game.get_current_player(), clues), (False, 'wrong_main_type'))
+
+
+class ClueSamplerTest(TestCase):
+    def setUp(self):
+        self.knife = Clue('Knife', ClueType.WEAPON, ClueSubtype.OBJECT)
+        self.red = Clue('Red', ClueType.WEAPON, ClueSubtype.COLOR_W)
+        self.monday = Clue('Monday', ClueType.TIME_OF_CRIME, ClueSubtype.WEEKDAY)
+        self.sampler = ClueSampler([self.knife, self.red, self.monday], [0, 1])
+
+    def draw_all(self, player_id):
+        return Counter(self.sampler.draw(player_id) for _ in range(2000))
+
+    def test_unowned_clues_are_preferred(self):
+        self.sampler.add_clue(0, self.knife)
+        self.sampler.add_clue(1, self.red)
+
+        drawn = self.draw_all(0)
+        self.assertNotIn(self.knife, drawn)
+        self.assertGreater(drawn[self.monday], drawn[self.red] * 2)
+
+    def test_verified_types_are_not_drawn(self):
+        self.sampler.add_clue(1, self.monday)
+        self.sampler.verify_type(ClueType.WEAPON)
+
+        self.assertEqual(set(self.draw_all(0)), {self.monday})
+        self.assertIsNone(self.sampler.draw(1))
+
+
+class OccasionChoiceHandlerTest(TransactionTestCase):
+    def setUp(self):
+        create_clues()
+        evidence_catalog.invalidate()
+
+    def test_occasion_choice_is_handled(self):
+        games = GameManager(Scheduler(), TokenAllocator(1000, 1100))
+        transport = InMemoryTransport()
+        events = SocketEvents(games, transport)
+        token = games.create_game('host')
+        for i in range(3):
+            games.handle_join(transport, 'sid{}'.format(i), token, 'player{}'.format(i))
+        games.start_game(transport, 'host', token, start_position=5, test_choices=['simplify_dicing', 'hinder_dicing'])
+        game = games.get('sid0')
+        sid = game.get_current_player().sid
+
+        events.player_choice(sid, {'type': 'dice', 'value': 1})
+        self.assertEqual(game.turn_state.player_turn_state, TurnState.PlayerTurnState.PLAYER_CHOOSING_OCCASION)
+        events.player_occasion_choice(sid, {'type': 'simplify_dicing'})
+
+        self.assertEqual(game.turn_state.player_turn_state, TurnState.PlayerTurnState.PLAYER_CHOOSING)
+        self.assertNotEqual(game.get_current_player().sid, sid)
+
+
+class TransportTest(TestCase):
+    def test_batch_is_sent_in_order_when_it_ends(self):
+        transport = InMemoryTransport()
+        transport.enter_room('a', 'room')
+        transport.enter_room('b', 'room')
+
+        with transport.batch():
+            transport.emit('first', 1, room='room', skip_sid='b')
+            with transport.batch():
+                transport.emit('second', 2, room='b')
+            self.assertEqual(transport.sent, [])
+
+        self.assertEqual(transport.received('a'), [('first', 1)])
+        self.assertEqual(transport.received('b'), [('second', 2)])
+        self.assertEqual(transport.num_batches, 1)
+
+    def test_disconnect_sends_queued_messages_first(self):
+        transport = InMemoryTransport()
+        with transport.batch():
+            transport.emit('gameover', room='a')
+            transport.disconnect('a')
+            self.assertEqual(transport.sent, [('gameover', None, 'a', None)])
+
+    def test_room_message_is_encoded_once(self):
+        sio = socketio.Server()
+        frames = []
+        sio.eio.send = lambda sid, data, binary=None: frames.append((sid, data))
+        for sid in ['host', 'a', 'b']:
+            sio.manager.connect(sid, '/')
+            sio.enter_room(sid, '1234')
+        transport = SocketIOTransport(sio)
+
+        with transport.batch():
+            transport.emit('move', 5, room='1234', skip_sid='host')
+
+        self.assertEqual(sorted(frames), [('a', '2["move",5]'), ('b', '2["move",5]')])
+        self.assertEqual(transport.stats()['encodes'], 1)
+        self.assertEqual(transport.stats()['encodes_saved'], 1)
+
+    @skipUnless(serializers.msgpack_available(), 'msgpack is not installed')
+    def test_msgpack_clients_get_binary_frames(self):
+        sio = socketio.Server()
+        frames = []
+        sio.eio.send = lambda sid, data, binary=None: frames.append((sid, data, binary))
+        for sid in ['a', 'b']:
+            sio.manager.connect(sid, '/')
+            sio.enter_room(sid, '1234')
+        transport = SocketIOTransport(sio)
+        transport.set_serializer('b', serializers.requested_serializer({'QUERY_STRING': 'EIO=3&serializer=msgpack'}))
+
+        transport.emit('move', 5, room='1234')
+
+        frames = dict((sid, (data, binary)) for sid, data, binary in frames)
+        self.assertEqual(frames['a'], ('2["move",5]', False))
+        self.assertEqual(
+            serializers.decode_msgpack_packet(frames['b'][0]), {'type': 2, 'nsp': '/', 'data': ['move', 5]}
+        )
+        self.assertTrue(frames['b'][1])
+
+    @skipUnless(serializers.msgpack_available(), 'msgpack is not installed')
+    def test_msgpack_clients_speak_msgpack(self):
+        sio = serializers.SerializingServer(async_handlers=False)
+        frames = []
+        sio.eio.send = lambda sid, data, binary=None: frames.append((sid, data, binary))
+        transport = SocketIOTransport(sio)
+        sio.on('connect', lambda sid, environ: transport.set_serializer(sid, serializers.requested_serializer(environ)))
+        sio.on('ping_server', lambda sid, message: 'pong')
+
+        sio.environ['b'] = {'QUERY_STRING': 'EIO=3&serializer=msgpack'}
+        sio._handle_connect('b', '/')
+        sio._handle_eio_message('b', serializers.encode_msgpack_packet(2, '/', ['ping_server', None], 7))
+        sio.emit('news', 1, room='b')
+
+        self.assertTrue(all(binary for _sid, _data, binary in frames))
+        self.assertEqual([serializers.decode_msgpack_packet(data) for _sid, data, _binary in frames], [
+            {'type': 0, 'nsp': '/', 'data': None},
+            {'type': 3, 'nsp': '/', 'data': ['pong'], 'id': 7},
+            {'type': 2, 'nsp': '/', 'data': ['news', 1]},
+        ])
+
+
+class AsyncServerTest(TransactionTestCase):
+    def setUp(self):
+        create_clues()
+        evidence_catalog.invalidate()
+
+    def test_game_is_started_by_async_handlers(self):
+        frames = []
+
+        async def send(sid, data, binary=None):
+            frames.append((sid, data))
+
+        patcher = mock.patch.object(async_views.asio.eio, 'send', send)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        sids = ['host', 'p0', 'p1', 'p2']
+        for sid in sids:
+            async_views.asio.manager.connect(sid, '/')
+
+        async def start_game():
+            handlers = async_views.asio.handlers['/']
+            token = await handlers['create_game']('host', None)
+            for sid in sids[1:]:
+                await handlers['join_game'](sid, {'token': token, 'name': sid})
+            await handlers['start_game']('host', token)
+            self.assertTrue(async_views.scheduler.is_running())
+            async_views.scheduler.stop()
+            for sid in sids:
+                await handlers['disconnect'](sid)
+
+        asyncio.run(start_game())
+
+        self.assertTrue(any(sid == 'p0' and '"init"' in data for sid, data in frames))
+        self.assertFalse(async_views.games.is_game_running())
+
+
+class GameActorTest(TestCase):
+    def test_events_of_a_game_do_not_overlap(self):
+        actor = GameActor('1234')
+        started = threading.Event()
+        release = threading.Event()
+        order = []
+
+        def slow_event():
+            order.append('slow start')
+            started.set()
+            release.wait(5)
+            order.append('slow end')
+
+        thread = threading.Thread(target=actor.run, args=('slow', slow_event))
+        thread.start()
+        started.wait(5)
+        waiting = threading.Thread(target=actor.run, args=('fast', order.append, 'fast'))
+        waiting.start()
+        while actor.queue_depth() == 0:
+            time.sleep(0.001)
+        release.set()
+        thread.join(5)
+        waiting.join(5)
+
+        self.assertEqual(order, ['slow start', 'slow end', 'fast'])
+        self.assertEqual(actor.stats()['max_queue_depth'], 1)
+        self.assertEqual(actor.stats()['events']['fast']['count'], 1)
+
+    def test_nested_events_run_immediately(self):
+        actor = GameActor()
+        self.assertEqual(actor.run('outer', actor.run, 'inner', lambda: 42), 42)
+
+    def test_timer_callbacks_do_not_wait_for_a_busy_game(self):
+        actor = GameActor('1234')
+        started = threading.Event()
+        release = threading.Event()
+        order = []
+
+        def slow_event():
+            order.append('slow start')
+            started.set()
+            release.wait(5)
+            order.append('slow end')
+
+        thread = threading.Thread(target=actor.run, args=('slow', slow_event))
+        thread.start()
+        started.wait(5)
+        actor.callback('timer', order.append)('timer')
+        self.assertEqual(order, ['slow start'])
+        release.set()
+        thread.join(5)
+
+        self.assertEqual(order, ['slow start', 'slow end', 'timer'])
+        self.assertEqual(actor.queue_depth(), 0)
+        actor.callback('timer', order.append)('idle timer')
+        self.assertEqual(order[-1], 'idle timer')
+
+
+class ShardingTest(TestCase):
+    def test_workers_allocate_their_own_tokens(self):
+        config = ShardConfig(index=1, count=3)
+        allocator = config.token_allocator(1000, 1100)
+        tokens = [allocator.acquire() for _ in range(len(allocator.tokens))]
+
+        self.assertTrue(all(config.owns(token) for token in tokens))
+        self.assertEqual(len(tokens), 34)
+        self.assertRaises(AllTokensTakenException, allocator.acquire)
+
+    def test_join_for_foreign_token_is_redirected(self):
+        config = ShardConfig(index=0, count=2, worker_urls=['https://a.example', 'https://b.example'])
+        events = SocketEvents(GameManager(), InMemoryTransport(), shard_config=config)
+
+        reply = events.join_game('sid', {'token': '1001', 'name': 'Alice'})
+        self.assertEqual(reply['reason'], 'wrong_worker')
+        self.assertEqual(reply['worker_url'], 'https://b.example')
+
+    def test_messages_cross_workers(self):
+        broker = LocalBroker()
+        received = threading.Event()
+        servers = [socketio.Server(async_mode='threading', client_manager=LocalManager(broker)) for _ in range(2)]
+        for server in servers:
+            server.manager.initialize()
+        servers[1].eio.send = lambda sid, data, binary=None: received.set()
+        servers[1].manager.connect('a', '/')
+        servers[1].enter_room('a', '1001')
+        try:
+            SocketIOTransport(servers[0]).emit('move', 5, room='1001')
+            self.assertTrue(received.wait(5))
+        finally:
+            for server in servers:
+                server.manager.close()
+
+
+class SnapshotTest(TransactionTestCase):
+    def setUp(self):
+        create_clues()
+        evidence_catalog.invalidate()
+        self.directory = tempfile.TemporaryDirectory()
+        self.writer = SnapshotWriter(SnapshotStore(self.directory.name))
+        self.sio = InMemoryTransport()
+        self.games = GameManager(snapshot_writer=self.writer)
+        self.token = self.games.create_game('host')
+        for i in range(3):
+            self.games.handle_join(self.sio, 'sid{}'.format(i), self.token, 'player{}'.format(i))
+        self.games.start_game(self.sio, 'host', self.token)
+        self.game = self.games._get_by_token(self.token)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_restore_game(self):
+        self.game.end_player_turn(self.sio)
+        self.writer.flush()
+
+        restored_games = GameManager()
+        self.assertEqual(restored_games.restore_games(self.writer.store.load_all(), self.sio), 1)
+        self.assertTrue(restored_games.token_allocator.is_in_use(int(self.token)))
+        restored = restored_games._get_by_token(self.token)
+        state = restored.snapshot_state()
+        self.assertEqual(state, self.game.snapshot_state())
+        self.assertEqual(restored.turn_state.player_index, self.game.turn_state.player_index)
+        self.assertFalse(restored.has_connected_player())
+
+        restored_games.handle_join(self.sio, 'new_sid', self.token, 'player1')
+        self.assertIs(restored_games.get('new_sid'), restored)
+        self.assertIn('init', [event for event, _data in self.sio.received('new_sid')])
+
+    def test_host_rejoins_restored_game(self):
+        self.writer.flush()
+        restored_games = GameManager()
+        restored_games.restore_games(self.writer.store.load_all(), self.sio)
+        events = SocketEvents(restored_games, self.sio)
+
+        self.assertEqual(events.rejoin_host('new_host', self.token), {'success': True, 'reason': None})
+        restored = restored_games.get_game_by_host_sid('new_host')
+        self.assertIs(restored, restored_games._get_by_token(self.token))
+        self.assertIsNone(restored_games.get_game_by_host_sid('host'))
+        self.assertIn('player_infos', [event for event, _data in self.sio.received('new_host')])
+        self.assertEqual(events.rejoin_host('other', self.token), {'success': False, 'reason': 'host_connected'})
+
+        restored_games.handle_join(self.sio, 'new_sid', self.token, 'player1')
+        self.assertIn('player_rejoined', [event for event, _data in self.sio.received('new_host')])
+
+    def test_remove_snapshot_with_game(self):
+        self.games.handle_disconnect(self.sio, 'host')
+        self.writer.flush()
+        self.assertEqual(list(self.writer.store.load_all()), [])
+
+    def test_invalid_snapshot(self):
+        with self.assertRaises(InvalidSnapshotException):
+            decode_snapshot(b'MOLE\x63\x00')
+
+
+class JournalTest(TransactionTestCase):
+    def setUp(self):
+        create_clues()
+        evidence_catalog.invalidate()
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_replay_reproduces_game(self):
+        sio = InMemoryTransport()
+        now = [0.0]
+        games = GameManager(Scheduler(clock=lambda: now[0]), journal_dir=self.directory.name)
+        token = games.create_game('host')
+        for i in range(4):
+            games.handle_join(sio, 'sid{}'.format(i), token, 'player{}'.format(i))
+        games.start_game(sio, 'host', token, difficulty='hard')
+        game = games.get('sid0')
+
+        for turn in range(30):
+            player = game.get_current_player()
+            try:
+                if game.turn_state.player_turn_state.name == 'PLAYER_CHOOSING_OCCASION':
+                    choice = dict(game.turn_state.occasion_choices[0], success=True, player_id=0)
+                    game.player_occasion_choice(sio, player.sid, choice)
+                elif turn % 3:
+                    game.player_choice(sio, player.sid, {'type': 'dice', 'value': turn % 6 + 1})
+                else:
+                    game.player_choice(sio, player.sid, {'type': 'search-clue', 'success': True})
+            except InvalidMessageException:
+                pass
+            now[0] += 7
+            games.scheduler.run_due()
+        games.handle_disconnect(sio, 'host')
+        state = game.snapshot_state()
+
+        filename, = os.listdir(self.directory.name)
+        self.assertTrue(filename.endswith(SUFFIX))
+        with open(os.path.join(self.directory.name, filename), 'rb') as f:
+            replay = replay_journal(f.read())
+
+        self.assertGreater(replay.num_events, 30)
+        self.assertEqual(replay.game.snapshot_state(), state)
+
+
+class SimulationTest(TestCase):
+    def test_simulation_is_deterministic(self):
+        first = simulation.simulate_game(3, difficulty='hard')
+        second = simulation.simulate_game(3, difficulty='hard')
+        self.assertTrue(first.finished)
+        self.assertEqual((first.winner, first.reason, first.actions), (second.winner, second.reason, second.actions))
+
+    def test_report(self):
+        report, = simulation.simulate(
+            20, difficulties=('hard',), workers=0, chunk_size=7, overrides={'MORIARTY_AUTO_MOVE_INTERVAL': (5, 10)}
+        )
+        self.assertEqual(report.games, 20)
+        self.assertAlmostEqual(sum(report.to_dict()['reasons'].values()) + report.to_dict()['unfinished_rate'], 1.0)
+        self.assertEqual(game_module.MORIARTY_AUTO_MOVE_INTERVAL, (30, 40))
+
+        with self.assertRaises(simulation.SimulationException):
+            simulation.simulate(1, overrides={'NOT_TUNABLE': 1}, workers=0)
+
+    def test_auto_move_factors_by_difficulty_name(self):
+        factors = {'easy': None, 'medium': None, 'hard': 0.01}
+        report, = simulation.simulate(
+            5, difficulties=('hard',), workers=0, overrides={'MORIARTY_AUTO_MOVE_FACTORS': factors}
+        )
+        self.assertEqual(report.to_dict()['moriarty_catch_rate'], 1.0)
+        self.assertEqual(game_module.MORIARTY_AUTO_MOVE_FACTORS[DifficultyLevel.HARD], 1.0)
+
+
+@skipUnless(race_model.numpy_available(), 'numpy is not installed')
+class RaceModelTest(TestCase):
+    def test_distributions(self):
+        easy, hard = race_model.simulate_races(5000, start_positions=(4,), difficulties=('easy', 'hard'), seed=1)
+        self.assertEqual((easy.start_position, easy.difficulty, easy.races), (4, DifficultyLevel.EASY, 5000))
+        self.assertAlmostEqual(
+            easy.catch_probability + easy.rate(race_model.REACHED_GOAL) + easy.rate(race_model.UNFINISHED), 1.0
+        )
+        self.assertLess(easy.catch_probability, hard.catch_probability)
+        self.assertEqual(easy.turn_histogram().sum(), (easy.outcomes == race_model.REACHED_GOAL).sum())
+
+        again, _ = race_model.simulate_races(5000, start_positions=(4,), difficulties=('easy', 'hard'), seed=1)
+        self.assertEqual(again.to_dict(), easy.to_dict())
+
+    def test_moriarty_without_steps_never_catches(self):
+        distribution, = race_model.simulate_races(
+            1000, difficulties=('hard',), overrides={'MORIARTY_STEP_WEIGHTS': (1, 0, 0), 'MORIARTY_AUTO_STEPS': (0,),
+                                                      'MORIARTY_AUTO_STEP_WEIGHTS': (1,)}
+        )
+        self.assertEqual(distribution.catch_probability, 0.0)
+        self.assertEqual(distribution.rate(race_model.REACHED_GOAL), 1.0)
+
+        with self.assertRaises(race_model.RaceModelException):
+            race_model.simulate_races(10, start_positions=(0,))
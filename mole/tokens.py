@@ -0,0 +1,105 @@
+import random
+
+
+class TokenAllocator:
+    """
+    Hands out random game tokens from range(start, end, step) and takes them back, both in O(1).
+
+    The free tokens form a virtual array, that initially is start, start + step, start + 2 * step, ...
+    A token is acquired by picking a random position and moving the last free token into its place, a released
+    token is appended. Only positions whose token differs from the initial one are stored, so a large token space
+    costs no memory up front.
+    """
+    def __init__(self, start=1000, end=10000, rng=random, step=1):
+        self.tokens = range(start, end, step)
+        if len(self.tokens) == 0:
+            raise ValueError('Invalid token range: {}'.format(self.tokens))
+        self.start = start
+        self.end = end
+        self.rng = rng
+        self._num_free = len(self.tokens)
+        self._moved = {}  # maps positions of the free array to tokens, if they differ from the initial token
+        self._moved_positions = {}  # inverse of _moved
+        self._in_use = set()
+
+    def _get_free(self, position):
+        return self._moved.get(position, self.tokens[position])
+
+    def _clear_free(self, position):
+        token = self._moved.pop(position, None)
+        if token is not None:
+            del self._moved_positions[token]
+
+    def _set_free(self, position, token):
+        self._clear_free(position)
+        if token != self.tokens[position]:
+            self._moved[position] = token
+            self._moved_positions[token] = position
+
+    def _take_free(self, position) -> int:
+        """
+        Removes the free token at position by moving the last free token into its place.
+        """
+        last_position = self._num_free - 1
+        token = self._get_free(position)
+        last_token = self._get_free(last_position)
+        self._clear_free(last_position)
+        if position != last_position:
+            self._set_free(position, last_token)
+
+        self._num_free = last_position
+        self._in_use.add(token)
+        return token
+
+    def acquire(self) -> int:
+        if self._num_free == 0:
+            raise AllTokensTakenException('Cant create any more games. No tokens are available')
+
+        return self._take_free(self.rng.randrange(self._num_free))
+
+    def reserve(self, token: int):
+        """
+        Marks a specific free token as in use, e.g. the token of a restored game.
+        """
+        if token in self._in_use or token not in self.tokens:
+            raise TokenNotAvailableException('Token {} is not available'.format(token))
+
+        position = self._moved_positions.get(token)
+        if position is None:
+            position = self.tokens.index(token)
+        self._take_free(position)
+
+    def release(self, token: int):
+        if token not in self._in_use:
+            raise DoubleTokenReleaseException('Token {} was released, but is not in use'.format(token))
+
+        self._in_use.remove(token)
+        self._set_free(self._num_free, token)
+        self._num_free += 1
+
+    def is_in_use(self, token: int) -> bool:
+        return token in self._in_use
+
+    def __len__(self):
+        return len(self._in_use)
+
+    def stats(self):
+        size = len(self.tokens)
+        return {
+            'size': size,
+            'in_use': len(self._in_use),
+            'available': self._num_free,
+            'utilisation': len(self._in_use) / size,
+        }
+
+
+class AllTokensTakenException(Exception):
+    pass
+
+
+class DoubleTokenReleaseException(Exception):
+    pass
+
+
+class TokenNotAvailableException(Exception):
+    pass
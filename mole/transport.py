@@ -0,0 +1,310 @@
+import abc
+import functools
+import threading
+from contextlib import contextmanager
+
+import socketio
+from socketio.asyncio_pubsub_manager import AsyncPubSubManager
+
+from .serializers import JSON, MSGPACK, encode_msgpack_packet
+
+
+class Transport(abc.ABC):
+    """
+    Sends game messages to clients. Offers the part of the socketio.Server interface the game uses.
+
+    Messages emitted inside a batch are queued and sent in emit order when the outermost batch ends, even if the
+    batch ends with an exception. Outside of a batch messages are sent immediately.
+    Room changes and disconnects send the queued messages first, so no message overtakes them.
+    Batches are per thread, so socket handlers and timer callbacks do not flush each other's messages.
+    """
+    def __init__(self):
+        self._local = threading.local()
+        self.num_batches = 0
+        self.num_messages = 0
+
+    def _queue(self):
+        queue = getattr(self._local, 'queue', None)
+        if queue is None:
+            queue = self._local.queue = []
+            self._local.depth = 0
+        return queue
+
+    @contextmanager
+    def batch(self):
+        self._queue()
+        self._local.depth += 1
+        try:
+            yield self
+        finally:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                self.flush()
+
+    def batched(self, func):
+        """
+        Decorator that runs func inside a batch.
+        """
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.batch():
+                return func(*args, **kwargs)
+        return wrapper
+
+    def emit(self, event, data=None, room=None, skip_sid=None):
+        """
+        Sends event to a sid or room.
+
+        :param skip_sid: A sid or a list of sids in room that should not get the message
+        """
+        self.num_messages += 1
+        queue = self._queue()
+        if self._local.depth > 0:
+            queue.append((event, data, room, skip_sid))
+        else:
+            self._send(event, data, room, skip_sid)
+
+    def flush(self):
+        queue = self._queue()
+        if not queue:
+            return
+        self._local.queue = []
+        self.num_batches += 1
+        self._send_batch(queue)
+
+    def _send_batch(self, messages):
+        for event, data, room, skip_sid in messages:
+            self._send(event, data, room, skip_sid)
+
+    @abc.abstractmethod
+    def _send(self, event, data, room, skip_sid):
+        """
+        Sends one message right away.
+        """
+
+    def enter_room(self, sid, room):
+        self.flush()
+        self._enter_room(sid, room)
+
+    def leave_room(self, sid, room):
+        self.flush()
+        self._leave_room(sid, room)
+
+    def disconnect(self, sid):
+        self.flush()
+        self._disconnect(sid)
+
+    def _enter_room(self, sid, room):
+        pass
+
+    def _leave_room(self, sid, room):
+        pass
+
+    def _disconnect(self, sid):
+        pass
+
+
+class SocketIOTransport(Transport):
+    """
+    Sends messages through a socketio.Server.
+
+    A message to a room is encoded once and the encoded frame is sent to every participant, instead of encoding it
+    again for each of them. Within a batch, a payload that is emitted several times with the same event is encoded
+    only once as well. With a message queue (a PubSubManager), messages go through sio.emit instead.
+
+    Clients that negotiated MessagePack (see mole.serializers) get binary frames, all others get json text frames.
+    Messages sent through sio.emit are MessagePack encoded for those clients as well, if sio is a SerializingServer.
+    """
+    def __init__(self, sio, namespace='/'):
+        """
+        :type sio: socketio.Server
+        """
+        super().__init__()
+        self.sio = sio
+        self.namespace = namespace
+        # a serializers.SerializingServer shares the set, so the packets it sends itself use the same serializer
+        self._msgpack_sids = getattr(sio, 'msgpack_sids', set())
+        self.num_encodes = 0
+        self.num_encodes_saved = 0
+
+    def set_serializer(self, sid, serializer):
+        """
+        :param serializer: serializers.JSON or serializers.MSGPACK
+        """
+        if serializer == MSGPACK:
+            self._msgpack_sids.add(sid)
+        else:
+            self._msgpack_sids.discard(sid)
+
+    def client_disconnected(self, sid):
+        self._msgpack_sids.discard(sid)
+
+    def _sends_frames(self):
+        return not isinstance(self.sio.manager, (socketio.PubSubManager, AsyncPubSubManager))
+
+    def _encode(self, event, data, serializer):
+        if isinstance(data, tuple):
+            args = list(data)
+        elif data is not None:
+            args = [data]
+        else:
+            args = []
+        self.num_encodes += 1
+        if serializer == MSGPACK:
+            return encode_msgpack_packet(socketio.packet.EVENT, self.namespace, [event] + args)
+        return socketio.packet.Packet(socketio.packet.EVENT, namespace=self.namespace, data=[event] + args).encode()
+
+    def _recipients(self, room, skip_sid):
+        manager = self.sio.manager
+        if room not in manager.rooms.get(self.namespace, {}):
+            return []
+        skip_sids = skip_sid if isinstance(skip_sid, list) else [skip_sid]
+        return [sid for sid in manager.get_participants(self.namespace, room) if sid not in skip_sids]
+
+    def _emit(self, event, data, room, skip_sid):
+        if data is None:
+            self.sio.emit(event, room=room, skip_sid=skip_sid, namespace=self.namespace)
+        else:
+            self.sio.emit(event, data, room=room, skip_sid=skip_sid, namespace=self.namespace)
+
+    def _send(self, event, data, room, skip_sid):
+        self._send_batch([(event, data, room, skip_sid)])
+
+    def _send_batch(self, messages):
+        if not self._sends_frames():
+            for event, data, room, skip_sid in messages:
+                self._emit(event, data, room, skip_sid)
+            return
+
+        # the payloads are kept alive by `messages`, so their ids are unique during the batch
+        frames = {}  # maps (event, id(data), serializer) to encoded frames
+        for event, data, room, skip_sid in messages:
+            if room is None:
+                self._emit(event, data, room, skip_sid)
+                continue
+
+            for sid in self._recipients(room, skip_sid):
+                serializer = MSGPACK if sid in self._msgpack_sids else JSON
+                key = (event, id(data), serializer)
+                frame = frames.get(key)
+                if frame is None:
+                    frame = frames[key] = self._encode(event, data, serializer)
+                else:
+                    self.num_encodes_saved += 1
+
+                if isinstance(frame, list):
+                    # json payloads with binary data are sent as several packets, leave them to socketio
+                    self._emit(event, data, sid, None)
+                else:
+                    self._deliver(sid, frame, serializer == MSGPACK)
+
+    def _deliver(self, sid, frame, binary):
+        self.sio.eio.send(sid, frame, binary=binary)
+
+    def stats(self):
+        return {
+            'messages': self.num_messages,
+            'batches': self.num_batches,
+            'encodes': self.num_encodes,
+            'encodes_saved': self.num_encodes_saved,
+        }
+
+    def _enter_room(self, sid, room):
+        self.sio.enter_room(sid, room)
+
+    def _leave_room(self, sid, room):
+        self.sio.leave_room(sid, room)
+
+    def _disconnect(self, sid):
+        self.sio.disconnect(sid=sid)
+
+
+class AsyncSocketIOTransport(SocketIOTransport):
+    """
+    Sends messages through a socketio.AsyncServer.
+
+    The game engine is synchronous, so sending and disconnecting are queued when a batch is flushed and done by
+    `await drain()`, which every async handler and timer callback awaits after calling the engine.
+    """
+    def __init__(self, sio, namespace='/'):
+        """
+        :type sio: socketio.AsyncServer
+        """
+        super().__init__(sio, namespace)
+        self._pending = []  # list of coroutine functions without arguments
+
+    def _emit(self, event, data, room, skip_sid):
+        self._pending.append(
+            functools.partial(self.sio.emit, event, data, room=room, skip_sid=skip_sid, namespace=self.namespace)
+        )
+
+    def _deliver(self, sid, frame, binary):
+        self._pending.append(functools.partial(self.sio.eio.send, sid, frame, binary=binary))
+
+    def _disconnect(self, sid):
+        self._pending.append(functools.partial(self.sio.disconnect, sid))
+
+    async def drain(self):
+        """
+        Sends everything that was flushed so far, in order.
+        """
+        self.flush()
+        while self._pending:
+            pending, self._pending = self._pending, []
+            for coroutine_function in pending:
+                await coroutine_function()
+
+
+class NullTransport(Transport):
+    """
+    Drops all messages. Only counts them.
+    """
+    def _send(self, event, data, room, skip_sid):
+        pass
+
+
+class InMemoryTransport(Transport):
+    """
+    Keeps all sent messages and room memberships, e.g. for tests and benchmarks.
+    """
+    def __init__(self):
+        super().__init__()
+        self.sent = []  # list of (event, data, room, skip_sid)
+        self.rooms = {}  # maps rooms to sets of sids
+        self.disconnected = []
+
+    def _send(self, event, data, room, skip_sid):
+        self.sent.append((event, data, room, skip_sid))
+
+    def _enter_room(self, sid, room):
+        self.rooms.setdefault(room, set()).add(sid)
+
+    def _leave_room(self, sid, room):
+        self.rooms.get(room, set()).discard(sid)
+
+    def _disconnect(self, sid):
+        self.disconnected.append(sid)
+        for sids in self.rooms.values():
+            sids.discard(sid)
+
+    def received(self, sid):
+        """
+        :return: The (event, data) pairs that were sent to sid, directly or via a room
+        """
+        received = []
+        for event, data, room, skip_sid in self.sent:
+            skipped = skip_sid if isinstance(skip_sid, list) else [skip_sid]
+            if sid in skipped:
+                continue
+            if room == sid or sid in self.rooms.get(room, ()):
+                received.append((event, data))
+        return received
+
+
+def as_transport(sio) -> Transport:
+    """
+    :return: sio, if it is a transport already, else a SocketIOTransport for it
+    """
+    if isinstance(sio, Transport):
+        return sio
+    return SocketIOTransport(sio)
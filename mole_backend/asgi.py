@@ -0,0 +1,26 @@
+"""
+ASGI config for mole_backend project.
+
+It exposes the ASGI callable as a module-level variable named ``application``. It serves the same game as
+mole_backend.wsgi with an asyncio socket.io server, e.g. `uvicorn mole_backend.asgi:application`.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
+"""
+
+import os
+import socketio
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mole_backend.settings")
+django_app = get_asgi_application()
+
+from mole.async_views import asio, keep_alive, restore_games
+
+application = socketio.ASGIApp(asio, django_app)
+keep_alive.start()
+restore_games()
+
+from mole.db_init import *
+db_init()
@@ -88,6 +88,38 @@ DATABASES = {
 
 DISABLE_SERVER_SIDE_CURSORS = True
 
+# Connections shared by the game engine (see mole.db_pool)
+GAME_DB_POOL_SIZE = int(os.environ.get('GAME_DB_POOL_SIZE', 2))
+GAME_DB_POOL_TIMEOUT = float(os.environ.get('GAME_DB_POOL_TIMEOUT', 10.0))
+
+# Game tokens are taken from [GAME_TOKEN_RANGE_START, GAME_TOKEN_RANGE_END) (see mole.tokens)
+GAME_TOKEN_RANGE_START = int(os.environ.get('GAME_TOKEN_RANGE_START', 1000))
+GAME_TOKEN_RANGE_END = int(os.environ.get('GAME_TOKEN_RANGE_END', 10000))
+
+# Keep alive requests while games are running (see mole.keep_alive). Disabled, if KEEP_ALIVE_URL is not set.
+KEEP_ALIVE_URL = os.environ.get('KEEP_ALIVE_URL')
+KEEP_ALIVE_INTERVAL = float(os.environ.get('KEEP_ALIVE_INTERVAL', 300.0))
+
+# json module for socket.io text frames: 'orjson' (falls back to 'json', if orjson is not installed) or 'json'.
+# Clients can negotiate MessagePack frames, if the msgpack package is installed (see mole.serializers).
+WIRE_JSON_SERIALIZER = os.environ.get('WIRE_JSON_SERIALIZER', 'orjson')
+
+# Sharded deployment (see mole.sharding): this process is worker SHARD_INDEX of SHARD_COUNT workers.
+# socket.io messages cross workers through SOCKETIO_MESSAGE_QUEUE (e.g. redis://...). SHARD_URLS are the
+# comma separated public urls of all workers, ordered by index. Clients are sent there to join a game.
+SHARD_INDEX = int(os.environ.get('SHARD_INDEX', 0))
+SHARD_COUNT = int(os.environ.get('SHARD_COUNT', 1))
+SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+SHARD_URLS = [url for url in os.environ.get('SHARD_URLS', '').split(',') if url]
+
+# Directory for snapshots of running games (see mole.snapshot). They are written after every turn and restored on
+# startup. Empty disables snapshots.
+GAME_SNAPSHOT_DIR = os.environ.get('GAME_SNAPSHOT_DIR', '')
+
+# Directory for the event journals of games (see mole.journal). Replay one with `python manage.py replay <file>`.
+# Empty disables journals.
+GAME_JOURNAL_DIR = os.environ.get('GAME_JOURNAL_DIR', '')
+
 # Password validation
 # https://docs.djangoproject.com/en/2.0/ref/settings/#auth-password-validators
 
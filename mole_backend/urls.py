@@ -16,5 +16,6 @@ admin.autodiscover()
 
 urlpatterns = [
     path("", mole.views.index, name="index"),
+    path("maps/<str:map_id>.json", mole.views.map_json, name="map_json"),
     path("admin/", admin.site.urls),
 ]
@@ -15,9 +15,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mole_backend.settings")
 django_app = get_wsgi_application()
 
-from mole.views import sio
+from mole.views import sio, keep_alive, restore_games
 
 application = socketio.WSGIApp(sio, django_app)
+keep_alive.start()
+restore_games()
 
 from mole.db_init import *
 db_init()